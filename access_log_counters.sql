@@ -0,0 +1,30 @@
+-- ===================================================================
+-- Table: access_log_minute_counters
+-- Purpose: Per-minute request counters maintained by create_access_log()
+--          in the same transaction as the access_logs insert. The
+--          /access-logs/* analytics endpoints read only this table.
+-- ===================================================================
+
+CREATE TABLE IF NOT EXISTS `access_log_minute_counters` (
+  `bucket_minute` datetime NOT NULL COMMENT 'created_at truncated to the minute',
+  `endpoint` varchar(255) NOT NULL,
+  `method` varchar(10) NOT NULL,
+  `status_code` int(11) NOT NULL,
+  `wan_ip` varchar(50) NOT NULL,
+  `hits` int(10) unsigned NOT NULL DEFAULT 0,
+  PRIMARY KEY (`bucket_minute`, `endpoint`, `method`, `status_code`, `wan_ip`),
+  KEY `idx_wan_ip_minute` (`wan_ip`, `bucket_minute`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
+-- One-off backfill from existing access_logs (run once after creating the table)
+INSERT INTO `access_log_minute_counters` (bucket_minute, endpoint, method, status_code, wan_ip, hits)
+SELECT created_at - INTERVAL SECOND(created_at) SECOND, endpoint, method, status_code, wan_ip, COUNT(*)
+FROM `access_logs`
+GROUP BY created_at - INTERVAL SECOND(created_at) SECOND, endpoint, method, status_code, wan_ip
+ON DUPLICATE KEY UPDATE hits = VALUES(hits);
+
+-- ===================================================================
+-- Index Strategy for access_log_minute_counters:
+-- - PRIMARY (bucket_minute, ...): time-window range scans and the upsert target
+-- - idx_wan_ip_minute: per-client counts over a window
+-- ===================================================================
@@ -0,0 +1,21 @@
+-- ===================================================================
+-- Columns: access_logs.response_time_ms, request_payload_size,
+--          response_payload_size
+-- Purpose: Per-request latency and body sizes recorded by the log_requests
+--          middleware, read by /access-logs/latency. Run once; rows logged
+--          before it (and the /login, /register rows written by the handlers
+--          themselves) keep NULLs and are left out of the report.
+-- ===================================================================
+
+ALTER TABLE `access_logs`
+  ADD COLUMN `response_time_ms` int(10) unsigned DEFAULT NULL COMMENT 'Time to the response start, in milliseconds',
+  ADD COLUMN `request_payload_size` int(10) unsigned DEFAULT NULL COMMENT 'Request Content-Length in bytes, if declared',
+  ADD COLUMN `response_payload_size` int(10) unsigned DEFAULT NULL COMMENT 'Response Content-Length in bytes, NULL for streamed responses',
+  ADD KEY `idx_created_endpoint_time` (`created_at`, `endpoint`, `response_time_ms`);
+
+-- ===================================================================
+-- Index Strategy:
+-- - idx_created_endpoint_time: the window's per-endpoint latency histogram
+--   and the slowest-request ranking are both read from this index alone;
+--   only the winning rows of the ranking are then fetched by log_id
+-- ===================================================================
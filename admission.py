@@ -0,0 +1,120 @@
+"""
+Admission control per endpoint class.
+
+Each class of endpoints (auth, point queries, aggregates) gets an
+AdmissionGate: at most ``concurrency`` requests run at once, up to ``queue``
+more wait for a slot in FIFO order for at most ``max_wait`` seconds, and
+anything beyond that is rejected straight away with Overloaded (503 +
+Retry-After in main.py). Heavy aggregates filling their own gate therefore
+cannot starve /login or /traffic/summary of threadpool threads and database
+connections, and a request never waits longer than ``max_wait`` before it
+either runs or is shed.
+
+Gates live on the worker's event loop and are taken by the ``admission(gate)``
+route dependency before authentication, validation of the query or any
+database access.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque
+
+from metrics import registry
+
+admission_requests = registry.counter("admission_requests_total",
+                                      "Requests by endpoint class and admission outcome", ["endpoint_class", "outcome"])
+admission_in_flight = registry.gauge("admission_in_flight", "Requests holding an admission slot", ["endpoint_class"])
+admission_queue_depth = registry.gauge("admission_queue_depth", "Requests waiting for an admission slot",
+                                       ["endpoint_class"])
+admission_wait = registry.histogram("admission_wait_seconds", "Time queued requests waited for a slot",
+                                    ["endpoint_class"])
+
+
+class Overloaded(Exception):
+    """The endpoint class is at its concurrency limit and its queue is full,
+    or the request waited longer than the class allows."""
+
+    def __init__(self, endpoint_class: str, retry_after: int):
+        super().__init__(f"{endpoint_class} endpoints overloaded")
+        self.endpoint_class = endpoint_class
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    def __init__(self, name: str, concurrency: int, queue: int, max_wait: float, retry_after: int = 1):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _update_gauges(self):
+        admission_in_flight.set(self._active, endpoint_class=self.name)
+        admission_queue_depth.set(len(self._waiters), endpoint_class=self.name)
+
+    async def acquire(self):
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            self._update_gauges()
+            admission_requests.inc(endpoint_class=self.name, outcome="admitted")
+            return
+
+        if len(self._waiters) >= self.queue:
+            admission_requests.inc(endpoint_class=self.name, outcome="shed")
+            raise Overloaded(self.name, self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # Gave up (or the client went away) just as a slot arrived: hand it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            admission_requests.inc(endpoint_class=self.name, outcome="timed_out")
+            raise Overloaded(self.name, self.retry_after)
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+            admission_wait.observe(time.perf_counter() - started, endpoint_class=self.name)
+        admission_requests.inc(endpoint_class=self.name, outcome="queued")
+
+    def release(self):
+        # The slot passes straight to the oldest live waiter, so _active stays put
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._active -= 1
+        self._update_gauges()
+
+    def status(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self._active,
+            "queued": len(self._waiters),
+            "queue": self.queue
+        }
+
+
+def admission(gate: AdmissionGate):
+    """Dependency holding a slot of ``gate`` for the duration of the request."""
+
+    async def dependency():
+        await gate.acquire()
+        try:
+            yield
+        finally:
+            gate.release()
+
+    return dependency
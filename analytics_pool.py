@@ -0,0 +1,178 @@
+"""
+Process pool for CPU-bound traffic analytics.
+
+Endpoints hand over NumPy column arrays; they are copied once into a single
+shared-memory block and the job function in the child process works on views
+of that block, so rows are never pickled. Arrays the job writes to are visible
+to the caller after the job completes (used for in-place baseline updates).
+
+Jobs are plain module-level functions ``func(columns, **params)`` that return a
+small picklable result. Without a started pool (scripts, batch jobs) jobs run
+inline in the calling process.
+
+NumPy is imported on first use so the API can import this module cheaply.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from metrics import registry
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", "16"))
+ANALYTICS_JOB_TIMEOUT = float(os.getenv("ANALYTICS_JOB_TIMEOUT", "30"))
+
+analytics_jobs = registry.counter("analytics_jobs_total", "Analytics pool jobs by outcome", ["job", "outcome"])
+analytics_pending = registry.gauge("analytics_jobs_pending", "Analytics jobs queued or running")
+analytics_duration = registry.histogram("analytics_job_duration_seconds", "Analytics job wall time", ["job"])
+
+
+class AnalyticsBusy(Exception):
+    """The bounded job queue is full."""
+
+
+class AnalyticsTimeout(Exception):
+    """The job did not finish within its timeout."""
+
+
+def _pack(columns: Dict[str, "np.ndarray"]):
+    import numpy as np
+    layout, offset = [], 0
+    for name, array in columns.items():
+        array = np.ascontiguousarray(array)
+        layout.append((name, array.dtype.str, array.shape, offset))
+        offset += (array.nbytes + 63) // 64 * 64   # keep every column 64-byte aligned
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    views = _views(shm, layout)
+    for name, array in columns.items():
+        views[name][...] = array
+    return shm, layout, views
+
+
+def _views(shm, layout) -> Dict[str, "np.ndarray"]:
+    import numpy as np
+    return {
+        name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for name, dtype, shape, offset in layout
+    }
+
+
+def _attach(name: str):
+    # The parent owns (and unlinks) the block. Pool children share its resource
+    # tracker, so on Python < 3.13 re-registering the name here is a no-op.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _run_in_child(func: Callable, shm_name: str, layout, params: dict):
+    shm = _attach(shm_name)
+    try:
+        columns = _views(shm, layout)
+        result = func(columns, **params)
+        del columns
+        return result
+    finally:
+        shm.close()
+
+
+class AnalyticsPool:
+    def __init__(self, workers: int = ANALYTICS_WORKERS, max_pending: int = ANALYTICS_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is None and self.workers > 0:
+            # Not "fork": the API worker is multi-threaded by the time the pool starts
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def run(self, func: Callable, columns: Dict[str, "np.ndarray"], timeout: float = ANALYTICS_JOB_TIMEOUT,
+            writeback=(), **params):
+        """Run ``func(columns, **params)`` in the pool and return its result.
+
+        Column names listed in ``writeback`` are copied back into the caller's
+        arrays afterwards. Raises AnalyticsBusy when the queue is full and
+        AnalyticsTimeout when the job overruns ``timeout`` seconds.
+        """
+        job = func.__name__
+        if not self.running:
+            started = time.perf_counter()
+            result = func(columns, **params)
+            analytics_duration.observe(time.perf_counter() - started, job=job)
+            analytics_jobs.inc(job=job, outcome="inline")
+            return result
+
+        if not self._slots.acquire(blocking=False):
+            analytics_jobs.inc(job=job, outcome="rejected")
+            raise AnalyticsBusy(f"analytics queue full ({self.max_pending} jobs)")
+
+        self._track(+1)
+        started = time.perf_counter()
+        try:
+            shm, layout, views = _pack(columns)
+        except Exception:
+            self._track(-1)
+            self._slots.release()
+            raise
+        future = None
+        try:
+            future = self._executor.submit(_run_in_child, func, shm.name, layout, params)
+            result = future.result(timeout=timeout)
+            for name in writeback:
+                columns[name][...] = views[name]
+            analytics_jobs.inc(job=job, outcome="ok")
+            return result
+        except FutureTimeoutError:
+            future.cancel()
+            analytics_jobs.inc(job=job, outcome="timeout")
+            raise AnalyticsTimeout(f"{job} exceeded {timeout}s")
+        except Exception:
+            analytics_jobs.inc(job=job, outcome="error")
+            raise
+        finally:
+            analytics_duration.observe(time.perf_counter() - started, job=job)
+            del views
+            if future is not None and not future.done():
+                # Still running in a child after a timeout: keep its queue slot
+                # and shared block until it actually finishes.
+                future.add_done_callback(lambda _: self._release(shm))
+            else:
+                self._release(shm)
+
+    def _track(self, delta: int):
+        with self._lock:
+            self._pending += delta
+            analytics_pending.set(self._pending)
+
+    def _release(self, shm):
+        shm.close()
+        shm.unlink()
+        self._track(-1)
+        self._slots.release()
+
+
+analytics_pool = AnalyticsPool()
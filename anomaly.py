@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Hour-of-week anomaly detection over traffic_hourly_copy.
+
+Every WAN IP keeps running count / sum / sum-of-squares per (hour-of-week, metric)
+slot. Each run loads only hours newer than the link's watermark, one query per
+group of links sharing a watermark, scores them against the baseline built from
+earlier weeks and folds them in. State is kept in ANOMALY_STATE_PATH so the
+batch job and the API share incremental baselines; each update runs under a
+lock on the file and starts from the state on disk, so concurrent writers (API
+workers, the batch job) add to each other's work.
+
+In the API a background thread updates every tracked link each
+ANOMALY_REFRESH_SECONDS, on a private copy that replaces the served one when
+done; requests only read flags and queue links seen for the first time.
+
+Batch job:
+    python anomaly.py --location BANGALORE
+    python anomaly.py --wan-ip 10.249.12.86 --wan-ip 10.249.12.87
+"""
+
+import argparse
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from analytics_pool import analytics_pool
+from database import get_traffic_series, get_wan_ips_by_location
+from timeutil import epoch_hour, from_epoch_hour
+
+ANOMALY_STATE_PATH = os.getenv("ANOMALY_STATE_PATH", "anomaly_baselines.npz")
+ANOMALY_REFRESH_SECONDS = float(os.getenv("ANOMALY_REFRESH_SECONDS", "60"))
+METRICS = ("in_avg", "out_avg")
+HOURS_PER_WEEK = 168
+BASELINE_WEEKS = 8            # history loaded the first time a link is seen
+MIN_SAMPLES = 4               # weeks of history needed before a slot can flag
+Z_THRESHOLD = 3.0             # default |z| reported
+MIN_Z_THRESHOLD = 2.0         # |z| at which hours are stored; lowest threshold a request may ask for
+MIN_STD_FRACTION = 0.05       # std floor relative to the mean, avoids flat-line noise
+FLAG_RETENTION_HOURS = 30 * 24
+
+_EPOCH_WEEKDAY_OFFSET = 72    # 1970-01-01 was a Thursday; slot 0 is Monday 00:00
+
+
+def hour_of_week(hours: np.ndarray) -> np.ndarray:
+    return (hours + _EPOCH_WEEKDAY_OFFSET) % HOURS_PER_WEEK
+
+
+def score_against_baseline(values, count, total, total_sq, min_samples=MIN_SAMPLES):
+    """Vectorized z-scores of ``values`` against running slot statistics.
+
+    All arguments are (n, metrics) arrays gathered for the same slots.
+    Returns (mean, std, z) with z = NaN where the slot has too little history.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        var = np.maximum(total_sq / count - mean * mean, 0.0)
+        std = np.maximum(np.sqrt(var), np.abs(mean) * MIN_STD_FRACTION)
+        z = (values - mean) / std
+    z[(count < min_samples) | (std == 0) | np.isnan(values)] = np.nan
+    return mean, std, z
+
+
+FLAG_DTYPE = np.dtype([
+    ("row", np.int64), ("hour", np.int64), ("metric", np.int8),
+    ("value", np.float64), ("expected", np.float64), ("std", np.float64), ("score", np.float64)
+])
+
+
+def process_chunks(columns) -> np.ndarray:
+    """Score and fold in new hours, week-sized chunk by chunk.
+
+    Each slot occurs once per link per chunk, so scoring a chunk against the
+    baseline of earlier chunks is exact and fully vectorized. ``count``,
+    ``total`` and ``total_sq`` (links x 168 x metrics) are updated in place.
+    Runs in the analytics process pool.
+    """
+    row, hours, values = columns["row"], columns["hours"], columns["values"]
+    n_metrics = values.shape[1]
+    count = columns["count"].reshape(-1, n_metrics)
+    total = columns["total"].reshape(-1, n_metrics)
+    total_sq = columns["total_sq"].reshape(-1, n_metrics)
+    slot = row * HOURS_PER_WEEK + hour_of_week(hours)
+    chunk = (hours - hours.min()) // HOURS_PER_WEEK
+    flagged = []
+
+    for chunk_id in np.unique(chunk):
+        sel = chunk == chunk_id
+        s, x = slot[sel], values[sel]
+        mean, std, z = score_against_baseline(x, count[s], total[s], total_sq[s])
+
+        hit_i, hit_m = np.nonzero(np.abs(np.nan_to_num(z)) >= MIN_Z_THRESHOLD)
+        if len(hit_i):
+            out = np.zeros(len(hit_i), dtype=FLAG_DTYPE)
+            out["row"] = row[sel][hit_i]
+            out["hour"] = hours[sel][hit_i]
+            out["metric"] = hit_m
+            out["value"] = x[hit_i, hit_m]
+            out["expected"] = mean[hit_i, hit_m]
+            out["std"] = std[hit_i, hit_m]
+            out["score"] = z[hit_i, hit_m]
+            flagged.append(out)
+
+        valid = ~np.isnan(x)
+        x0 = np.where(valid, x, 0.0)
+        size = count.shape[0]
+        for m in range(n_metrics):
+            count[:, m] += np.bincount(s, weights=valid[:, m], minlength=size)
+            total[:, m] += np.bincount(s, weights=x0[:, m], minlength=size)
+            total_sq[:, m] += np.bincount(s, weights=x0[:, m] ** 2, minlength=size)
+
+    return np.concatenate(flagged) if flagged else np.zeros(0, dtype=FLAG_DTYPE)
+
+
+class BaselineStore:
+    """Per-link hour-of-week running statistics plus recently flagged hours."""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.count = np.zeros((0, HOURS_PER_WEEK, len(METRICS)))
+        self.total = np.zeros_like(self.count)
+        self.total_sq = np.zeros_like(self.count)
+        self.last_hour = np.zeros(0, dtype=np.int64)
+        self.flags = np.zeros(0, dtype=FLAG_DTYPE)
+
+    def rows_for(self, wan_ips: List[str]) -> np.ndarray:
+        new = [ip for ip in dict.fromkeys(wan_ips) if ip not in self.index]
+        if new:
+            for ip in new:
+                self.index[ip] = len(self.index)
+            grow = ((0, len(new)), (0, 0), (0, 0))
+            self.count = np.pad(self.count, grow)
+            self.total = np.pad(self.total, grow)
+            self.total_sq = np.pad(self.total_sq, grow)
+            self.last_hour = np.concatenate([self.last_hour, np.full(len(new), -1, dtype=np.int64)])
+        return np.array([self.index[ip] for ip in wan_ips], dtype=np.int64)
+
+    def copy(self) -> "BaselineStore":
+        store = BaselineStore()
+        store.index = dict(self.index)
+        store.count = self.count.copy()
+        store.total = self.total.copy()
+        store.total_sq = self.total_sq.copy()
+        store.last_hour = self.last_hour.copy()
+        store.flags = self.flags
+        return store
+
+    def pending(self, wan_ips: List[str]) -> List[str]:
+        """The links among ``wan_ips`` that have no baseline yet."""
+        return [ip for ip in wan_ips if ip not in self.index or self.last_hour[self.index[ip]] < 0]
+
+    def save(self, path: str = ANOMALY_STATE_PATH):
+        wan_ips = np.array(sorted(self.index, key=self.index.get))
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, wan_ips=wan_ips, count=self.count, total=self.total,
+                 total_sq=self.total_sq, last_hour=self.last_hour, flags=self.flags)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = ANOMALY_STATE_PATH) -> "BaselineStore":
+        store = cls()
+        if not os.path.exists(path):
+            return store
+        try:
+            with np.load(path) as data:
+                store.index = {str(ip): i for i, ip in enumerate(data["wan_ips"])}
+                store.count = data["count"]
+                store.total = data["total"]
+                store.total_sq = data["total_sq"]
+                store.last_hour = data["last_hour"]
+                store.flags = data["flags"]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Anomaly state {path} unreadable, starting fresh: {e}")
+            return cls()
+        return store
+
+
+def _file_stamp(path: str):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class AnomalyDetector:
+    def __init__(self, state_path: Optional[str] = ANOMALY_STATE_PATH,
+                 interval: float = ANOMALY_REFRESH_SECONDS):
+        self.state_path = state_path
+        self.interval = interval
+        self._stamp = _file_stamp(state_path) if state_path else None
+        self.store = BaselineStore.load(state_path) if state_path else BaselineStore()
+        self._lock = threading.Lock()           # guards the served store and the pending links
+        self._update_lock = threading.Lock()    # one update at a time in this process
+        self._pending: Dict[str, None] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    @contextmanager
+    def _shared_state(self):
+        """Hold the state file's lock and yield a private copy of the baselines,
+        reloaded if another process saved since this one last read or wrote
+        them. The copy replaces the served store when the block completes."""
+        if not self.state_path:
+            store = self.store.copy()
+            yield store
+            with self._lock:
+                self.store = store
+            return
+        with open(self.state_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stamp = _file_stamp(self.state_path)
+            if stamp != self._stamp:
+                store = BaselineStore.load(self.state_path)
+                self._stamp = stamp
+            else:
+                store = self.store.copy()
+            yield store
+            with self._lock:
+                self.store = store
+
+    def update(self, wan_ips: Optional[List[str]] = None, now: Optional[datetime] = None,
+               new: List[str] = ()) -> int:
+        """Score and fold in every hour newer than each link's watermark, for
+        ``wan_ips`` or, when None, every link already in the baselines plus ``new``.
+
+        Returns the number of newly flagged hours, or -1 on database error.
+        """
+        with self._update_lock, self._shared_state() as store:
+            if wan_ips is None:
+                wan_ips = list(store.index) + list(new)
+            if not wan_ips:
+                return 0
+            wan_ips = list(dict.fromkeys(wan_ips))
+            rows = store.rows_for(wan_ips)
+            now_hour = epoch_hour(now or datetime.now())
+            history_start = now_hour - BASELINE_WEEKS * HOURS_PER_WEEK
+            watermarks = np.maximum(store.last_hour[rows], history_start)
+
+            # A new or lagging link reloads its own history, not everyone's
+            series = []
+            for watermark in np.unique(watermarks):
+                group = [ip for ip, mark in zip(wan_ips, watermarks) if mark == watermark]
+                part = get_traffic_series(group, from_epoch_hour(watermark), METRICS)
+                if part is None:
+                    return -1
+                series.extend(part)
+            if not series:
+                return 0
+
+            ips, times, *columns = zip(*series)
+            row = np.array([store.index[ip] for ip in ips], dtype=np.int64)
+            hours = np.array([epoch_hour(t) for t in times], dtype=np.int64)
+            values = np.array(columns, dtype=np.float64).T  # None -> nan
+            keep = hours > np.maximum(store.last_hour[row], history_start)
+            row, hours, values = row[keep], hours[keep], values[keep]
+            if not len(row):
+                return 0
+
+            # Only the baselines of links with new hours travel to the analytics pool
+            affected = np.unique(row)
+            columns = {
+                "row": np.searchsorted(affected, row),
+                "hours": hours,
+                "values": values,
+                "count": store.count[affected],
+                "total": store.total[affected],
+                "total_sq": store.total_sq[affected]
+            }
+            flagged = analytics_pool.run(process_chunks, columns, writeback=("count", "total", "total_sq"))
+            store.count[affected] = columns["count"]
+            store.total[affected] = columns["total"]
+            store.total_sq[affected] = columns["total_sq"]
+            flagged["row"] = affected[flagged["row"]]
+
+            np.maximum.at(store.last_hour, row, hours)
+            retention_start = now_hour - FLAG_RETENTION_HOURS
+            store.flags = np.concatenate([store.flags[store.flags["hour"] >= retention_start], flagged])
+            if self.state_path:
+                store.save(self.state_path)
+                self._stamp = _file_stamp(self.state_path)
+            return len(flagged)
+
+    def track(self, wan_ips: List[str]) -> int:
+        """Queue links seen for the first time for the background refresh and
+        return how many of ``wan_ips`` have no baseline yet; never touches the
+        database."""
+        with self._lock:
+            unseen = [ip for ip in dict.fromkeys(wan_ips) if ip not in self.store.index and ip not in self._pending]
+            self._pending.update(dict.fromkeys(unseen))
+            pending = len(self.store.pending(list(dict.fromkeys(wan_ips))))
+        if unseen:
+            self._wake.set()
+        return pending
+
+    def refresh(self) -> int:
+        """Update every link in the baselines plus the queued new ones."""
+        with self._lock:
+            new, self._pending = list(self._pending), {}
+        flagged = self.update(new=new)
+        if flagged < 0:
+            with self._lock:
+                self._pending.update(dict.fromkeys(new))
+        return flagged
+
+    # -- background refresher --------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="anomaly-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Anomaly refresh error:", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def anomalies(self, wan_ips: List[str], from_time=None, to_time=None, threshold: float = Z_THRESHOLD) -> List[dict]:
+        """Stored flags with |z| >= ``threshold``, which may not be below MIN_Z_THRESHOLD
+        (weaker deviations are never stored)."""
+        if threshold < MIN_Z_THRESHOLD:
+            raise ValueError(f"threshold must be at least {MIN_Z_THRESHOLD}")
+        with self._lock:
+            store = self.store
+            rows = np.array([store.index[ip] for ip in wan_ips if ip in store.index], dtype=np.int64)
+            flags = store.flags[np.isin(store.flags["row"], rows) & (np.abs(store.flags["score"]) >= threshold)]
+            if from_time is not None:
+                flags = flags[flags["hour"] >= epoch_hour(from_time)]
+            if to_time is not None:
+                flags = flags[flags["hour"] <= epoch_hour(to_time)]
+            names = sorted(store.index, key=store.index.get)
+
+        flags = np.sort(flags, order=["hour", "row", "metric"])
+        return [
+            {
+                "wan_ip": names[f["row"]],
+                "time_hour": from_epoch_hour(f["hour"]),
+                "metric": METRICS[f["metric"]],
+                "value": round(float(f["value"]), 2),
+                "expected": round(float(f["expected"]), 2),
+                "std": round(float(f["std"]), 2),
+                "score": round(float(f["score"]), 2),
+                "direction": "spike" if f["score"] > 0 else "drop"
+            }
+            for f in flags
+        ]
+
+
+detector = AnomalyDetector()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update traffic anomaly baselines")
+    parser.add_argument("--location", action="append", default=[])
+    parser.add_argument("--wan-ip", action="append", default=[])
+    args = parser.parse_args()
+
+    wan_ips = list(args.wan_ip)
+    for location in args.location:
+        wan_ips.extend(get_wan_ips_by_location(location) or [])
+
+    if not wan_ips:
+        parser.error("no WAN IPs selected (use --location or --wan-ip)")
+
+    new_flags = detector.update(wan_ips)
+    print(f"Processed {len(wan_ips)} links, {new_flags} new anomalies")
+    for item in detector.anomalies(wan_ips, from_time=datetime.now() - timedelta(days=1)):
+        print(f"  {item['time_hour']}  {item['wan_ip']:<16} {item['metric']:<8} "
+              f"{item['direction']:<6} value={item['value']} expected={item['expected']} z={item['score']}")
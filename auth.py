@@ -1,20 +1,42 @@
 from datetime import datetime, timedelta, timezone
-from jose import jwt, JWTError
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
+import threading
 import uuid
 
 SECRET_KEY = "mysecretkey"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# jose and passlib are imported on first use (or by warm_up() in the background)
+# so importing this module stays cheap for freshly started workers.
+_pwd_context = None
+_pwd_context_lock = threading.Lock()
+
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        with _pwd_context_lock:
+            if _pwd_context is None:
+                from passlib.context import CryptContext
+                _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def warm_up():
+    """Load the JWT library and run bcrypt backend detection ahead of the first login."""
+    from jose import jwt  # noqa: F401
+    try:
+        get_pwd_context().hash("warm-up")
+    except Exception as e:
+        print("Password hashing warm-up failed:", e)
+
 
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def verify_password(plain_password, hashed_password):
@@ -22,12 +44,13 @@ def verify_password(plain_password, hashed_password):
     if plain_password == hashed_password:
         return True
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return get_pwd_context().verify(plain_password, hashed_password)
     except Exception:
         return False
 
 
 def create_access_token(data: dict):
+    from jose import jwt
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -41,6 +64,7 @@ def generate_session_id(user_id: int) -> str:
 
 
 def decode_access_token(token: str) -> dict:
+    from jose import jwt, JWTError
     try:
         return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Text protocol versus cached server-side prepared statements for the hot queries.
+
+Runs the real database.py functions on a single pooled connection, once with
+DB_PREPARED_STATEMENTS=0 and once with DB_PREPARED_STATEMENTS=1 (each in its own
+process, since the setting is read at import), and prints per-call latency.
+
+    python bench_prepared.py --username admin --wan-ip 10.249.12.86 \\
+        --from "2026-01-01 00:00:00" --to "2026-01-07 23:59:59" --iterations 2000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def child(args):
+    import database
+
+    database.init_pools(pool_size=1)
+    wan_ips = database.get_wan_ips_by_location(args.location) if args.location else None
+    cases = {
+        "auth: get_user_by_username": lambda: database.get_user_by_username(args.username),
+        "traffic: get_traffic_by_time_range": lambda: database.get_traffic_by_time_range(
+            args.wan_ip, args.from_time, args.to_time),
+    }
+    if wan_ips:
+        cases["location: get_traffic_dashboard_by_wan_ips"] = lambda: database.get_traffic_dashboard_by_wan_ips(
+            wan_ips, args.from_time, args.to_time)
+
+    results = {}
+    for name, call in cases.items():
+        for _ in range(min(50, args.iterations)):      # warm the pool and statement cache
+            call()
+        timings = []
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            call()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        results[name] = {
+            "mean_ms": 1000 * sum(timings) / len(timings),
+            "p50_ms": 1000 * timings[len(timings) // 2],
+            "p95_ms": 1000 * timings[int(len(timings) * 0.95)]
+        }
+    database.close_pools()
+    print(json.dumps(results))
+
+
+def run(mode: str, argv) -> dict:
+    env = {**os.environ, "DB_PREPARED_STATEMENTS": "1" if mode == "prepared" else "0"}
+    output = subprocess.run([sys.executable, __file__, "--child", *argv],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare text and prepared protocol query latency")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--wan-ip", default="10.249.12.86")
+    parser.add_argument("--location", default=None)
+    parser.add_argument("--from", dest="from_time", default="2026-01-01 00:00:00")
+    parser.add_argument("--to", dest="to_time", default="2026-01-01 23:59:59")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        sys.exit(0)
+
+    text, prepared = run("text", sys.argv[1:]), run("prepared", sys.argv[1:])
+    print(f"{args.iterations} calls per query, one pooled connection")
+    print(f"{'query':<45} {'text mean':>10} {'prep mean':>10} {'text p95':>9} {'prep p95':>9} {'speed-up':>9}")
+    for name in text:
+        t, p = text[name], prepared[name]
+        print(f"{name:<45} {t['mean_ms']:>8.3f}ms {p['mean_ms']:>8.3f}ms "
+              f"{t['p95_ms']:>7.3f}ms {p['p95_ms']:>7.3f}ms {t['mean_ms'] / p['mean_ms']:>8.2f}x")
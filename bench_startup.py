@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Cold-start profile of an API worker.
+
+Prints the slowest imports of `import main` (from python -X importtime), then
+starts a single uvicorn worker several times and measures how long it takes
+until it answers `/` (serving) and until `/ready` returns 200 (pools, link
+index, bcrypt backend, analytics pool and hot cache warmed).
+
+    python bench_startup.py
+    python bench_startup.py --runs 5 --top 30
+"""
+
+import argparse
+import http.client
+import subprocess
+import sys
+import time
+
+
+def import_profile(top: int):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue                               # header line
+        name = parts[2]
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((cumulative_us, self_us, depth, name.strip()))
+
+    total = max((row[0] for row in rows if row[3] == "main"), default=0)
+    print(f"import main: {total / 1000:.1f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, depth, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {'  ' * depth}{name}")
+
+
+def wait_for(port: int, path: str, deadline: float):
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status == 200:
+                return time.perf_counter()
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return None
+
+
+def startup_run(port: int, timeout: float):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started + timeout
+        serving = wait_for(port, "/", deadline)
+        ready = wait_for(port, "/ready", deadline) if serving else None
+        return (serving - started if serving else None), (ready - started if ready else None)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile imports and measure worker start-up time")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    import_profile(args.top)
+    print()
+    for run in range(1, args.runs + 1):
+        serving, ready = startup_run(args.port, args.timeout)
+        fmt = lambda value: f"{value:.2f}s" if value is not None else "timed out"
+        print(f"run {run}: serving after {fmt(serving)}, ready after {fmt(ready)}")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Throughput of the API as the number of worker processes grows.
+
+Starts `serve.py --workers N` for each N, drives it with keep-alive clients
+for a fixed duration and prints requests/second.
+
+    python bench_workers.py --workers 1 2 4 --path /
+    python bench_workers.py --workers 1 2 4 --token <jwt> --method POST \\
+        --path /traffic/summary --body '{"wan_ip": "10.249.12.86", "from_time": "2026-01-01 00:00:00", "to_time": "2026-01-01 23:59:59"}'
+"""
+
+import argparse
+import http.client
+import subprocess
+import sys
+import threading
+import time
+
+
+def wait_until_up(port: int, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def client_loop(port, method, path, body, headers, stop, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    ok = errors = 0
+    while not stop.is_set():
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status < 500:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.close()
+    results.append((ok, errors))
+
+
+def run(workers, args):
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_until_up(args.port):
+            print(f"{workers} workers: server did not start")
+            return
+
+        headers = {"Content-Type": "application/json"}
+        if args.token:
+            headers["Authorization"] = f"Bearer {args.token}"
+        body = args.body.encode() if args.body else None
+
+        stop, results = threading.Event(), []
+        threads = [
+            threading.Thread(target=client_loop, args=(args.port, args.method, args.path, body, headers, stop, results))
+            for _ in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        ok = sum(r[0] for r in results)
+        errors = sum(r[1] for r in results)
+        print(f"{workers:>3} workers  {ok / args.duration:>10.1f} req/s  ({errors} errors)")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark throughput against worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--body", default=None)
+    parser.add_argument("--token", default=None)
+    args = parser.parse_args()
+
+    print(f"{args.method} {args.path}, {args.clients} clients, {args.duration}s per run")
+    for workers in args.workers:
+        run(workers, args)
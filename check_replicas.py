@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Show how read queries are routed between the primary and the read replicas.
+
+Example with two local MySQL instances (primary on 3306, replica on 3307):
+    DB_READ_REPLICAS=127.0.0.1:3307 python check_replicas.py
+"""
+
+from database import (
+    REPLICA_CONFIGS,
+    REPLICA_MAX_LAG_SECONDS,
+    CONSISTENCY_BOUNDED,
+    CONSISTENCY_STRONG,
+    get_read_connection,
+    replica_status
+)
+
+
+def describe(conn) -> str:
+    if not conn:
+        return "no connection"
+    cursor = conn.cursor()
+    cursor.execute("SELECT @@hostname, @@port, @@read_only")
+    host, port, read_only = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return f"{host}:{port} (read_only={read_only})"
+
+
+def check_replicas():
+    print("=" * 60)
+    print("READ REPLICA ROUTING CHECK")
+    print("=" * 60)
+
+    if not REPLICA_CONFIGS:
+        print("No replicas configured (set DB_READ_REPLICAS=host:port,...)")
+
+    print(f"strong  -> {describe(get_read_connection(CONSISTENCY_STRONG))}")
+    print(f"bounded -> {describe(get_read_connection(CONSISTENCY_BOUNDED))}"
+          f" (max lag {REPLICA_MAX_LAG_SECONDS}s)")
+    print(f"bounded -> {describe(get_read_connection(CONSISTENCY_BOUNDED, max_lag=0))} (max lag 0s)")
+
+    print("\nReplica state:")
+    for replica in replica_status():
+        print(f"  - {replica['host']}:{replica['port']}  lag={replica['lag_seconds']}  "
+              f"available={replica['available']}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    check_replicas()
@@ -10,6 +10,14 @@ DB_CONFIG = {
     "port": 3306
 }
 
+# access_logs columns added by migration scripts
+ACCESS_LOG_MIGRATIONS = {
+    "response_time_ms": "access_log_timing.sql",
+    "request_payload_size": "access_log_timing.sql",
+    "response_payload_size": "access_log_timing.sql",
+    "target": "prewarm.sql"
+}
+
 def check_tables():
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
@@ -36,6 +44,10 @@ def check_tables():
             print("\naccess_logs columns:")
             for col in columns:
                 print(f"  - {col[0]}: {col[1]}")
+            names = {col[0] for col in columns}
+            for column, script in ACCESS_LOG_MIGRATIONS.items():
+                if column not in names:
+                    print(f"  ✗ {column} missing (run {script}); written without it until then")
         
         if sessions_exists:
             cursor.execute("DESCRIBE sessions")
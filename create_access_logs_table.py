@@ -19,6 +19,10 @@ CREATE TABLE IF NOT EXISTS `access_logs` (
   `method` varchar(10) NOT NULL COMMENT 'HTTP method (GET, POST, etc)',
   `status_code` int(11) NOT NULL COMMENT 'HTTP status code',
   `wan_ip` varchar(50) NOT NULL COMMENT 'Client IP address',
+  `response_time_ms` int(10) unsigned DEFAULT NULL COMMENT 'Time to the response start, in milliseconds',
+  `request_payload_size` int(10) unsigned DEFAULT NULL COMMENT 'Request Content-Length in bytes, if declared',
+  `response_payload_size` int(10) unsigned DEFAULT NULL COMMENT 'Response Content-Length in bytes, NULL for streamed responses',
+  `target` varchar(255) DEFAULT NULL COMMENT 'Requested location or WAN IP, for dashboard endpoints',
   `created_at` timestamp DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`log_id`),
   KEY `idx_session_id` (`session_id`),
@@ -29,6 +33,8 @@ CREATE TABLE IF NOT EXISTS `access_logs` (
   KEY `idx_created_at` (`created_at`),
   KEY `idx_endpoint_status` (`endpoint`, `status_code`),
   KEY `idx_wan_ip_created` (`wan_ip`, `created_at`),
+  KEY `idx_created_endpoint_time` (`created_at`, `endpoint`, `response_time_ms`),
+  KEY `idx_endpoint_created_target` (`endpoint`, `created_at`, `target`),
   CONSTRAINT `fk_access_logs_session_id` FOREIGN KEY (`session_id`) 
     REFERENCES `sessions`(`session_id`) ON DELETE SET NULL,
   CONSTRAINT `fk_access_logs_user_id` FOREIGN KEY (`user_id`) 
@@ -36,6 +42,14 @@ CREATE TABLE IF NOT EXISTS `access_logs` (
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1 ROW_FORMAT=DYNAMIC;
 """
 
+# Columns added to existing tables by migration scripts
+MIGRATIONS = {
+    "response_time_ms": "access_log_timing.sql",
+    "request_payload_size": "access_log_timing.sql",
+    "response_payload_size": "access_log_timing.sql",
+    "target": "prewarm.sql"
+}
+
 def create_table():
     try:
         conn = mysql.connector.connect(**DB_CONFIG)
@@ -52,6 +66,11 @@ def create_table():
         print("\nTable structure:")
         for col in columns:
             print(f"  - {col[0]}: {col[1]}")
+
+        # CREATE TABLE IF NOT EXISTS leaves an older table as it was
+        missing = [c for c in MIGRATIONS if c not in {col[0] for col in columns}]
+        for column in missing:
+            print(f"\n✗ {column} is missing: run {MIGRATIONS[column]}")
         
         cursor.close()
         conn.close()
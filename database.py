@@ -1,7 +1,18 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from typing import Optional, Tuple, List
+import os
+import random
+import re
+import threading
+import time
 import uuid
+import weakref
+
+from metrics import registry
 
 DB_CONFIG = {
     "host": "127.0.0.1",
@@ -11,31 +22,427 @@ DB_CONFIG = {
     "port": 3306  # change to 3306 if your MySQL runs on default port
 }
 
+
+def _parse_replica_hosts(value: str) -> List[dict]:
+    replicas = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(":")
+        replicas.append({
+            **DB_CONFIG,
+            "host": host,
+            "port": int(port) if port else DB_CONFIG["port"],
+            "connection_timeout": 2
+        })
+    return replicas
+
+
+# Read replicas used for analytics queries, as "host:port,host:port".
+# Sessions, users and access logs always go to DB_CONFIG (the primary).
+REPLICA_CONFIGS = _parse_replica_hosts(os.getenv("DB_READ_REPLICAS", ""))
+REPLICA_MAX_LAG_SECONDS = int(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+REPLICA_LAG_CHECK_INTERVAL = 5    # seconds a measured lag is trusted
+REPLICA_RETRY_AFTER = 15          # seconds an unreachable replica is skipped
+
+# Consistency hints for read queries
+CONSISTENCY_STRONG = "strong"     # primary only
+CONSISTENCY_BOUNDED = "bounded"   # replica lagging <= max_lag seconds, else primary
+
+# Optional shared-memory view of recent hourly traffic (hotcache.HotTrafficCache),
+# installed per worker by main.lifespan. Point queries it fully covers skip MySQL.
+_hot_cache = None
+
+_replica_state = {}   # index -> {"lag": float|None, "checked_at": float, "down_until": float}
+_replica_lock = threading.Lock()
+
+
+# Connection pools, created per worker by init_pools() (see main.lifespan).
+# Without them every call opens a fresh connection, as scripts and tests do.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+_pools = {}   # (host, port) -> MySQLConnectionPool
+
+# Server-side prepared statements for fixed-text queries (see _execute). Pooled
+# connections then keep their session when returned, since a session reset
+# (COM_RESET_CONNECTION) would deallocate the statements. The only session state
+# this module relies on is the transaction: one left open by the previous
+# borrower is rolled back on checkout. Everything else carries over between
+# borrowers: session and user variables, temporary tables and named locks. No
+# code here sets them; code that does must undo them before closing, or run
+# with DB_PREPARED_STATEMENTS=0, which restores the pool's session reset.
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1") == "1"
+PREPARED_CACHE_SIZE = 64   # statements kept per connection
+_statement_caches = weakref.WeakKeyDictionary()   # raw connection -> _StatementCache
+_cached_cursors = weakref.WeakSet()
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+prepared_statements = registry.counter("db_prepared_statements_total",
+                                       "Prepared statement executions by outcome", ["outcome"])
+
+# Per-request query deadlines (see deadlines.py). The guard of the request being
+# served travels in a context variable into the threadpool thread running it.
+ER_QUERY_INTERRUPTED = 1317   # KILL QUERY
+ER_QUERY_TIMEOUT = 3024       # MAX_EXECUTION_TIME exceeded
+KILL_CONNECT_TIMEOUT = 2
+current_query_guard: ContextVar[Optional["QueryGuard"]] = ContextVar("current_query_guard", default=None)
+_SELECT = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+
+queries_cancelled = registry.counter("db_queries_cancelled_total",
+                                     "Queries stopped before completion by reason", ["endpoint", "reason"])
+
+
+def init_pools(pool_size: int = DB_POOL_SIZE):
+    for index, config in enumerate([DB_CONFIG] + REPLICA_CONFIGS):
+        key = (config["host"], config["port"])
+        if key in _pools:
+            continue
+        try:
+            _pools[key] = pooling.MySQLConnectionPool(
+                pool_name=f"pool_{index}_{os.getpid()}",
+                pool_size=pool_size,
+                pool_reset_session=not DB_PREPARED_STATEMENTS,
+                autocommit=False,
+                **config
+            )
+        except Error as e:
+            print(f"MySQL pool error ({config['host']}:{config['port']}): {e}")
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        try:
+            pool._remove_connections()
+        except Error as e:
+            print("MySQL pool close error:", e)
+    _pools.clear()
+
+
+def pool_status() -> List[dict]:
+    return [
+        {"host": host, "port": port, "size": pool.pool_size, "idle": pool._cnx_queue.qsize()}
+        for (host, port), pool in _pools.items()
+    ]
+
+
+def _connect(config: dict):
+    pool = _pools.get((config["host"], config["port"]))
+    if pool:
+        try:
+            conn = pool.get_connection()
+        except pooling.PoolError:
+            pass  # exhausted: fall back to a one-off connection
+        else:
+            if not pool.reset_session and conn.in_transaction:
+                # End a snapshot the previous borrower left open; the server status
+                # flags say so, so a committed or rolled back session costs no round trip
+                conn.rollback()
+            return conn
+    conn = mysql.connector.connect(**config)
+    conn.autocommit = False
+    return conn
+
+
+class _StatementCache:
+    """LRU of prepared cursors for one physical connection, keyed by query text."""
+
+    def __init__(self, connection_id):
+        self.connection_id = connection_id
+        self._statements = OrderedDict()   # (query, dictionary) -> (cursor, sql, param names)
+
+    def execute(self, raw, query: str, params, dictionary: bool):
+        key = (query, dictionary)
+        entry = self._statements.get(key)
+        if entry is None:
+            # Named params become positional once, so the cursor sees the same
+            # SQL object on every call and skips re-preparing it
+            entry = (raw.cursor(prepared=True, dictionary=dictionary),
+                     _NAMED_PARAM.sub("%s", query), _NAMED_PARAM.findall(query))
+            _cached_cursors.add(entry[0])
+            self._statements[key] = entry
+            prepared_statements.inc(outcome="prepared")
+            if len(self._statements) > PREPARED_CACHE_SIZE:
+                _, (evicted, _, _) = self._statements.popitem(last=False)
+                _cached_cursors.discard(evicted)
+                try:
+                    evicted.close()
+                except Error:
+                    pass
+        else:
+            self._statements.move_to_end(key)
+            prepared_statements.inc(outcome="reused")
+
+        cursor, sql, names = entry
+        if names:
+            params = tuple(params[name] for name in names)
+        try:
+            cursor.execute(sql, params)
+        except Error:
+            # A failed (e.g. killed) execution may leave the statement unusable: deallocate
+            # it now rather than when the physical connection closes
+            self._statements.pop(key, None)
+            _cached_cursors.discard(cursor)
+            try:
+                cursor.close()
+            except Error:
+                pass
+            raise
+        return cursor
+
+
+def _execute(conn, query: str, params=(), dictionary: bool = False):
+    """Execute ``query`` and return the cursor holding its result.
+
+    On pooled connections the statement is prepared once per connection and
+    re-executed with binary-protocol parameters and results; elsewhere this is
+    a plain text-protocol cursor. Release it with _close_cursor().
+    """
+    raw = getattr(conn, "_cnx", None) if DB_PREPARED_STATEMENTS else None
+    if raw is None:
+        cursor = conn.cursor(dictionary=dictionary)
+        cursor.execute(query, params)
+        return cursor
+
+    cache = _statement_caches.get(raw)
+    if cache is None or cache.connection_id != raw.connection_id:
+        # New connection, or the pool reconnected it and its statements are gone
+        cache = _statement_caches[raw] = _StatementCache(raw.connection_id)
+    return cache.execute(raw, query, params, dictionary)
+
+
+def _close_cursor(cursor):
+    # Cached prepared cursors stay open with their connection
+    if cursor is not None and cursor not in _cached_cursors:
+        cursor.close()
+
+
+class QueryTimeout(Exception):
+    """A query ran past the deadline of its endpoint and was stopped."""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"Query exceeded its {timeout:g}s deadline")
+        self.timeout = timeout
+
+
+class QueryCancelled(Exception):
+    """A query was killed because the client that asked for it disconnected."""
+
+
+class QueryGuard:
+    """Deadline of one request and the connection currently running its query,
+    so that another thread can stop the query with KILL QUERY."""
+
+    def __init__(self, timeout: float, endpoint: str = ""):
+        self.timeout = timeout
+        self.endpoint = endpoint
+        self.cancelled: Optional[str] = None   # "timeout" or "disconnect"
+        self._running = None                   # (host, port, connection_id)
+        self._lock = threading.Lock()
+
+    @property
+    def hint(self) -> str:
+        return f"/*+ MAX_EXECUTION_TIME({int(self.timeout * 1000)}) */"
+
+    def error(self) -> Exception:
+        return QueryTimeout(self.timeout) if self.cancelled == "timeout" else QueryCancelled()
+
+    @contextmanager
+    def running(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise self.error()
+            self._running = (conn.server_host, conn.server_port, conn.connection_id)
+        try:
+            yield
+        finally:
+            # Waits for an in-flight KILL, so it never hits the connection's next borrower
+            with self._lock:
+                self._running = None
+
+    def cancel(self, reason: str) -> bool:
+        """Mark the request cancelled and kill its running query, if any.
+        Returns True when a query was killed."""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.cancelled = reason
+            running = self._running
+            if running:
+                kill_query(*running)
+        queries_cancelled.inc(endpoint=self.endpoint, reason=reason)
+        return running is not None
+
+
+def kill_query(host: str, port: int, connection_id: int):
+    """KILL QUERY on a one-off connection; pooled ones may all be busy."""
+    try:
+        conn = mysql.connector.connect(**{**DB_CONFIG, "host": host, "port": port,
+                                          "connection_timeout": KILL_CONNECT_TIMEOUT})
+    except Error as e:
+        print(f"KILL QUERY {connection_id} failed ({host}:{port}): {e}")
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"KILL QUERY {int(connection_id)}")
+        cursor.close()
+    except Error as e:
+        # Unknown thread id: the query finished and its connection went away
+        print(f"KILL QUERY {connection_id} failed ({host}:{port}): {e}")
+    finally:
+        conn.close()
+
+
+def _with_deadline(query: str) -> str:
+    """Prefix the outer SELECT with the current request's MAX_EXECUTION_TIME hint.
+    The hint is fixed per endpoint, so prepared statement text stays stable."""
+    guard = current_query_guard.get()
+    if guard is None:
+        return query
+    return _SELECT.sub(f"SELECT {guard.hint}", query, count=1)
+
+
+@contextmanager
+def _deadline(conn):
+    """Scope in which ``conn`` runs a query that the request's guard may kill."""
+    guard = current_query_guard.get()
+    if guard is None:
+        yield
+        return
+    with guard.running(conn):
+        yield
+
+
+def _raise_if_cancelled(error: Error):
+    """Turn a query stopped by its deadline or by a client disconnect into
+    QueryTimeout / QueryCancelled instead of a generic database error."""
+    guard = current_query_guard.get()
+    if guard is None:
+        return
+    if error.errno == ER_QUERY_TIMEOUT:
+        guard.cancel("timeout")   # MySQL enforced the hint itself, nothing left to kill
+    if guard.cancelled:
+        raise guard.error() from error
+
+
+def set_hot_cache(cache):
+    global _hot_cache
+    _hot_cache = cache
+
+
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        conn.autocommit = False
-        return conn
+        return _connect(DB_CONFIG)
     except Error as e:
         print(f"MySQL connection error: {e}")
         return None
 
 
+def _measure_replica_lag(conn) -> Optional[float]:
+    """Seconds behind the source, 0 for a standalone server, None if replication is broken."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+        except Error:
+            cursor.execute("SHOW SLAVE STATUS")  # MariaDB / MySQL < 8.0.22
+        row = cursor.fetchone()
+        if not row:
+            return 0.0
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return float(lag) if lag is not None else None
+    finally:
+        cursor.close()
+
+
+def _replica_lag(index: int, conn) -> Optional[float]:
+    now = time.monotonic()
+    with _replica_lock:
+        state = _replica_state.get(index)
+        if state and state["lag"] is not None and now - state["checked_at"] < REPLICA_LAG_CHECK_INTERVAL:
+            return state["lag"]
+
+    try:
+        lag = _measure_replica_lag(conn)
+    except Error as e:
+        print(f"Replica lag check failed for {REPLICA_CONFIGS[index]['host']}: {e}")
+        lag = None
+
+    with _replica_lock:
+        _replica_state[index] = {"lag": lag, "checked_at": now, "down_until": 0}
+    return lag
+
+
+def get_read_connection(consistency: str = CONSISTENCY_BOUNDED, max_lag: Optional[float] = None):
+    """Connection for read-only analytics queries.
+
+    Picks a random replica whose replication lag is within ``max_lag`` seconds
+    and falls back to the primary when none qualifies.
+    """
+    if consistency == CONSISTENCY_STRONG or not REPLICA_CONFIGS:
+        return get_db_connection()
+
+    max_lag = REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+    now = time.monotonic()
+    candidates = list(range(len(REPLICA_CONFIGS)))
+    random.shuffle(candidates)
+
+    for index in candidates:
+        with _replica_lock:
+            state = _replica_state.get(index)
+        if state:
+            if state["down_until"] > now:
+                continue
+            fresh = now - state["checked_at"] < REPLICA_LAG_CHECK_INTERVAL
+            if fresh and (state["lag"] is None or state["lag"] > max_lag):
+                continue
+
+        try:
+            conn = _connect(REPLICA_CONFIGS[index])
+        except Error as e:
+            print(f"Replica connection error ({REPLICA_CONFIGS[index]['host']}): {e}")
+            with _replica_lock:
+                _replica_state[index] = {"lag": None, "checked_at": now, "down_until": now + REPLICA_RETRY_AFTER}
+            continue
+
+        lag = _replica_lag(index, conn)
+        if lag is not None and lag <= max_lag:
+            return conn
+        conn.close()
+
+    return get_db_connection()
+
+
+def replica_status() -> List[dict]:
+    """Last known state of every configured replica (for diagnostics)."""
+    now = time.monotonic()
+    with _replica_lock:
+        return [
+            {
+                "host": config["host"],
+                "port": config["port"],
+                "lag_seconds": _replica_state.get(index, {}).get("lag"),
+                "available": _replica_state.get(index, {}).get("down_until", 0) <= now
+            }
+            for index, config in enumerate(REPLICA_CONFIGS)
+        ]
+
+
 def get_user_by_username(username: str) -> Optional[dict]:
     conn = get_db_connection()
     if not conn:
         return None
 
+    cursor = None
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
-        return cursor.fetchone()
+        cursor = _execute(conn, "SELECT * FROM users WHERE username = %s", (username,), dictionary=True)
+        rows = cursor.fetchall()
+        return rows[0] if rows else None
     except Error as e:
         print(f"DB error in get_user_by_username: {e}")
         return None
     finally:
         try:
-            cursor.close()
+            _close_cursor(cursor)
             conn.close()
         except:
             pass
@@ -70,14 +477,25 @@ def user_exists_in_db(username: str) -> bool:
     return get_user_by_username(username) is not None
 
 
-def get_traffic_by_time_range(wan_ip: str, from_time: str, to_time: str) -> Tuple[List[dict], int]:
-    conn = get_db_connection()
+def get_traffic_by_time_range(
+    wan_ip: str,
+    from_time: str,
+    to_time: str,
+    consistency: str = CONSISTENCY_BOUNDED,
+    max_lag: Optional[float] = None
+) -> Tuple[List[dict], int]:
+    if _hot_cache is not None and consistency != CONSISTENCY_STRONG:
+        rows = _hot_cache.lookup(wan_ip, from_time, to_time,
+                                 REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag)
+        if rows is not None:
+            return rows, len(rows)
+
+    conn = get_read_connection(consistency, max_lag)
     if not conn:
         return None, 0
 
+    cursor = None
     try:
-        cursor = conn.cursor(dictionary=True)
-
         data_query = """
         SELECT time_hour, wan_ip, in_avg, out_avg, in_max, out_max
         FROM traffic_hourly_copy
@@ -91,64 +509,125 @@ def get_traffic_by_time_range(wan_ip: str, from_time: str, to_time: str) -> Tupl
         WHERE wan_ip = %s AND time_hour BETWEEN %s AND %s
         """
 
-        cursor.execute(data_query, (wan_ip, from_time, to_time))
-        rows = cursor.fetchall()
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(data_query), (wan_ip, from_time, to_time), dictionary=True)
+            rows = cursor.fetchall()
+            _close_cursor(cursor)
 
-        cursor.execute(count_query, (wan_ip, from_time, to_time))
-        row = cursor.fetchone()
-        count = row["total_rows"] if row else 0
+            cursor = _execute(conn, _with_deadline(count_query), (wan_ip, from_time, to_time), dictionary=True)
+            row = cursor.fetchall()
+        count = row[0]["total_rows"] if row else 0
 
         return rows, count
 
     except Error as e:
+        _raise_if_cancelled(e)
         print("DB error in get_traffic_by_time_range:", e)
         return None, 0
     finally:
         try:
-            cursor.close()
+            _close_cursor(cursor)
             conn.close()
         except:
             pass
 
 
-def get_traffic_dashboard_by_location(location: str, from_time: str, to_time: str):
-    conn = get_db_connection()
+def _in_list(values: List[str], prefix: str = "ip") -> Tuple[str, dict]:
+    """Named placeholders for ``IN (...)`` plus their parameters."""
+    params = {f"{prefix}{i}": value for i, value in enumerate(values)}
+    return ", ".join(f"%({name})s" for name in params), params
+
+
+def get_traffic_dashboard_by_wan_ips(
+    wan_ips: List[str],
+    from_time: str,
+    to_time: str,
+    consistency: str = CONSISTENCY_BOUNDED,
+    max_lag: Optional[float] = None
+):
+    """Per-WAN-IP aggregates over traffic_hourly_copy. Link attributes are added
+    by the caller from the link index (see links.py) instead of a join."""
+    if not wan_ips:
+        return []
+
+    conn = get_read_connection(consistency, max_lag)
     if not conn:
         return None
 
+    cursor = None
     try:
-        cursor = conn.cursor(dictionary=True)
+        placeholders, params = _in_list(wan_ips)
 
-        query = """
+        # The IN list length is fixed per location, so each location's text is
+        # prepared once per connection
+        query = f"""
         SELECT
-            b.node AS location,
-            t.wan_ip,
-            b.interface,
-            b.description,
-            b.bandwidth,
+            wan_ip,
             COUNT(*) AS data_points,
-            ROUND(AVG(t.in_avg), 2) AS avg_in,
-            ROUND(AVG(t.out_avg), 2) AS avg_out,
-            MAX(t.in_max) AS peak_in,
-            MAX(t.out_max) AS peak_out,
-            MIN(t.time_hour) AS first_reading,
-            MAX(t.time_hour) AS last_reading
-        FROM traffic_hourly_copy t
-        JOIN bmap_link_master b ON b.wanip = t.wan_ip
-        WHERE b.node = %s AND t.time_hour BETWEEN %s AND %s
-        GROUP BY b.node, t.wan_ip, b.interface, b.description, b.bandwidth
-        ORDER BY t.wan_ip
-        """
-
-        cursor.execute(query, (location, from_time, to_time))
-        return cursor.fetchall()
+            ROUND(AVG(in_avg), 2) AS avg_in,
+            ROUND(AVG(out_avg), 2) AS avg_out,
+            MAX(in_max) AS peak_in,
+            MAX(out_max) AS peak_out,
+            MIN(time_hour) AS first_reading,
+            MAX(time_hour) AS last_reading
+        FROM traffic_hourly_copy
+        WHERE wan_ip IN ({placeholders}) AND time_hour BETWEEN %(from_time)s AND %(to_time)s
+        GROUP BY wan_ip
+        ORDER BY wan_ip
+        """
+
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(query), {**params, "from_time": from_time, "to_time": to_time},
+                              dictionary=True)
+            return cursor.fetchall()
 
     except Error as e:
-        print("DB error in get_traffic_dashboard_by_location:", e)
+        _raise_if_cancelled(e)
+        print("DB error in get_traffic_dashboard_by_wan_ips:", e)
         return None
     finally:
         try:
-            cursor.close()
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_traffic_rows_by_wan_ips(
+    wan_ips: List[str],
+    from_time,
+    to_time,
+    consistency: str = CONSISTENCY_BOUNDED,
+    max_lag: Optional[float] = None
+) -> Optional[List[tuple]]:
+    """(wan_ip, time_hour, in_avg, out_avg, in_max, out_max) tuples of several
+    links, ordered by link and hour; tuples feed column arrays directly."""
+    if not wan_ips:
+        return []
+
+    conn = get_read_connection(consistency, max_lag)
+    if not conn:
+        return None
+
+    cursor = None
+    try:
+        placeholders, params = _in_list(wan_ips)
+        query = f"""
+        SELECT wan_ip, time_hour, in_avg, out_avg, in_max, out_max
+        FROM traffic_hourly_copy
+        WHERE wan_ip IN ({placeholders}) AND time_hour BETWEEN %(from_time)s AND %(to_time)s
+        ORDER BY wan_ip, time_hour
+        """
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(query), {**params, "from_time": from_time, "to_time": to_time})
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_traffic_rows_by_wan_ips:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
             conn.close()
         except:
             pass
@@ -160,14 +639,14 @@ def create_session(user_id: int, username: str, wan_ip: str):
         print("DB connection failed in create_session")
         return None
 
+    cursor = None
     try:
         session_id = str(uuid.uuid4())
-        cursor = conn.cursor()
         query = """
         INSERT INTO sessions (session_id, user_id, wan_ip, status)
         VALUES (%s, %s, %s, 'ACTIVE')
         """
-        cursor.execute(query, (session_id, user_id, wan_ip))
+        cursor = _execute(conn, query, (session_id, user_id, wan_ip))
         conn.commit()
         print("Session created:", session_id)
         return session_id
@@ -176,7 +655,7 @@ def create_session(user_id: int, username: str, wan_ip: str):
         return None
     finally:
         try:
-            cursor.close()
+            _close_cursor(cursor)
             conn.close()
         except:
             pass
@@ -188,19 +667,131 @@ def close_session(session_id: str):
         print("DB connection failed in close_session")
         return False
 
+    cursor = None
     try:
-        cursor = conn.cursor()
         query = """
         UPDATE sessions
         SET logout_time = NOW(), status = 'LOGGED_OUT'
         WHERE session_id = %s
         """
-        cursor.execute(query, (session_id,))
+        cursor = _execute(conn, query, (session_id,))
         conn.commit()
         return True
     except Error as e:
         print("DB error in close_session:", e)
         return False
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+
+def get_session_history_page(
+    user_id: Optional[int],
+    wan_ip: Optional[str],
+    from_time,
+    to_time,
+    after: Optional[Tuple] = None,
+    limit: int = 50
+) -> Optional[List[dict]]:
+    """Up to ``limit`` sessions, newest login first, that sort after the
+    ``(login_time, session_id)`` keyset ``after``.
+
+    The page is cut from one of the covering (filter, login_time, session_id, ...)
+    indexes in session_history.sql before anything is joined, so a page costs
+    ``limit`` index entries plus ``limit`` key lookups however deep it is.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    conditions, params = [], {"limit": limit}
+    if user_id is not None:
+        conditions.append("user_id = %(user_id)s")
+        params["user_id"] = user_id
+    if wan_ip:
+        conditions.append("wan_ip = %(wan_ip)s")
+        params["wan_ip"] = wan_ip
+    if from_time:
+        conditions.append("login_time >= %(from_time)s")
+        params["from_time"] = from_time
+    if to_time:
+        conditions.append("login_time <= %(to_time)s")
+        params["to_time"] = to_time
+    if after:
+        conditions.append("(login_time < %(after_time)s OR (login_time = %(after_time)s AND session_id < %(after_id)s))")
+        params["after_time"], params["after_id"] = after
+
+    cursor = None
+    try:
+        query = f"""
+        SELECT p.session_id, p.user_id, u.username, p.login_time, p.logout_time,
+            p.wan_ip, p.status, s.user_agent,
+            COALESCE(sm.session_duration_minutes,
+                     TIMESTAMPDIFF(MINUTE, p.login_time, p.logout_time)) AS session_duration_minutes,
+            sm.request_count, sm.error_count
+        FROM (
+            SELECT session_id, user_id, login_time, logout_time, wan_ip, status
+            FROM sessions
+            WHERE {" AND ".join(conditions) or "1 = 1"}
+            ORDER BY login_time DESC, session_id DESC
+            LIMIT %(limit)s
+        ) p
+        JOIN sessions s ON s.session_id = p.session_id
+        JOIN users u ON u.id = p.user_id
+        LEFT JOIN session_activity_summary sm ON sm.session_id = p.session_id
+        ORDER BY p.login_time DESC, p.session_id DESC
+        """
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(query), params, dictionary=True)
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_session_history_page:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_session_activities(session_ids: List[str], per_session: int = 200) -> Optional[List[dict]]:
+    """The first ``per_session`` access_logs rows of each session, in one query
+    over idx_session_created, ordered by session and time."""
+    if not session_ids:
+        return []
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        # Plain cursor: the IN list changes length with every page
+        cursor = conn.cursor(dictionary=True)
+        query = f"""
+        SELECT log_id AS activity_id, session_id, endpoint, method,
+            created_at AS timestamp, status_code
+        FROM (
+            SELECT log_id, session_id, endpoint, method, created_at, status_code,
+                ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_at, log_id) AS n
+            FROM access_logs
+            WHERE session_id IN ({", ".join(["%s"] * len(session_ids))})
+        ) a
+        WHERE n <= %s
+        ORDER BY session_id, created_at, log_id
+        """
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), (*session_ids, per_session))
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_session_activities:", e)
+        return None
     finally:
         try:
             cursor.close()
@@ -209,36 +800,1076 @@ def close_session(session_id: str):
             pass
 
 
+def get_access_logs_by_wan_ip_page(
+    wan_ip: str,
+    from_time,
+    to_time,
+    after: Optional[Tuple] = None,
+    limit: int = 100
+) -> Optional[List[dict]]:
+    """Up to ``limit`` access_logs rows of ``wan_ip``, newest first, that sort
+    after the ``(created_at, log_id)`` keyset ``after``.
+
+    idx_wan_ip_created ends in the primary key, so (wan_ip, created_at, log_id)
+    is one descending range scan that stops after ``limit`` entries.
+    """
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    conditions, params = ["wan_ip = %(wan_ip)s"], {"wan_ip": wan_ip, "limit": limit}
+    if from_time:
+        conditions.append("created_at >= %(from_time)s")
+        params["from_time"] = from_time
+    if to_time:
+        conditions.append("created_at <= %(to_time)s")
+        params["to_time"] = to_time
+    if after:
+        conditions.append("(created_at < %(after_time)s OR (created_at = %(after_time)s AND log_id < %(after_id)s))")
+        params["after_time"], params["after_id"] = after
+
+    cursor = None
+    try:
+        query = f"""
+        SELECT log_id, session_id, user_id, endpoint, method, status_code, created_at
+        FROM access_logs FORCE INDEX (idx_wan_ip_created)
+        WHERE {" AND ".join(conditions)}
+        ORDER BY created_at DESC, log_id DESC
+        LIMIT %(limit)s
+        """
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(query), params, dictionary=True)
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_access_logs_by_wan_ip_page:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_access_endpoint_counts_by_wan_ip(wan_ip: str, from_time, to_time) -> Optional[List[dict]]:
+    """Requests and errors per endpoint and method for ``wan_ip``, summed from
+    access_log_minute_counters over the minutes the window touches."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    conditions, params = ["wan_ip = %(wan_ip)s"], {"wan_ip": wan_ip}
+    if from_time:
+        conditions.append("bucket_minute >= %(from_time)s - INTERVAL SECOND(%(from_time)s) SECOND")
+        params["from_time"] = from_time
+    if to_time:
+        conditions.append("bucket_minute <= %(to_time)s")
+        params["to_time"] = to_time
+
+    cursor = None
+    try:
+        query = f"""
+        SELECT endpoint, method,
+            SUM(hits) AS requests,
+            SUM(CASE WHEN status_code >= 400 THEN hits ELSE 0 END) AS errors,
+            MIN(bucket_minute) AS first_seen,
+            MAX(bucket_minute) AS last_seen
+        FROM access_log_minute_counters
+        WHERE {" AND ".join(conditions)}
+        GROUP BY endpoint, method
+        ORDER BY requests DESC, endpoint, method
+        """
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(query), params, dictionary=True)
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_access_endpoint_counts_by_wan_ip:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+# Per-minute counters backing the /access-logs analytics (see access_log_counters.sql)
+COUNTER_UPSERT_QUERY = """
+INSERT INTO access_log_minute_counters
+(bucket_minute, endpoint, method, status_code, wan_ip, hits)
+VALUES (NOW() - INTERVAL SECOND(NOW()) SECOND, %s, %s, %s, %s, 1)
+ON DUPLICATE KEY UPDATE hits = hits + 1
+"""
+
+
+# access_logs columns added by migrations (access_log_timing.sql, prewarm.sql).
+# They are written only when the database has them, so an unmigrated database keeps
+# logging (including /login and /register) without them.
+ACCESS_LOG_COLUMNS = ("session_id", "user_id", "endpoint", "method", "status_code", "wan_ip")
+ACCESS_LOG_OPTIONAL_COLUMNS = ("response_time_ms", "request_payload_size", "response_payload_size", "target")
+ACCESS_LOG_MIGRATIONS = {
+    "response_time_ms": "access_log_timing.sql",
+    "request_payload_size": "access_log_timing.sql",
+    "response_payload_size": "access_log_timing.sql",
+    "target": "prewarm.sql"
+}
+_access_log_columns: Optional[Tuple[str, ...]] = None
+
+
+def _access_log_optional_columns(conn) -> Tuple[str, ...]:
+    """The ACCESS_LOG_OPTIONAL_COLUMNS this database has, looked up once per process."""
+    global _access_log_columns
+    if _access_log_columns is None:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'access_logs'
+            """)
+            present = {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+        for script in sorted(set(ACCESS_LOG_MIGRATIONS.values())):
+            missing = [column for column, migration in ACCESS_LOG_MIGRATIONS.items()
+                       if migration == script and column not in present]
+            if missing:
+                print("access_logs lacks", ", ".join(missing), f"- run {script} to record them")
+        _access_log_columns = tuple(c for c in ACCESS_LOG_OPTIONAL_COLUMNS if c in present)
+    return _access_log_columns
+
+
+def _access_log_insert(columns: Tuple[str, ...]) -> str:
+    return f"""
+        INSERT INTO access_logs
+        ({", ".join(columns)})
+        VALUES ({", ".join(["%s"] * len(columns))})
+        """
+
+
 def create_access_log(
     session_id: Optional[str],
     user_id: Optional[int],
     endpoint: str,
     method: str,
     status_code: int,
-    wan_ip: str
+    wan_ip: str,
+    response_time_ms: Optional[int] = None,
+    request_payload_size: Optional[int] = None,
+    response_payload_size: Optional[int] = None,
+    target: Optional[str] = None
 ):
     conn = get_db_connection()
     if not conn:
         print("DB connection failed in create_access_log")
         return False
 
+    cursor = None
     try:
-        cursor = conn.cursor()
-        query = """
-        INSERT INTO access_logs 
-        (session_id, user_id, endpoint, method, status_code, wan_ip)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (session_id, user_id, endpoint, method, status_code, wan_ip))
+        optional = _access_log_optional_columns(conn)
+        values = {"response_time_ms": response_time_ms, "request_payload_size": request_payload_size,
+                  "response_payload_size": response_payload_size, "target": target}
+        cursor = _execute(conn, _access_log_insert(ACCESS_LOG_COLUMNS + optional),
+                          (session_id, user_id, endpoint, method, status_code, wan_ip,
+                           *(values[column] for column in optional)))
+        _close_cursor(cursor)
+        cursor = _execute(conn, COUNTER_UPSERT_QUERY, (endpoint, method, status_code, wan_ip))
         conn.commit()
         print("Access log inserted:", endpoint, status_code)
         return True
     except Error as e:
         print("DB error in create_access_log:", e)
         return False
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_wan_ips_by_location(location: str) -> Optional[List[str]]:
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT wanip FROM bmap_link_master WHERE node = %s", (location,))
+        return [row[0] for row in cursor.fetchall()]
+    except Error as e:
+        print("DB error in get_wan_ips_by_location:", e)
+        return None
     finally:
         try:
             cursor.close()
             conn.close()
         except:
             pass
+
+
+def get_latest_traffic_insert_time():
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = None
+    try:
+        cursor = _execute(conn, "SELECT MAX(insert_time) FROM traffic_hourly_copy")
+        rows = cursor.fetchall()
+        return rows[0][0] if rows else None
+    except Error as e:
+        print("DB error in get_latest_traffic_insert_time:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_traffic_stream_position() -> Optional[tuple]:
+    """(insert_time, wan_ip, time_hour) of the last row in the order of
+    get_traffic_inserted_since, or None when the table is empty or on error;
+    paging from it skips every row already in the table."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = None
+    try:
+        query = """
+        SELECT insert_time, wan_ip, time_hour
+        FROM traffic_hourly_copy
+        WHERE insert_time = (SELECT MAX(insert_time) FROM traffic_hourly_copy)
+        ORDER BY wan_ip DESC, time_hour DESC
+        LIMIT 1
+        """
+        cursor = _execute(conn, query)
+        rows = cursor.fetchall()
+        return tuple(rows[0]) if rows else None
+    except Error as e:
+        print("DB error in get_traffic_stream_position:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_traffic_hours_inserted_between(after, until) -> Optional[List[tuple]]:
+    """(wan_ip, first time_hour, last time_hour) of every link with rows whose
+    insert_time is after ``after`` and at most ``until``."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = None
+    try:
+        query = """
+        SELECT wan_ip, MIN(time_hour), MAX(time_hour)
+        FROM traffic_hourly_copy
+        WHERE insert_time > %s AND insert_time <= %s
+        GROUP BY wan_ip
+        """
+        cursor = _execute(conn, query, (after, until))
+        return cursor.fetchall()
+    except Error as e:
+        print("DB error in get_traffic_hours_inserted_between:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def get_traffic_inserted_since(since, limit: int = 5000, after: Optional[tuple] = None) -> Optional[List[dict]]:
+    """Rows whose insert_time is at or after ``since``, oldest first.
+
+    insert_time is not unique, so rows are ordered on (insert_time, wan_ip,
+    time_hour); with ``after`` = (wan_ip, time_hour), rows at ``since`` itself
+    start strictly after that key, which pages through any number of rows
+    sharing one insert_time.
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        params = [since]
+        keyset = ""
+        if after is not None:
+            keyset = "AND (insert_time > %s OR (wan_ip, time_hour) > (%s, %s))"
+            params += [since, *after]
+        query = f"""
+        SELECT time_hour, wan_ip, in_avg, out_avg, in_max, out_max, insert_time
+        FROM traffic_hourly_copy
+        WHERE insert_time >= %s {keyset}
+        ORDER BY insert_time, wan_ip, time_hour
+        LIMIT %s
+        """
+        cursor.execute(query, (*params, limit))
+        return cursor.fetchall()
+    except Error as e:
+        print("DB error in get_traffic_inserted_since:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def _comparison_columns(prefix: str, window: str, source: str) -> str:
+    """Conditional aggregates for one comparison window (``prefix`` is current/previous)."""
+    if source == "rollup":
+        cond = f"r.day BETWEEN %({window}_from)s AND %({window}_to)s"
+        return f"""
+            SUM(CASE WHEN {cond} THEN r.data_points ELSE 0 END) AS {prefix}_data_points,
+            ROUND(SUM(CASE WHEN {cond} THEN r.in_avg_sum END)
+                / NULLIF(SUM(CASE WHEN {cond} THEN r.in_avg_count END), 0), 2) AS {prefix}_avg_in,
+            ROUND(SUM(CASE WHEN {cond} THEN r.out_avg_sum END)
+                / NULLIF(SUM(CASE WHEN {cond} THEN r.out_avg_count END), 0), 2) AS {prefix}_avg_out,
+            MAX(CASE WHEN {cond} THEN r.in_max END) AS {prefix}_peak_in,
+            MAX(CASE WHEN {cond} THEN r.out_max END) AS {prefix}_peak_out"""
+
+    cond = f"t.time_hour BETWEEN %({window}_from)s AND %({window}_to)s"
+    return f"""
+            SUM(CASE WHEN {cond} THEN 1 ELSE 0 END) AS {prefix}_data_points,
+            ROUND(AVG(CASE WHEN {cond} THEN t.in_avg END), 2) AS {prefix}_avg_in,
+            ROUND(AVG(CASE WHEN {cond} THEN t.out_avg END), 2) AS {prefix}_avg_out,
+            MAX(CASE WHEN {cond} THEN t.in_max END) AS {prefix}_peak_in,
+            MAX(CASE WHEN {cond} THEN t.out_max END) AS {prefix}_peak_out"""
+
+
+def get_traffic_comparison_by_wan_ips(
+    wan_ips: List[str],
+    current: Tuple,
+    previous: Tuple,
+    source: str = "raw",
+    consistency: str = CONSISTENCY_BOUNDED,
+    max_lag: Optional[float] = None
+):
+    """Both windows and their deltas per WAN IP in one grouped scan. Link
+    attributes are added by the caller from the link index.
+
+    ``source="raw"`` takes datetime windows over traffic_hourly_copy,
+    ``source="rollup"`` takes (first_day, last_day) windows over traffic_daily_rollup.
+    """
+    if not wan_ips:
+        return []
+
+    conn = get_read_connection(consistency, max_lag)
+    if not conn:
+        return None
+
+    if source == "rollup":
+        fact, ip_column, time_column = "traffic_daily_rollup r", "r.wan_ip", "r.day"
+    else:
+        fact, ip_column, time_column = "traffic_hourly_copy t", "t.wan_ip", "t.time_hour"
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        placeholders, params = _in_list(wan_ips)
+
+        query = f"""
+        SELECT
+            x.*,
+            x.current_avg_in - x.previous_avg_in AS delta_avg_in,
+            x.current_avg_out - x.previous_avg_out AS delta_avg_out,
+            x.current_peak_in - x.previous_peak_in AS delta_peak_in,
+            x.current_peak_out - x.previous_peak_out AS delta_peak_out,
+            ROUND(100 * (x.current_avg_in - x.previous_avg_in) / NULLIF(x.previous_avg_in, 0), 2) AS pct_change_avg_in,
+            ROUND(100 * (x.current_avg_out - x.previous_avg_out) / NULLIF(x.previous_avg_out, 0), 2) AS pct_change_avg_out
+        FROM (
+            SELECT
+                {ip_column} AS wan_ip,{_comparison_columns("current", "cur", source)},{_comparison_columns("previous", "prev", source)}
+            FROM {fact}
+            WHERE {ip_column} IN ({placeholders})
+              AND ({time_column} BETWEEN %(cur_from)s AND %(cur_to)s
+                   OR {time_column} BETWEEN %(prev_from)s AND %(prev_to)s)
+            GROUP BY {ip_column}
+        ) x
+        ORDER BY x.wan_ip
+        """
+
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), {
+                **params,
+                "cur_from": current[0],
+                "cur_to": current[1],
+                "prev_from": previous[0],
+                "prev_to": previous[1]
+            })
+            return cursor.fetchall()
+
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_traffic_comparison_by_wan_ips:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_traffic_heatmap(
+    wan_ips: List[str],
+    from_time,
+    to_time,
+    resolution: str = "hour",
+    source: str = "raw",
+    consistency: str = CONSISTENCY_BOUNDED,
+    max_lag: Optional[float] = None
+) -> Optional[List[dict]]:
+    """Traffic of ``wan_ips`` combined, grouped by weekday (0 = Monday) and, for
+    ``resolution="hour"``, hour of day: one row per non-empty cell.
+
+    The links are summed per hour first, so samples counts hourly slots, avg_*
+    is the mean combined traffic of those slots and peak_* the highest combined
+    hourly maximum. ``source="rollup"`` expects (first_day, last_day) and a
+    single link, and only serves ``resolution="day"``: traffic_daily_rollup has
+    no hour of day, and the peak of a sum over several links is not the sum of
+    their daily peaks.
+    """
+    if not wan_ips:
+        return []
+    if source == "rollup" and (resolution != "day" or len(wan_ips) != 1):
+        raise ValueError("The rollup serves day heatmaps of a single link")
+
+    conn = get_read_connection(consistency, max_lag)
+    if not conn:
+        return None
+
+    placeholders, params = _in_list(wan_ips)
+    if source == "rollup":
+        # One link: its daily rows hold exactly what the hourly query would aggregate
+        query = f"""
+        SELECT
+            WEEKDAY(day) AS weekday,
+            NULL AS hour,
+            SUM(data_points) AS samples,
+            ROUND(SUM(in_avg_sum) / NULLIF(SUM(in_avg_count), 0), 2) AS avg_in,
+            ROUND(SUM(out_avg_sum) / NULLIF(SUM(out_avg_count), 0), 2) AS avg_out,
+            MAX(in_max) AS peak_in,
+            MAX(out_max) AS peak_out
+        FROM traffic_daily_rollup
+        WHERE wan_ip IN ({placeholders}) AND day BETWEEN %(from_time)s AND %(to_time)s
+        GROUP BY weekday
+        ORDER BY weekday
+        """
+    else:
+        hour, group_by = ("HOUR(s.slot)", "weekday, hour") if resolution == "hour" else ("NULL", "weekday")
+        query = f"""
+        SELECT
+            WEEKDAY(s.slot) AS weekday,
+            {hour} AS hour,
+            COUNT(*) AS samples,
+            ROUND(AVG(s.in_avg), 2) AS avg_in,
+            ROUND(AVG(s.out_avg), 2) AS avg_out,
+            MAX(s.in_max) AS peak_in,
+            MAX(s.out_max) AS peak_out
+        FROM (
+            SELECT time_hour AS slot,
+                SUM(in_avg) AS in_avg,
+                SUM(out_avg) AS out_avg,
+                SUM(in_max) AS in_max,
+                SUM(out_max) AS out_max
+            FROM traffic_hourly_copy
+            WHERE wan_ip IN ({placeholders}) AND time_hour BETWEEN %(from_time)s AND %(to_time)s
+            GROUP BY time_hour
+        ) s
+        GROUP BY {group_by}
+        ORDER BY {group_by}
+        """
+
+    cursor = None
+    try:
+
+        with _deadline(conn):
+            cursor = _execute(conn, _with_deadline(query), {**params, "from_time": from_time, "to_time": to_time},
+                              dictionary=True)
+            return cursor.fetchall()
+
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_traffic_heatmap:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+# Columns ranked by get_top_link_utilisation
+UTILISATION_METRICS = {
+    "peak": "peak_utilisation",
+    "avg": "avg_utilisation"
+}
+
+
+def get_top_link_utilisation(
+    from_time,
+    to_time,
+    limit: int = 20,
+    metric: str = "peak",
+    source: str = "raw",
+    consistency: str = CONSISTENCY_BOUNDED,
+    max_lag: Optional[float] = None
+):
+    """Links across all locations ranked by traffic / bmap_link_master.bandwidth.
+
+    ``source="rollup"`` expects (first_day, last_day) and reads traffic_daily_rollup.
+    """
+    order_column = UTILISATION_METRICS[metric]
+    conn = get_read_connection(consistency, max_lag)
+    if not conn:
+        return None
+
+    if source == "rollup":
+        per_link = """
+            SELECT wan_ip,
+                SUM(data_points) AS data_points,
+                SUM(in_avg_sum) / NULLIF(SUM(in_avg_count), 0) AS avg_in,
+                SUM(out_avg_sum) / NULLIF(SUM(out_avg_count), 0) AS avg_out,
+                MAX(in_max) AS peak_in,
+                MAX(out_max) AS peak_out
+            FROM traffic_daily_rollup
+            WHERE day BETWEEN %s AND %s
+            GROUP BY wan_ip
+        """
+    else:
+        per_link = """
+            SELECT wan_ip,
+                COUNT(*) AS data_points,
+                AVG(in_avg) AS avg_in,
+                AVG(out_avg) AS avg_out,
+                MAX(in_max) AS peak_in,
+                MAX(out_max) AS peak_out
+            FROM traffic_hourly_copy
+            WHERE time_hour BETWEEN %s AND %s
+            GROUP BY wan_ip
+        """
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+
+        query = f"""
+        SELECT
+            b.node AS location,
+            a.wan_ip,
+            b.interface,
+            b.description,
+            b.bandwidth,
+            a.data_points,
+            ROUND(a.avg_in, 2) AS avg_in,
+            ROUND(a.avg_out, 2) AS avg_out,
+            a.peak_in,
+            a.peak_out,
+            ROUND(GREATEST(COALESCE(a.peak_in, 0), COALESCE(a.peak_out, 0)) / b.bandwidth, 4) AS peak_utilisation,
+            ROUND(GREATEST(COALESCE(a.avg_in, 0), COALESCE(a.avg_out, 0)) / b.bandwidth, 4) AS avg_utilisation
+        FROM ({per_link}) a
+        JOIN bmap_link_master b ON b.wanip = a.wan_ip
+        WHERE b.bandwidth > 0
+        ORDER BY {order_column} DESC, a.wan_ip
+        LIMIT %s
+        """
+
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), (from_time, to_time, limit))
+            return cursor.fetchall()
+
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_top_link_utilisation:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_traffic_series(
+    wan_ips: List[str],
+    after_time,
+    columns=("in_avg", "out_avg"),
+    until_time=None,
+    inclusive: bool = False
+) -> Optional[List[tuple]]:
+    """(wan_ip, time_hour, *columns) tuples for hours after ``after_time``
+    (from it, with ``inclusive``; and up to ``until_time`` when given), oldest first.
+
+    Plain tuples keep the fetch cheap for callers that build column arrays.
+    """
+    if not wan_ips:
+        return []
+
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(wan_ips))
+        query = f"""
+        SELECT wan_ip, time_hour, {", ".join(columns)}
+        FROM traffic_hourly_copy
+        WHERE wan_ip IN ({placeholders}) AND time_hour {">=" if inclusive else ">"} %s {"AND time_hour <= %s" if until_time else ""}
+        ORDER BY time_hour ASC
+        """
+        cursor.execute(query, (*wan_ips, after_time) + ((until_time,) if until_time else ()))
+        return cursor.fetchall()
+    except Error as e:
+        print("DB error in get_traffic_series:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_link_master() -> Optional[List[dict]]:
+    """All of bmap_link_master, for the in-memory link index (links.py)."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        query = """
+        SELECT node AS location, wanip AS wan_ip, interface, description, bandwidth
+        FROM bmap_link_master
+        ORDER BY node, wanip, interface
+        """
+        cursor.execute(query)
+        return cursor.fetchall()
+    except Error as e:
+        print("DB error in get_link_master:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_link_master_checksum():
+    """CHECKSUM TABLE value of bmap_link_master; changes whenever its rows do."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("CHECKSUM TABLE bmap_link_master")
+        row = cursor.fetchone()
+        return row[1] if row else None
+    except Error as e:
+        print("DB error in get_link_master_checksum:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_daily_traffic_peaks(wan_ips: List[str], first_day, last_day, source: str = "raw") -> Optional[List[tuple]]:
+    """(wan_ip, day, peak) with peak = max(in_max, out_max) of the day."""
+    if not wan_ips:
+        return []
+
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    placeholders = ", ".join(["%s"] * len(wan_ips))
+    if source == "rollup":
+        query = f"""
+        SELECT wan_ip, day, GREATEST(COALESCE(in_max, 0), COALESCE(out_max, 0)) AS peak
+        FROM traffic_daily_rollup
+        WHERE wan_ip IN ({placeholders}) AND day BETWEEN %s AND %s
+        """
+    else:
+        query = f"""
+        SELECT wan_ip, DATE(time_hour) AS day,
+            GREATEST(COALESCE(MAX(in_max), 0), COALESCE(MAX(out_max), 0)) AS peak
+        FROM traffic_hourly_copy
+        WHERE wan_ip IN ({placeholders})
+          AND time_hour >= %s AND time_hour < %s + INTERVAL 1 DAY
+        GROUP BY wan_ip, DATE(time_hour)
+        """
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, (*wan_ips, first_day, last_day))
+        return cursor.fetchall()
+    except Error as e:
+        print("DB error in get_daily_traffic_peaks:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_access_request_rate(from_time, to_time, bucket_minutes: int = 1, endpoint: Optional[str] = None):
+    """Requests and errors per ``bucket_minutes`` bucket from the minute counters."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        endpoint_filter = "AND endpoint = %s" if endpoint else ""
+        query = f"""
+        SELECT
+            FROM_UNIXTIME(FLOOR(UNIX_TIMESTAMP(bucket_minute) / %s) * %s) AS bucket_start,
+            SUM(hits) AS requests,
+            SUM(CASE WHEN status_code >= 400 THEN hits ELSE 0 END) AS errors
+        FROM access_log_minute_counters
+        WHERE bucket_minute BETWEEN %s AND %s {endpoint_filter}
+        GROUP BY bucket_start
+        ORDER BY bucket_start
+        """
+        seconds = bucket_minutes * 60
+        params = (seconds, seconds, from_time, to_time) + ((endpoint,) if endpoint else ())
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), params)
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_access_request_rate:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_access_error_breakdown(from_time, to_time):
+    """Hits per endpoint and status code, with each endpoint's error rate."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        query = """
+        SELECT c.endpoint, c.status_code, c.hits, totals.requests,
+            ROUND(totals.errors / totals.requests, 4) AS endpoint_error_rate
+        FROM (
+            SELECT endpoint, status_code, SUM(hits) AS hits
+            FROM access_log_minute_counters
+            WHERE bucket_minute BETWEEN %s AND %s
+            GROUP BY endpoint, status_code
+        ) c
+        JOIN (
+            SELECT endpoint, SUM(hits) AS requests,
+                SUM(CASE WHEN status_code >= 400 THEN hits ELSE 0 END) AS errors
+            FROM access_log_minute_counters
+            WHERE bucket_minute BETWEEN %s AND %s
+            GROUP BY endpoint
+        ) totals ON totals.endpoint = c.endpoint
+        ORDER BY endpoint_error_rate DESC, c.endpoint, c.status_code
+        """
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), (from_time, to_time, from_time, to_time))
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_access_error_breakdown:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_access_top_clients(from_time, to_time, limit: int = 20):
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        query = """
+        SELECT wan_ip,
+            SUM(hits) AS requests,
+            SUM(CASE WHEN status_code >= 400 THEN hits ELSE 0 END) AS errors,
+            MIN(bucket_minute) AS first_seen,
+            MAX(bucket_minute) AS last_seen
+        FROM access_log_minute_counters
+        WHERE bucket_minute BETWEEN %s AND %s
+        GROUP BY wan_ip
+        ORDER BY requests DESC, wan_ip
+        LIMIT %s
+        """
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), (from_time, to_time, limit))
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_access_top_clients:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_access_latency_distribution(from_time, to_time, endpoint: Optional[str] = None) -> Optional[List[tuple]]:
+    """(endpoint, response_time_ms, hits) for every distinct latency in the window,
+    ordered by endpoint and latency. Read from idx_created_endpoint_time alone;
+    millisecond values repeat a lot, so this is far fewer rows than requests."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        query = f"""
+        SELECT endpoint, response_time_ms, COUNT(*) AS hits
+        FROM access_logs
+        WHERE created_at BETWEEN %s AND %s AND response_time_ms IS NOT NULL
+            {"AND endpoint = %s" if endpoint else ""}
+        GROUP BY endpoint, response_time_ms
+        ORDER BY endpoint, response_time_ms
+        """
+        params = (from_time, to_time, endpoint) if endpoint else (from_time, to_time)
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), params)
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_access_latency_distribution:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_slowest_requests(from_time, to_time, endpoint: Optional[str] = None, limit: int = 20) -> Optional[List[dict]]:
+    """The ``limit`` slowest logged requests in the window, slowest first."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        # Rank on the covering index, then fetch only the winning rows
+        query = f"""
+        SELECT a.log_id, a.session_id, a.user_id, a.endpoint, a.method, a.status_code, a.wan_ip,
+            a.response_time_ms, a.request_payload_size, a.response_payload_size, a.created_at
+        FROM (
+            SELECT log_id
+            FROM access_logs
+            WHERE created_at BETWEEN %s AND %s AND response_time_ms IS NOT NULL
+                {"AND endpoint = %s" if endpoint else ""}
+            ORDER BY response_time_ms DESC, log_id DESC
+            LIMIT %s
+        ) slowest
+        JOIN access_logs a ON a.log_id = slowest.log_id
+        ORDER BY a.response_time_ms DESC, a.log_id DESC
+        """
+        params = (from_time, to_time, endpoint, limit) if endpoint else (from_time, to_time, limit)
+        with _deadline(conn):
+            cursor.execute(_with_deadline(query), params)
+            return cursor.fetchall()
+    except Error as e:
+        _raise_if_cancelled(e)
+        print("DB error in get_slowest_requests:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def get_popular_access_targets(endpoint: str, since, limit: int = 20) -> Optional[List[tuple]]:
+    """(target, hits) of the locations or WAN IPs most often requested from
+    ``endpoint`` since ``since``, read from idx_endpoint_created_target alone."""
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    cursor = None
+    try:
+        if "target" not in _access_log_optional_columns(conn):
+            return []                   # prewarm.sql not applied: nothing is recorded to rank
+        query = """
+        SELECT target, COUNT(*) AS hits
+        FROM access_logs
+        WHERE endpoint = %s AND created_at >= %s AND target IS NOT NULL
+        GROUP BY target
+        ORDER BY hits DESC, target
+        LIMIT %s
+        """
+        cursor = _execute(conn, query, (endpoint, since, limit))
+        return cursor.fetchall()
+    except Error as e:
+        print("DB error in get_popular_access_targets:", e)
+        return None
+    finally:
+        try:
+            _close_cursor(cursor)
+            conn.close()
+        except:
+            pass
+
+
+def create_access_logs_batch(entries: List[tuple]) -> bool:
+    """Insert many (session_id, user_id, endpoint, method, status_code, wan_ip,
+    response_time_ms, request_payload_size, response_payload_size, target, created_at)
+    rows and their minute counters in one transaction."""
+    if not entries:
+        return True
+
+    conn = get_db_connection()
+    if not conn:
+        print("DB connection failed in create_access_logs_batch")
+        return False
+
+    counters = {}
+    for session_id, user_id, endpoint, method, status_code, wan_ip, *_, created_at in entries:
+        key = (created_at.replace(second=0, microsecond=0), endpoint, method, status_code, wan_ip)
+        counters[key] = counters.get(key, 0) + 1
+
+    cursor = None
+    try:
+        optional = _access_log_optional_columns(conn)
+        # Entry positions of the optional values this database keeps
+        positions = [len(ACCESS_LOG_COLUMNS) + ACCESS_LOG_OPTIONAL_COLUMNS.index(c) for c in optional]
+        rows = [entry[:len(ACCESS_LOG_COLUMNS)] + tuple(entry[i] for i in positions) + entry[-1:]
+                for entry in entries]
+        cursor = conn.cursor()
+        cursor.executemany(_access_log_insert(ACCESS_LOG_COLUMNS + optional + ("created_at",)), rows)
+        cursor.executemany("""
+        INSERT INTO access_log_minute_counters
+        (bucket_minute, endpoint, method, status_code, wan_ip, hits)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE hits = hits + VALUES(hits)
+        """, [key + (hits,) for key, hits in counters.items()])
+        conn.commit()
+        return True
+    except Error as e:
+        print("DB error in create_access_logs_batch:", e)
+        conn.rollback()
+        return False
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def _release_streaming(conn, cursor):
+    """Return ``conn`` to its pool even when its unbuffered ``cursor`` still holds
+    unread rows (a generator closed early, or an error mid-stream). Instead of
+    draining what may be millions of rows, the connection is disconnected; the
+    pool reconnects it on its next checkout."""
+    try:
+        if conn.unread_result:
+            getattr(conn, "_cnx", conn).disconnect()
+        elif cursor is not None:
+            cursor.close()
+    except Exception as e:
+        print("Dropping unread streamed result:", e)
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def iter_traffic_rows(wan_ips: List[str], from_time, to_time, columns: List[str], batch_size: int = 50000):
+    """Yield lists of up to ``batch_size`` row tuples, streamed from an unbuffered
+    cursor so memory stays bounded regardless of the range size."""
+    if not wan_ips:
+        return
+
+    conn = get_read_connection()
+    if not conn:
+        raise Error("Database connection failed")
+
+    cursor = None
+    try:
+        cursor = conn.cursor(buffered=False)
+        placeholders = ", ".join(["%s"] * len(wan_ips))
+        query = f"""
+        SELECT {", ".join(columns)}
+        FROM traffic_hourly_copy
+        WHERE wan_ip IN ({placeholders}) AND time_hour BETWEEN %s AND %s
+        ORDER BY wan_ip, time_hour
+        """
+        cursor.execute(query, (*wan_ips, from_time, to_time))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        _release_streaming(conn, cursor)
+
+
+def iter_recent_traffic(column: str, since, batch_size: int = 50000):
+    """Yield batches of (wan_ip, time_hour, in_avg, out_avg, in_max, out_max, insert_time)
+    for every row whose ``column`` (time_hour or insert_time) is at or after ``since``.
+
+    Reads the primary, like the streaming poller, so an insert_time watermark
+    never runs ahead of rows a lagging replica has not applied yet.
+    """
+    if column not in ("time_hour", "insert_time"):
+        raise ValueError(f"unsupported column {column!r}")
+
+    conn = get_db_connection()
+    if not conn:
+        raise Error("Database connection failed")
+
+    cursor = None
+    try:
+        cursor = conn.cursor(buffered=False)
+        query = f"""
+        SELECT wan_ip, time_hour, in_avg, out_avg, in_max, out_max, insert_time
+        FROM traffic_hourly_copy
+        WHERE {column} >= %s
+        """
+        cursor.execute(query, (since,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        _release_streaming(conn, cursor)
@@ -0,0 +1,59 @@
+"""
+Per-endpoint query deadlines and cancellation on client disconnect.
+
+Routes opt in with ``dependencies=[Depends(query_deadline(seconds))]``. While
+such a request is served, the database functions it calls
+
+  * prefix their SELECT with a MAX_EXECUTION_TIME(seconds) optimizer hint, so
+    MySQL aborts the statement itself, and
+  * register the connection running each query with the request's QueryGuard.
+
+A watcher task next to the request waits for the client's disconnect. When
+the client goes away, or when the deadline plus DEADLINE_GRACE_SECONDS passes
+(servers that ignore the hint, e.g. MariaDB), it kills the running query with
+KILL QUERY from a separate connection. The endpoint thread then gets
+QueryCancelled / QueryTimeout instead of a result, returns its pooled
+connection as usual, and main.py answers 499 / 504.
+"""
+
+import asyncio
+import os
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+
+from database import QueryGuard, current_query_guard
+
+DEADLINE_GRACE_SECONDS = float(os.getenv("QUERY_DEADLINE_GRACE_SECONDS", "1"))
+
+
+async def _disconnected(request: Request):
+    # The body is already read, so the next ASGI message is the disconnect
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _watch(request: Request, guard: QueryGuard):
+    try:
+        await asyncio.wait_for(_disconnected(request), guard.timeout + DEADLINE_GRACE_SECONDS)
+        reason = "disconnect"
+    except asyncio.TimeoutError:
+        reason = "timeout"
+    await run_in_threadpool(guard.cancel, reason)
+
+
+def query_deadline(seconds: float):
+    """Dependency giving the request's queries a deadline of ``seconds``."""
+
+    async def dependency(request: Request):
+        route = request.scope.get("route")
+        guard = QueryGuard(seconds, endpoint=route.path if route else request.url.path)
+        # Set in the request task, so the threadpool thread running the endpoint sees it
+        current_query_guard.set(guard)
+        watcher = asyncio.create_task(_watch(request, guard))
+        try:
+            yield guard
+        finally:
+            watcher.cancel()
+
+    return dependency
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Columnar export of traffic_hourly_copy for offline analysis.
+
+Rows are streamed from MySQL in fixed-size chunks and written as Arrow IPC
+record batches or Parquet row groups, so memory stays bounded for any range.
+`wan_ip` is dictionary-encoded and timestamps are typed columns; the schema
+follows models.TrafficData.
+
+    python export.py --location BANGALORE --from "2026-01-01 00:00:00" \\
+        --to "2026-03-31 23:59:59" --format parquet --output bangalore_q1.parquet
+"""
+
+import argparse
+import io
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from database import iter_traffic_rows, get_wan_ips_by_location
+from models import TrafficData
+
+EXPORT_BATCH_ROWS = 50000
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+_ARROW_TYPES = {datetime: pa.timestamp("s"), float: pa.float64(), str: pa.string(), int: pa.int64()}
+
+
+def _field_type(annotation):
+    args = getattr(annotation, "__args__", None)
+    if args:   # Optional[X]
+        annotation = next(arg for arg in args if arg is not type(None))
+    return _ARROW_TYPES[annotation]
+
+
+def traffic_schema() -> pa.Schema:
+    fields = []
+    for name, info in TrafficData.model_fields.items():
+        if name == "wan_ip":
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string()), nullable=False))
+        else:
+            fields.append(pa.field(name, _field_type(info.annotation), nullable=not info.is_required()))
+    return pa.schema(fields)
+
+
+def _to_batch(rows, schema: pa.Schema, dictionary: pa.Array, ip_index: dict) -> pa.RecordBatch:
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if field.name == "wan_ip":
+            indices = pa.array([ip_index[ip] for ip in values], type=pa.int32())
+            arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+        elif pa.types.is_floating(field.type):
+            # DECIMAL columns arrive as Decimal: infer, then cast
+            arrays.append(pa.array(values).cast(field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_record_batches(wan_ips: List[str], from_time, to_time, batch_rows: int = EXPORT_BATCH_ROWS):
+    """(schema, generator of RecordBatch). One shared wan_ip dictionary for all batches.
+
+    The connection, the query and the first fetch happen here rather than on the
+    first iteration, so database errors raise before a response has started.
+    """
+    schema = traffic_schema()
+    dictionary = pa.array(wan_ips, type=pa.string())
+    ip_index = {ip: i for i, ip in enumerate(wan_ips)}
+    chunks = iter_traffic_rows(wan_ips, from_time, to_time, schema.names, batch_rows)
+    first = next(chunks, None)
+
+    def batches():
+        try:
+            if first is not None:
+                yield _to_batch(first, schema, dictionary, ip_index)
+            for rows in chunks:
+                yield _to_batch(rows, schema, dictionary, ip_index)
+        finally:
+            chunks.close()
+
+    return schema, batches()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands out whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_export(wan_ips: List[str], from_time, to_time, fmt: str = "arrow",
+                  batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[bytes]:
+    """Encoded bytes, one chunk per record batch / row group (for StreamingResponse).
+    Not itself a generator: the query starts, and can fail, before this returns."""
+    schema, batches = iter_record_batches(wan_ips, from_time, to_time, batch_rows)
+    return _encode(schema, batches, fmt)
+
+
+def _encode(schema: pa.Schema, batches, fmt: str) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    try:
+        for batch in batches:
+            write(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+        batches.close()
+    yield sink.drain()
+
+
+def export_to_file(path: str, wan_ips: List[str], from_time, to_time, fmt: Optional[str] = None) -> int:
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "arrow")
+    written = 0
+    with open(path, "wb") as out:
+        for chunk in stream_export(wan_ips, from_time, to_time, fmt):
+            out.write(chunk)
+            written += len(chunk)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export traffic_hourly_copy to Arrow IPC or Parquet")
+    parser.add_argument("--location", action="append", default=[])
+    parser.add_argument("--wan-ip", action="append", default=[])
+    parser.add_argument("--from", dest="from_time", required=True)
+    parser.add_argument("--to", dest="to_time", required=True)
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default=None)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    wan_ips = list(args.wan_ip)
+    for location in args.location:
+        wan_ips.extend(get_wan_ips_by_location(location) or [])
+    wan_ips = list(dict.fromkeys(wan_ips))
+    if not wan_ips:
+        parser.error("no WAN IPs selected (use --location or --wan-ip)")
+
+    size = export_to_file(args.output, wan_ips, args.from_time, args.to_time, args.format)
+    print(f"Exported {len(wan_ips)} WAN IPs to {args.output} ({size} bytes)")
@@ -0,0 +1,174 @@
+"""
+Capacity forecasting: trend + weekly seasonality fitted to daily peak traffic.
+
+    peak(day) = intercept + trend * t + weekday_effect[dow(day)]
+
+All links of a request are fitted at once by solving their masked normal
+equations as one batched linear system. Coefficients are cached per WAN IP
+for the day they were fitted on (the fit ends with the last complete day),
+together with the insert_time watermark they have been checked up to. When
+the watermark moves, only links that received rows for hours inside their
+fitted range (late or backfilled days) are refit; the hourly ingest of the
+current day leaves every fit alone.
+"""
+
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from analytics_pool import analytics_pool
+from database import get_daily_traffic_peaks, get_latest_traffic_insert_time, get_traffic_hours_inserted_between
+from rollups import rollup_is_current
+
+FIT_DAYS = 90
+MIN_FIT_DAYS = 14
+HORIZON_DAYS = 365
+CAPACITY_THRESHOLD = 0.8      # fraction of bmap_link_master.bandwidth
+RIDGE = 1e-6                  # keeps the normal equations solvable for sparse links
+N_COEFFICIENTS = 8            # intercept, trend, 6 weekday offsets (Monday = baseline)
+
+
+def design_matrix(t: np.ndarray, weekday: np.ndarray) -> np.ndarray:
+    X = np.zeros((len(t), N_COEFFICIENTS))
+    X[:, 0] = 1.0
+    X[:, 1] = t
+    for dow in range(1, 7):
+        X[:, 1 + dow] = weekday == dow
+    return X
+
+
+def fit_links(X: np.ndarray, Y: np.ndarray) -> np.ndarray:
+    """Least squares for every column of Y (days x links, NaN = missing day) at once.
+
+    Returns coefficients shaped (links, N_COEFFICIENTS).
+    """
+    mask = ~np.isnan(Y)
+    Y0 = np.where(mask, Y, 0.0)
+    XtX = np.einsum("dl,di,dj->lij", mask, X, X) + RIDGE * np.eye(X.shape[1])
+    XtY = np.einsum("dl,di->li", Y0, X)
+    return np.linalg.solve(XtX, XtY[..., None])[..., 0]
+
+
+def fit_daily_peaks(columns, origin_weekday: int) -> np.ndarray:
+    """Analytics pool job: coefficients for ``columns["peaks"]`` (days x links)."""
+    peaks = columns["peaks"]
+    t = np.arange(peaks.shape[0])
+    return fit_links(design_matrix(t, (origin_weekday + t) % 7), peaks)
+
+
+def first_crossing(coef: np.ndarray, start_t: int, start_weekday: int, limit: np.ndarray) -> np.ndarray:
+    """Days from ``start_t`` until each link's fitted peak reaches ``limit`` (-1 = not within horizon)."""
+    steps = np.arange(HORIZON_DAYS)
+    X = design_matrix(start_t + steps, (start_weekday + steps) % 7)
+    projected = coef @ X.T                       # links x horizon
+    over = projected >= limit[:, None]
+    return np.where(over.any(axis=1), over.argmax(axis=1), -1)
+
+
+class CapacityForecaster:
+    def __init__(self):
+        self._fits: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def forecast(self, links: List[dict], today: Optional[date] = None) -> Optional[List[dict]]:
+        """Forecast for ``links`` (dicts with wan_ip, bandwidth). None on database error."""
+        today = today or date.today()
+        watermark = get_latest_traffic_insert_time()
+
+        with self._lock:
+            stale = [link["wan_ip"] for link in links
+                     if self._fits.get(link["wan_ip"], {}).get("fitted_on") != today]
+            behind = [link["wan_ip"] for link in links
+                      if link["wan_ip"] not in stale and self._fits[link["wan_ip"]]["watermark"] != watermark]
+            if behind:
+                changed = self._changed_since_fit(behind, watermark, today)
+                if changed is None:
+                    return None
+                stale += changed
+            if stale and not self._refit(list(dict.fromkeys(stale)), watermark, today):
+                return None
+            fits = [self._fits[link["wan_ip"]] for link in links]
+
+        if not fits:
+            return []
+
+        coef = np.array([fit["coef"] for fit in fits])
+        bandwidth = np.array([float(link["bandwidth"] or 0) for link in links])
+        limit = np.where(bandwidth > 0, bandwidth * CAPACITY_THRESHOLD, np.inf)
+        origin = fits[0]["origin"]
+        today_t = (today - origin).days
+        days_until = first_crossing(coef, today_t, today.weekday(), limit)
+        fitted_today = coef @ design_matrix(np.array([today_t]), np.array([today.weekday()]))[0]
+
+        results = []
+        for link, fit, c, days, now_peak, bw in zip(links, fits, coef, days_until, fitted_today, bandwidth):
+            usable = fit["days_fitted"] >= MIN_FIT_DAYS and bw > 0
+            results.append({
+                "wan_ip": link["wan_ip"],
+                "interface": link.get("interface"),
+                "description": link.get("description"),
+                "bandwidth": link["bandwidth"],
+                "days_fitted": fit["days_fitted"],
+                "trend_per_day": round(float(c[1]), 4) if usable else None,
+                "fitted_peak_today": round(float(now_peak), 2) if usable else None,
+                "utilisation_today": round(float(now_peak / bw), 4) if usable else None,
+                "days_until_threshold": int(days) if usable and days >= 0 else None,
+                "projected_date": (today + timedelta(days=int(days))) if usable and days >= 0 else None
+            })
+        return results
+
+    def _changed_since_fit(self, wan_ips: List[str], watermark, today: date) -> Optional[List[str]]:
+        """The links among ``wan_ips`` that received rows for days inside their fit
+        since it was made; the others are marked as checked up to ``watermark``.
+        None on database error."""
+        since = min(self._fits[ip]["watermark"] for ip in wan_ips)
+        if since is None or watermark is None:
+            return list(wan_ips)
+        touched = get_traffic_hours_inserted_between(since, watermark)
+        if touched is None:
+            return None
+        fit_end = datetime.combine(today, time())
+        hours = {ip: (first, last) for ip, first, last in touched}
+        changed = []
+        for ip in wan_ips:
+            fit = self._fits[ip]
+            span = hours.get(ip)
+            if span and span[0] < fit_end and span[1] >= datetime.combine(fit["origin"], time()):
+                changed.append(ip)
+            else:
+                fit["watermark"] = watermark
+        return changed
+
+    def _refit(self, wan_ips: List[str], watermark, today: date) -> bool:
+        origin = today - timedelta(days=FIT_DAYS)
+        last_day = today - timedelta(days=1)       # today is still incomplete
+        source = "rollup" if rollup_is_current() else "raw"
+        rows = get_daily_traffic_peaks(wan_ips, origin, last_day, source)
+        if rows is None:
+            return False
+
+        column = {ip: i for i, ip in enumerate(wan_ips)}
+        Y = np.full((FIT_DAYS, len(wan_ips)), np.nan)
+        if rows:
+            ips, days, peaks = zip(*rows)
+            day_index = (np.asarray(days, dtype="datetime64[D]") - np.datetime64(origin, "D")).astype(np.int64)
+            link_index = np.array([column[ip] for ip in ips])
+            Y[day_index, link_index] = np.array(peaks, dtype=np.float64)
+
+        coef = analytics_pool.run(fit_daily_peaks, {"peaks": Y}, origin_weekday=origin.weekday())
+        days_fitted = (~np.isnan(Y)).sum(axis=0)
+
+        for ip, i in column.items():
+            self._fits[ip] = {
+                "coef": coef[i],
+                "origin": origin,
+                "days_fitted": int(days_fitted[i]),
+                "watermark": watermark,
+                "fitted_on": today
+            }
+        return True
+
+
+forecaster = CapacityForecaster()
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Missing and duplicate hours in traffic_hourly_copy (see traffic_gaps.sql).
+
+Every WAN IP should have exactly one row per hour. A refresh finds the links
+that received rows since the last run (by insert_time), reads their hours as
+integer arrays and finds, with vectorised diffs over the sorted hours,
+
+  * missing ranges: consecutive hours more than one hour apart, and
+  * duplicate hours: consecutive equal hours,
+
+which it stores in traffic_gaps, next to each link's indexed span in
+traffic_gap_links. A link is rescanned from its last indexed hour, or from
+the oldest hour that received rows if that is earlier (a backfill), and only
+rescanned whole when it is new or gained hours before its first one.
+/traffic/gaps then reports coverage over any window from the index alone.
+
+Run periodically (cron / systemd timer) or after each ingestion batch:
+    python gaps.py
+    python gaps.py --full     # rebuild the index from scratch
+"""
+
+import argparse
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from mysql.connector import Error
+
+from database import get_db_connection, get_read_connection, get_latest_traffic_insert_time
+from metrics import registry
+from rollups import parse_time
+from timeutil import EPOCH, epoch_hour, from_epoch_hour
+
+GAP_SCAN_BATCH = 50000       # rows per fetch while scanning
+GAP_LINK_CHUNK = 500         # WAN IPs per scan query
+GAP_REPORT_MAX_GAPS = 50     # most recent gaps listed per link
+GAP_INDEX_LOCK = "customer_portal.gap_index"
+MISSING, DUPLICATE = "missing", "duplicate"
+
+gap_index_links = registry.counter("gap_index_links_scanned_total", "Links scanned by the gap index refresh", ["scan"])
+gap_index_refresh = registry.histogram("gap_index_refresh_seconds", "Gap index refresh wall time")
+
+
+def _placeholders(values: List) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def detect_gaps(link: np.ndarray, hour: np.ndarray) -> Dict[str, np.ndarray]:
+    """Spans, missing ranges and duplicate hours of (link index, epoch hour) pairs.
+
+    The pairs may come in any order; already sorted ones (as _scan returns them)
+    skip the sort. Returns arrays keyed span_link/first/last,
+    missing_link/start/end/hours and duplicate_link/hour/extra.
+    """
+    if len(link) == 0:
+        link = hour = np.empty(0, dtype=np.int64)
+        return {key: link for key in ("span_link", "first", "last", "missing_link", "missing_start", "missing_end",
+                                      "missing_hours", "duplicate_link", "duplicate_hour", "duplicate_extra")}
+
+    link_step, step = np.diff(link), np.diff(hour)
+    if (link_step < 0).any() or ((link_step == 0) & (step < 0)).any():
+        order = np.lexsort((hour, link))
+        link, hour = link[order], hour[order]
+        link_step, step = np.diff(link), np.diff(hour)
+    same = link_step == 0
+
+    starts = np.flatnonzero(np.r_[True, ~same])
+    ends = np.r_[starts[1:] - 1, len(link) - 1]
+
+    gap = same & (step > 1)
+
+    dup = same & (step == 0)
+    dup_link, dup_hour = link[1:][dup], hour[1:][dup]
+    # Repeats of one (link, hour) are adjacent: one entry per run, extra rows = run length
+    new_run = (dup_link[1:] != dup_link[:-1]) | (dup_hour[1:] != dup_hour[:-1])
+    first_of_run = np.flatnonzero(np.r_[len(dup_link) > 0, new_run])
+
+    return {
+        "span_link": link[starts],
+        "first": hour[starts],
+        "last": hour[ends],
+        "missing_link": link[:-1][gap],
+        "missing_start": hour[:-1][gap] + 1,
+        "missing_end": hour[1:][gap] - 1,
+        "missing_hours": step[gap] - 1,
+        "duplicate_link": dup_link[first_of_run],
+        "duplicate_hour": dup_hour[first_of_run],
+        "duplicate_extra": np.diff(np.r_[first_of_run, len(dup_link)])
+    }
+
+
+def _scan(conn, wan_ips: List[str], since: Optional[int]):
+    """(link index, epoch hour) arrays of ``wan_ips`` from hour ``since`` on. With
+    ``wan_ips`` sorted, they come out in (link, hour) order."""
+    index = {ip: i for i, ip in enumerate(wan_ips)}
+    cursor = conn.cursor(buffered=False)
+    try:
+        query = f"""
+        SELECT wan_ip, TIMESTAMPDIFF(HOUR, '1970-01-01 00:00:00', time_hour)
+        FROM traffic_hourly_copy
+        WHERE wan_ip IN ({_placeholders(wan_ips)}) {"AND time_hour >= %s" if since is not None else ""}
+        ORDER BY wan_ip, time_hour
+        """
+        cursor.execute(query, (*wan_ips,) + ((from_epoch_hour(since),) if since is not None else ()))
+        links, hours = [], []
+        while True:
+            rows = cursor.fetchmany(GAP_SCAN_BATCH)
+            if not rows:
+                break
+            links.append(np.fromiter((index[row[0]] for row in rows), dtype=np.int64, count=len(rows)))
+            hours.append(np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows)))
+    finally:
+        cursor.close()
+    if not links:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(links), np.concatenate(hours)
+
+
+def _index_chunk(conn, cursor, wan_ips: List[str], starts: Dict[str, Optional[int]],
+                 insert_times: Dict[str, object]) -> Dict[str, int]:
+    """Rescan ``wan_ips``, each from its start hour (None = whole link), and
+    replace their gaps from that hour on."""
+    known = [starts[ip] for ip in wan_ips if starts[ip] is not None]
+    since = min(known) if len(known) == len(wan_ips) else None
+    link, hour = _scan(conn, wan_ips, since)
+
+    floor = np.array([starts[ip] if starts[ip] is not None else np.iinfo(np.int64).min for ip in wan_ips])
+    keep = hour >= floor[link]
+    found = detect_gaps(link[keep], hour[keep])
+
+    cursor.executemany(
+        "DELETE FROM traffic_gaps WHERE wan_ip = %s AND gap_start >= %s",
+        [(ip, from_epoch_hour(starts[ip]) if starts[ip] is not None else EPOCH) for ip in wan_ips]
+    )
+    gap_rows = [
+        (wan_ips[l], MISSING, from_epoch_hour(s), from_epoch_hour(e), int(n))
+        for l, s, e, n in zip(found["missing_link"], found["missing_start"], found["missing_end"], found["missing_hours"])
+    ] + [
+        (wan_ips[l], DUPLICATE, from_epoch_hour(h), from_epoch_hour(h), int(n))
+        for l, h, n in zip(found["duplicate_link"], found["duplicate_hour"], found["duplicate_extra"])
+    ]
+    if gap_rows:
+        cursor.executemany("""
+        INSERT INTO traffic_gaps (wan_ip, kind, gap_start, gap_end, hours)
+        VALUES (%s, %s, %s, %s, %s)
+        """, gap_rows)
+    cursor.executemany("""
+    INSERT INTO traffic_gap_links (wan_ip, first_hour, last_hour, last_insert_time)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        first_hour = LEAST(first_hour, VALUES(first_hour)),
+        last_hour = GREATEST(last_hour, VALUES(last_hour)),
+        last_insert_time = GREATEST(COALESCE(last_insert_time, VALUES(last_insert_time)), VALUES(last_insert_time))
+    """, [
+        (wan_ips[l], from_epoch_hour(f), from_epoch_hour(t), insert_times[wan_ips[l]])
+        for l, f, t in zip(found["span_link"], found["first"], found["last"])
+    ])
+    return {"missing_ranges": len(found["missing_link"]), "duplicate_hours": len(found["duplicate_link"])}
+
+
+def _back_to_gap_start(cursor, starts: Dict[str, Optional[int]]):
+    """Move start hours that fall inside a recorded missing range back to the
+    hour before it, so the rescan sees that range's present left edge."""
+    backfilled = sorted(ip for ip, start in starts.items() if start is not None)
+    for i in range(0, len(backfilled), GAP_LINK_CHUNK):
+        chunk = backfilled[i:i + GAP_LINK_CHUNK]
+        cursor.execute(f"""
+            SELECT wan_ip, gap_start, gap_end
+            FROM traffic_gaps
+            WHERE wan_ip IN ({_placeholders(chunk)}) AND kind = %s AND gap_end >= %s
+        """, (*chunk, MISSING, from_epoch_hour(min(starts[ip] for ip in chunk))))
+        for wan_ip, gap_start, gap_end in cursor.fetchall():
+            if epoch_hour(gap_start) <= starts[wan_ip] <= epoch_hour(gap_end):
+                starts[wan_ip] = epoch_hour(gap_start) - 1
+
+
+def _refresh(conn, cursor, full: bool) -> dict:
+    if full:
+        cursor.execute("DELETE FROM traffic_gaps")
+        cursor.execute("DELETE FROM traffic_gap_links")
+        watermark = None
+    else:
+        cursor.execute("SELECT MAX(last_insert_time) FROM traffic_gap_links")
+        watermark = cursor.fetchone()[0]
+
+    # >= : rows sharing the watermark second may have landed after the last run
+    if watermark is None:
+        cursor.execute("SELECT wan_ip, MIN(time_hour), MAX(insert_time) FROM traffic_hourly_copy GROUP BY wan_ip")
+    else:
+        cursor.execute("""
+            SELECT wan_ip, MIN(time_hour), MAX(insert_time)
+            FROM traffic_hourly_copy
+            WHERE insert_time >= %s
+            GROUP BY wan_ip
+        """, (watermark,))
+    touched = cursor.fetchall()
+
+    spans = {}
+    if watermark is not None:
+        for i in range(0, len(touched), GAP_LINK_CHUNK):
+            chunk = [row[0] for row in touched[i:i + GAP_LINK_CHUNK]]
+            cursor.execute(f"""
+                SELECT wan_ip, first_hour, last_hour
+                FROM traffic_gap_links
+                WHERE wan_ip IN ({_placeholders(chunk)})
+            """, chunk)
+            spans.update((row[0], row[1:]) for row in cursor.fetchall())
+
+    # Rescan each link from the earlier of its last indexed hour and its oldest
+    # touched hour; a link that is new or gained hours before its first one is
+    # rescanned whole
+    starts = {}
+    for wan_ip, min_hour, _ in touched:
+        span = spans.get(wan_ip)
+        if span is None or min_hour < span[0]:
+            starts[wan_ip] = None
+        else:
+            starts[wan_ip] = min(epoch_hour(min_hour), epoch_hour(span[1]))
+    _back_to_gap_start(cursor, starts)
+    insert_times = {wan_ip: insert_time for wan_ip, _, insert_time in touched}
+
+    counts = {"links": len(touched), "rescanned": 0, "missing_ranges": 0, "duplicate_hours": 0}
+    # Partial and whole-link scans go in separate queries, so a link rescanned
+    # whole never turns its neighbours' scans into full ones
+    incremental = sorted(ip for ip, start in starts.items() if start is not None)
+    whole = sorted(ip for ip, start in starts.items() if start is None)
+    counts["rescanned"] = len(whole)
+    for group, scan in ((incremental, "incremental"), (whole, "full")):
+        for i in range(0, len(group), GAP_LINK_CHUNK):
+            chunk = group[i:i + GAP_LINK_CHUNK]
+            found = _index_chunk(conn, cursor, chunk, starts, insert_times)
+            counts["missing_ranges"] += found["missing_ranges"]
+            counts["duplicate_hours"] += found["duplicate_hours"]
+            gap_index_links.inc(len(chunk), scan=scan)
+    return counts
+
+
+def refresh_gap_index(full: bool = False) -> Optional[dict]:
+    """Fold rows inserted since the last run into the gap index, in one
+    transaction. Returns counts, or None when another refresh holds the lock
+    or the database is unavailable."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    started = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (GAP_INDEX_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            return None
+        try:
+            counts = _refresh(conn, cursor, full)
+            conn.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (GAP_INDEX_LOCK,))
+            cursor.fetchone()
+        gap_index_refresh.observe(time.perf_counter() - started)
+        return counts
+    except Error as e:
+        print("DB error in refresh_gap_index:", e)
+        conn.rollback()
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def _coverage(expected: int, missing: int) -> Optional[float]:
+    return round(100 * (expected - missing) / expected, 2) if expected > 0 else None
+
+
+def gap_report(wan_ips: List[str], from_time, to_time, max_gaps: int = GAP_REPORT_MAX_GAPS) -> Optional[dict]:
+    """Coverage of ``wan_ips`` over [from_time, to_time] from the gap index.
+
+    A link is expected to have a row for every hour from its first reading (or
+    from_time) up to the newest hour any link has (or to_time); hours after its
+    own last reading count as stale. Returns None on database error.
+    """
+    start, end = parse_time(from_time), parse_time(to_time)
+    start, end = from_epoch_hour(epoch_hour(start)), from_epoch_hour(epoch_hour(end))
+
+    conn = get_read_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        placeholders = _placeholders(wan_ips)
+
+        cursor.execute("""
+        SELECT MAX(last_hour) AS head, MAX(last_insert_time) AS indexed_through
+        FROM traffic_gap_links
+        """)
+        index = cursor.fetchone()
+
+        cursor.execute(f"""
+        SELECT wan_ip, first_hour, last_hour
+        FROM traffic_gap_links
+        WHERE wan_ip IN ({placeholders})
+        """, wan_ips)
+        spans = {row["wan_ip"]: row for row in cursor.fetchall()}
+
+        cursor.execute(f"""
+        SELECT wan_ip, kind, COUNT(*) AS ranges,
+            SUM(CASE WHEN kind = 'missing'
+                THEN TIMESTAMPDIFF(HOUR, GREATEST(gap_start, %s), LEAST(gap_end, %s)) + 1
+                ELSE hours END) AS hours
+        FROM traffic_gaps
+        WHERE wan_ip IN ({placeholders}) AND gap_start <= %s AND gap_end >= %s
+        GROUP BY wan_ip, kind
+        """, (start, end, *wan_ips, end, start))
+        totals = {(row["wan_ip"], row["kind"]): row for row in cursor.fetchall()}
+
+        # The newest max_gaps gaps per link, oldest first
+        cursor.execute(f"""
+        SELECT wan_ip, kind, gap_start, gap_end, hours
+        FROM (
+            SELECT g.*, ROW_NUMBER() OVER (PARTITION BY wan_ip ORDER BY gap_start DESC) AS n
+            FROM traffic_gaps g
+            WHERE wan_ip IN ({placeholders}) AND gap_start <= %s AND gap_end >= %s
+        ) x
+        WHERE n <= %s
+        ORDER BY wan_ip, gap_start
+        """, (*wan_ips, end, start, max_gaps))
+        listed = {}
+        for row in cursor.fetchall():
+            listed.setdefault(row.pop("wan_ip"), []).append(row)
+    except Error as e:
+        print("DB error in gap_report:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+    head = index["head"]
+    window_end = min(end, head) if head is not None else end
+    links, expected_total, missing_total = [], 0, 0
+    for wan_ip in wan_ips:
+        span = spans.get(wan_ip)
+        if span is None:
+            expected = max(0, epoch_hour(window_end) - epoch_hour(start) + 1)
+            missing, stale, duplicates = expected, expected, 0
+        else:
+            first = max(start, span["first_hour"])
+            expected = max(0, epoch_hour(window_end) - epoch_hour(first) + 1)
+            stale = max(0, epoch_hour(window_end) - max(epoch_hour(span["last_hour"]) + 1, epoch_hour(first)) + 1)
+            missing = int((totals.get((wan_ip, MISSING)) or {}).get("hours") or 0) + stale
+            duplicates = int((totals.get((wan_ip, DUPLICATE)) or {}).get("hours") or 0)
+        expected_total += expected
+        missing_total += missing
+        links.append({
+            "wan_ip": wan_ip,
+            "first_reading": span["first_hour"] if span else None,
+            "last_reading": span["last_hour"] if span else None,
+            "expected_hours": expected,
+            "missing_hours": missing,
+            "stale_hours": stale,
+            "duplicate_rows": duplicates,
+            "coverage_pct": _coverage(expected, missing),
+            "gaps": listed.get(wan_ip, [])
+        })
+
+    return {
+        "indexed_through": index["indexed_through"],
+        "head_hour": head,
+        "total": {
+            "links": len(wan_ips),
+            "expected_hours": expected_total,
+            "missing_hours": missing_total,
+            "coverage_pct": _coverage(expected_total, missing_total)
+        },
+        "links": links
+    }
+
+
+def gap_index_is_current(indexed_through) -> bool:
+    latest = get_latest_traffic_insert_time()
+    return indexed_through is not None and latest is not None and indexed_through >= latest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the traffic gap index")
+    parser.add_argument("--full", action="store_true", help="rebuild the index from scratch")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = refresh_gap_index(full=args.full)
+    if counts is None:
+        print("Refresh skipped: database unavailable or another refresh is running")
+    else:
+        print(f"Gap index refreshed in {time.perf_counter() - started:.1f}s: {counts['links']} links "
+              f"({counts['rescanned']} rescanned whole), {counts['missing_ranges']} missing ranges, "
+              f"{counts['duplicate_hours']} duplicate hours")
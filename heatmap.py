@@ -0,0 +1,50 @@
+"""
+Hour-of-week traffic heatmaps.
+
+The grouping runs in MySQL (get_traffic_heatmap), so at most 7 x 24 rows
+leave the database whatever the range; this module only lays them out as
+matrices. Both sources compute the same cells: the links are summed per hour,
+and a peak is the highest hourly maximum of that sum. Weekday-only profiles
+of whole days for a single link come from traffic_daily_rollup while it is up
+to date. Several links, whose summed hourly peaks no daily row holds, and
+hour-of-week cells always read traffic_hourly_copy.
+"""
+
+from typing import List, Optional
+
+from database import get_traffic_heatmap, CONSISTENCY_BOUNDED
+from rollups import day_window, rollup_is_current
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+HEATMAP_RESOLUTIONS = ("hour", "day")
+HEATMAP_METRICS = ("avg_in", "avg_out", "peak_in", "peak_out", "samples")
+
+
+def traffic_heatmap(wan_ips: List[str], from_time, to_time, resolution: str = "hour",
+                    max_lag: Optional[float] = None) -> Optional[dict]:
+    """{"source", "weekdays", "hours", <metric>: 7 x len(hours) matrix} for the
+    combined traffic of ``wan_ips``; cells without data are None."""
+    source, window = "raw", (from_time, to_time)
+    if resolution == "day":
+        days = day_window(from_time, to_time)
+        if days and len(wan_ips) == 1 and rollup_is_current():
+            source, window = "rollup", days
+
+    rows = get_traffic_heatmap(wan_ips, *window, resolution=resolution, source=source,
+                               consistency=CONSISTENCY_BOUNDED, max_lag=max_lag)
+    if rows is None:
+        return None
+
+    hours = list(range(24)) if resolution == "hour" else [None]
+    column = {hour: i for i, hour in enumerate(hours)}
+    matrices = {metric: [[None] * len(hours) for _ in WEEKDAYS] for metric in HEATMAP_METRICS}
+    for row in rows:
+        for metric in HEATMAP_METRICS:
+            matrices[metric][row["weekday"]][column[row["hour"]]] = row[metric]
+
+    return {
+        "source": source,
+        "weekdays": list(WEEKDAYS),
+        "hours": hours if resolution == "hour" else [],
+        **matrices
+    }
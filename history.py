@@ -0,0 +1,137 @@
+"""
+Login/logout history, per-session activity reports and per-WAN-IP access history.
+
+Pages are keyset-paginated, newest first: on (login_time, session_id) for
+sessions and (created_at, log_id) for access logs. Each response carries an
+opaque ``next_cursor`` holding the last row's key, and the next page continues
+strictly after it. Unlike OFFSET, a deep page reads no more rows than the
+first one, and rows written while a client pages through do not shift what it
+has left to read.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from database import (
+    get_session_history_page,
+    get_session_activities,
+    get_user_by_username,
+    get_access_logs_by_wan_ip_page,
+    get_access_endpoint_counts_by_wan_ip
+)
+
+HISTORY_FIELDS = ("session_id", "user_id", "username", "login_time", "logout_time", "wan_ip", "status")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(time: datetime, key) -> str:
+    raw = f"{time.isoformat()}|{key}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type=str) -> Tuple[datetime, object]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        time, key = raw.split("|", 1)
+        return datetime.fromisoformat(time), key_type(key)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor(f"invalid cursor {cursor!r}")
+
+
+def _page(username: Optional[str], wan_ip: Optional[str], from_time, to_time,
+          cursor: Optional[str], limit: int) -> Optional[Tuple[List[dict], Optional[str]]]:
+    """(rows, next_cursor) of one page; ([], None) for an unknown username."""
+    after = decode_cursor(cursor) if cursor else None
+    user_id = None
+    if username:
+        user = get_user_by_username(username)
+        if user is None:
+            return [], None
+        user_id = user["id"]
+
+    # One extra row tells whether another page follows
+    rows = get_session_history_page(user_id, wan_ip, from_time, to_time, after, limit + 1)
+    if rows is None:
+        return None
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["login_time"], rows[-1]["session_id"])
+
+
+def session_history(username: Optional[str], wan_ip: Optional[str], from_time, to_time,
+                    cursor: Optional[str] = None, limit: int = 50) -> Optional[dict]:
+    """{"sessions": [LoginLogoutHistory...], "next_cursor"}; None on database errors."""
+    page = _page(username, wan_ip, from_time, to_time, cursor, limit)
+    if page is None:
+        return None
+    rows, next_cursor = page
+    return {
+        "sessions": [{field: row[field] for field in HISTORY_FIELDS} for row in rows],
+        "next_cursor": next_cursor
+    }
+
+
+def session_activity_report(username: Optional[str], wan_ip: Optional[str], from_time, to_time,
+                            cursor: Optional[str] = None, limit: int = 20,
+                            max_activities: int = 200) -> Optional[dict]:
+    """{"sessions": [SessionActivityReport...], "next_cursor"}; the activities of
+    the whole page come from one batched query, at most ``max_activities`` each.
+    Ended sessions also carry the sweeper's request and error counts."""
+    page = _page(username, wan_ip, from_time, to_time, cursor, limit)
+    if page is None:
+        return None
+    rows, next_cursor = page
+
+    activities = get_session_activities([row["session_id"] for row in rows], max_activities)
+    if activities is None:
+        return None
+    by_session = {row["session_id"]: [] for row in rows}
+    for activity in activities:
+        by_session[activity["session_id"]].append(activity)
+
+    sessions = []
+    for row in rows:
+        listed = by_session[row["session_id"]]
+        truncated = len(listed) == max_activities and row["request_count"] != max_activities
+        sessions.append({**row, "activities": listed, "activities_truncated": truncated})
+    return {
+        "sessions": sessions,
+        "next_cursor": next_cursor
+    }
+
+
+def wan_ip_activity_history(wan_ip: str, from_time, to_time, cursor: Optional[str] = None,
+                            limit: int = 100) -> Optional[dict]:
+    """{"activities", "next_cursor", "endpoint_counts"} for one client WAN IP.
+
+    The per-endpoint counts come from access_log_minute_counters and cover the
+    whole window (to the minute), so they are returned with the first page only;
+    later pages are None there.
+    """
+    after = decode_cursor(cursor, int) if cursor else None
+    rows = get_access_logs_by_wan_ip_page(wan_ip, from_time, to_time, after, limit + 1)
+    if rows is None:
+        return None
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["log_id"])
+
+    counts = None
+    if not cursor:
+        counts = get_access_endpoint_counts_by_wan_ip(wan_ip, from_time, to_time)
+        if counts is None:
+            return None
+        counts = [{**row, "requests": int(row["requests"]), "errors": int(row["errors"])} for row in counts]
+
+    return {
+        "endpoint_counts": counts,
+        "activities": rows,
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped hot cache of recent hourly traffic.
+
+Every WAN IP gets a ring of HOTCACHE_HOURS records (hour, in_avg, out_avg,
+in_max, out_max); hour h lives in slot h % HOTCACHE_HOURS and a slot only
+counts when its stored hour matches. Rings are packed SHARD_LINKS to a
+fixed-size shard file under HOTCACHE_DIR, each next to the WAN IP it belongs
+to, so a worker maps one file per SHARD_LINKS links rather than one per link.
+The files are mapped MAP_SHARED, so all workers on a host read the same pages
+from the OS page cache and only one of them (whoever holds the lock file)
+refreshes them from traffic_hourly_copy by insert_time.
+
+A shared meta file records the insert_time watermark, the first hour the cache
+is complete from, the newest hour seen, when the last refresh finished, how
+many links have a ring and a generation that a reset bumps; a worker seeing a
+new generation drops its mappings and its WAN IP index before reading.
+lookup() answers a window only when it lies entirely inside the retained range
+and the last refresh is recent enough for the caller's staleness budget;
+anything else returns None and the caller queries MySQL.
+
+Pre-populate or refresh from cron with:
+    python hotcache.py
+"""
+
+import fcntl
+import os
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from database import get_latest_traffic_insert_time, iter_recent_traffic
+from metrics import registry
+from rollups import parse_time
+from timeutil import EPOCH, HOUR, epoch_hour, first_hour_from
+
+# Set HOTCACHE_DIR="" to disable the cache; point queries then always hit MySQL.
+HOTCACHE_DIR = os.getenv("HOTCACHE_DIR", "hotcache")
+HOTCACHE_HOURS = int(os.getenv("HOTCACHE_HOURS", str(14 * 24)))
+HOTCACHE_REFRESH_SECONDS = float(os.getenv("HOTCACHE_REFRESH_SECONDS", "2"))
+
+RECORD = np.dtype([("hour", "<i8"), ("in_avg", "<f8"), ("out_avg", "<f8"), ("in_max", "<f8"), ("out_max", "<f8")])
+VALUE_FIELDS = ("in_avg", "out_avg", "in_max", "out_max")
+EMPTY_HOUR = -1
+SHARD_LINKS = 1024   # rings per shard file
+WAN_IP_BYTES = 48
+
+# Slots of the shared meta file
+WATERMARK, COVERAGE_START, NEWEST_HOUR, REFRESHED_AT, RING_HOURS, GENERATION, LINK_COUNT = range(7)
+META_SLOTS = 7
+
+hotcache_lookups = registry.counter("hotcache_lookups_total", "Hot cache lookups by outcome", ["outcome"])
+hotcache_rows = registry.counter("hotcache_refresh_rows_total", "Rows applied to the hot cache")
+hotcache_refresh = registry.histogram("hotcache_refresh_seconds", "Hot cache refresh wall time")
+
+
+def _shard_dtype(hours: int) -> np.dtype:
+    return np.dtype([("wan_ip", f"S{WAN_IP_BYTES}"), ("ring", RECORD, (hours,))])
+
+
+class HotTrafficCache:
+    def __init__(self, directory: str = HOTCACHE_DIR, hours: int = HOTCACHE_HOURS,
+                 interval: float = HOTCACHE_REFRESH_SECONDS):
+        self.directory = directory
+        self.hours = hours
+        self.interval = interval
+        self._shards: Dict[int, np.memmap] = {}
+        self._rows: Dict[str, int] = {}     # wan_ip -> ring number, for the first _indexed rings
+        self._indexed = 0
+        self._generation = None
+        self._meta: Optional[np.memmap] = None
+        self._open_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # -- mapping -----------------------------------------------------------
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "_meta.bin")
+
+    def _get_meta(self, create: bool = False) -> Optional[np.memmap]:
+        if self._meta is None:
+            path = self._meta_path()
+            if os.path.exists(path) and os.path.getsize(path) == META_SLOTS * 8:
+                self._meta = np.memmap(path, dtype="<f8", mode="r+", shape=(META_SLOTS,))
+            elif create:
+                # Missing or in an older layout: start over. Written under a temporary
+                # name so no reader maps it half-initialised.
+                self._remove_shards()
+                tmp = path + f".{os.getpid()}.tmp"
+                meta = np.memmap(tmp, dtype="<f8", mode="w+", shape=(META_SLOTS,))
+                meta[:] = np.nan
+                meta[RING_HOURS] = self.hours
+                meta[GENERATION] = 0
+                meta[LINK_COUNT] = 0
+                meta.flush()
+                os.replace(tmp, path)
+                self._meta = np.memmap(path, dtype="<f8", mode="r+", shape=(META_SLOTS,))
+        return self._meta
+
+    def _shard_path(self, shard: int) -> str:
+        return os.path.join(self.directory, f"shard_{shard:05d}.bin")
+
+    def _shard(self, shard: int, create: bool = False) -> Optional[np.memmap]:
+        mapped = self._shards.get(shard)
+        if mapped is not None:
+            return mapped
+        path = self._shard_path(shard)
+        dtype = _shard_dtype(self.hours)
+        if os.path.exists(path) and os.path.getsize(path) == dtype.itemsize * SHARD_LINKS:
+            mapped = np.memmap(path, dtype=dtype, mode="r+", shape=(SHARD_LINKS,))
+        elif create:
+            tmp = path + f".{os.getpid()}.tmp"
+            mapped = np.memmap(tmp, dtype=dtype, mode="w+", shape=(SHARD_LINKS,))
+            mapped["ring"]["hour"] = EMPTY_HOUR
+            mapped.flush()
+            os.replace(tmp, path)
+        else:
+            return None
+        self._shards[shard] = mapped
+        return mapped
+
+    def _sync(self, meta: np.memmap):
+        """Catch up with the shared layout: drop everything mapped under an older
+        generation, then index the rings added since the last call."""
+        with self._open_lock:
+            if meta[GENERATION] != self._generation:
+                self._shards.clear()
+                self._rows.clear()
+                self._indexed = 0
+                self._generation = float(meta[GENERATION])
+            count = int(meta[LINK_COUNT])
+            while self._indexed < count:
+                shard = self._shard(self._indexed // SHARD_LINKS)
+                if shard is None:
+                    break
+                name = shard["wan_ip"][self._indexed % SHARD_LINKS]
+                if not name:
+                    break                           # counted before its name landed; next call
+                self._rows[name.decode()] = self._indexed
+                self._indexed += 1
+
+    def _ring(self, wan_ip: str, meta: np.memmap, create: bool = False) -> Optional[np.ndarray]:
+        """The ring of ``wan_ip`` (a view into its shard), or None. Only the
+        refresher, under the lock file, creates rings."""
+        row = self._rows.get(wan_ip)
+        if row is None:
+            if not create:
+                return None
+            with self._open_lock:
+                row = int(meta[LINK_COUNT])
+                shard = self._shard(row // SHARD_LINKS, create=True)
+                shard["wan_ip"][row % SHARD_LINKS] = wan_ip.encode()
+                meta[LINK_COUNT] = row + 1          # publish once the name is in place
+                self._rows[wan_ip] = row
+                self._indexed = row + 1
+        shard = self._shard(row // SHARD_LINKS)
+        return None if shard is None else shard["ring"][row % SHARD_LINKS]
+
+    # -- reads ---------------------------------------------------------------
+
+    def lookup(self, wan_ip: str, from_time, to_time, max_lag: float) -> Optional[List[dict]]:
+        """Rows for ``wan_ip`` with time_hour BETWEEN from_time AND to_time, or None
+        when the window is not fully covered or the cache is older than ``max_lag`` seconds."""
+        meta = self._get_meta()
+        if meta is None or meta[RING_HOURS] != self.hours or not time.time() - meta[REFRESHED_AT] <= max_lag:
+            hotcache_lookups.inc(outcome="stale")
+            return None
+
+        try:
+            start, end = parse_time(from_time), parse_time(to_time)
+        except ValueError:
+            return None
+        first = first_hour_from(start)
+        last = epoch_hour(end)
+        oldest = max(int(meta[COVERAGE_START]), int(meta[NEWEST_HOUR]) - self.hours + 1)
+        if first < oldest or last - first >= self.hours:
+            hotcache_lookups.inc(outcome="uncovered")
+            return None
+
+        hotcache_lookups.inc(outcome="hit")
+        self._sync(meta)
+        ring = self._ring(wan_ip, meta)
+        if ring is None or last < first:
+            return []                              # covered, but no rows for this link
+
+        hours = np.arange(first, last + 1)
+        records = ring[hours % self.hours]
+        records = records[records["hour"] == hours]
+        columns = [records[field].tolist() for field in VALUE_FIELDS]
+        return [
+            {
+                "time_hour": EPOCH + hour * HOUR,
+                "wan_ip": wan_ip,
+                "in_avg": None if in_avg != in_avg else in_avg,       # NaN stores NULL
+                "out_avg": None if out_avg != out_avg else out_avg,
+                "in_max": None if in_max != in_max else in_max,
+                "out_max": None if out_max != out_max else out_max
+            }
+            for hour, in_avg, out_avg, in_max, out_max in zip(records["hour"].tolist(), *columns)
+        ]
+
+    # -- refresh -------------------------------------------------------------
+
+    def refresh(self) -> Optional[int]:
+        """Apply rows inserted since the watermark. Returns the number of rows applied,
+        or None when another process holds the refresh lock."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            started = time.perf_counter()
+            meta = self._get_meta(create=True)
+            if meta[RING_HOURS] != self.hours:
+                self._reset(meta)
+            self._sync(meta)
+
+            if np.isnan(meta[WATERMARK]):
+                # Initial fill: take the watermark first so rows landing during the
+                # load are picked up again by the next incremental refresh.
+                latest = get_latest_traffic_insert_time()
+                since = datetime.now() - self.hours * HOUR
+                applied = self._load(meta, "time_hour", since)
+                if latest is not None:
+                    meta[WATERMARK] = (latest - EPOCH).total_seconds()
+                if np.isnan(meta[NEWEST_HOUR]):
+                    meta[NEWEST_HOUR] = epoch_hour(datetime.now())
+                meta[COVERAGE_START] = first_hour_from(since)
+            else:
+                applied = self._load(meta, "insert_time", EPOCH + timedelta(seconds=float(meta[WATERMARK])))
+
+            meta[REFRESHED_AT] = time.time()
+            meta.flush()
+            hotcache_rows.inc(applied)
+            hotcache_refresh.observe(time.perf_counter() - started)
+            return applied
+
+    def _load(self, meta: np.memmap, column: str, since: datetime) -> int:
+        # Rows at exactly the watermark are read again on the next refresh
+        # (insert_time is not unique); re-applying them is idempotent.
+        # The rows arrive in no particular order, so the watermark only moves
+        # once all of them are applied: a stream that fails part way leaves it
+        # where it was and the next refresh reads every row again.
+        applied = 0
+        newest = None
+        # closing(): an error while applying releases the streaming connection right away
+        with closing(iter_recent_traffic(column, since)) as batches:
+            for batch in batches:
+                self._apply(meta, batch)
+                if column == "insert_time":
+                    latest = max(row[6] for row in batch)
+                    newest = latest if newest is None else max(newest, latest)
+                applied += len(batch)
+        if newest is not None:
+            meta[WATERMARK] = max((newest - EPOCH).total_seconds(), meta[WATERMARK])
+        return applied
+
+    def _apply(self, meta: np.memmap, rows: List[tuple]):
+        ips = np.array([row[0] for row in rows], dtype=object)
+        hours = np.array([row[1] for row in rows], dtype="datetime64[h]").astype(np.int64)
+        values = {field: np.array([row[2 + i] for row in rows], dtype=np.float64)
+                  for i, field in enumerate(VALUE_FIELDS)}
+
+        newest = int(hours.max())
+        if np.isnan(meta[NEWEST_HOUR]) or newest > meta[NEWEST_HOUR]:
+            meta[NEWEST_HOUR] = newest
+        keep = hours > meta[NEWEST_HOUR] - self.hours   # older hours have left the ring
+
+        order = np.argsort(ips[keep], kind="stable")
+        ips, hours = ips[keep][order], hours[keep][order]
+        values = {field: column[keep][order] for field, column in values.items()}
+        bounds = np.flatnonzero(ips[1:] != ips[:-1]) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(ips)]):
+            if lo == hi:
+                continue
+            ring = self._ring(ips[lo], meta, create=True)
+            slots = hours[lo:hi] % self.hours
+            for field in VALUE_FIELDS:
+                ring[field][slots] = values[field][lo:hi]
+            ring["hour"][slots] = hours[lo:hi]     # stamp last, once the values are in place
+
+    def _reset(self, meta: np.memmap):
+        # HOTCACHE_HOURS changed: the shard files no longer match, start over.
+        # The new generation makes every worker drop its mappings first.
+        meta[GENERATION] += 1
+        meta[LINK_COUNT] = 0
+        self._remove_shards()
+        for slot in (WATERMARK, COVERAGE_START, NEWEST_HOUR, REFRESHED_AT):
+            meta[slot] = np.nan
+        meta[RING_HOURS] = self.hours
+        meta.flush()
+
+    def _remove_shards(self):
+        with self._open_lock:
+            self._shards.clear()
+            self._rows.clear()
+            self._indexed = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin") and name != "_meta.bin":
+                os.remove(os.path.join(self.directory, name))
+
+    # -- background refresher --------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="hotcache-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Hot cache refresh error:", e)
+            if self._stop.wait(self.interval):
+                return
+
+    def status(self) -> dict:
+        meta = self._get_meta()
+        if meta is None or np.isnan(meta[REFRESHED_AT]):
+            return {"ready": False}
+        return {
+            "ready": True,
+            "links": int(meta[LINK_COUNT]),
+            "oldest_hour": EPOCH + max(int(meta[COVERAGE_START]), int(meta[NEWEST_HOUR]) - self.hours + 1) * HOUR,
+            "newest_hour": EPOCH + int(meta[NEWEST_HOUR]) * HOUR,
+            "watermark": None if np.isnan(meta[WATERMARK]) else EPOCH + timedelta(seconds=float(meta[WATERMARK])),
+            "age_seconds": round(time.time() - float(meta[REFRESHED_AT]), 1)
+        }
+
+
+hot_cache = HotTrafficCache()
+
+
+if __name__ == "__main__":
+    applied = hot_cache.refresh()
+    if applied is None:
+        print("Another process is refreshing the hot cache")
+    else:
+        print(f"Applied {applied} rows; {hot_cache.status()}")
@@ -0,0 +1,61 @@
+"""
+Per-endpoint latency percentiles and the slowest requests, from the
+response_time_ms the access-log middleware records (see access_log_timing.sql).
+
+MySQL returns one (endpoint, latency, hits) row per distinct millisecond value
+rather than one row per request, and the percentiles are read off the
+cumulative hit counts, so the result matches np.percentile over every request
+without shipping them.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+from database import get_access_latency_distribution, get_slowest_requests
+
+DEFAULT_LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+def weighted_percentiles(values: np.ndarray, counts: np.ndarray, quantiles) -> np.ndarray:
+    """Percentiles of sorted ``values`` each repeated ``counts`` times, with
+    np.percentile's linear interpolation."""
+    ends = np.cumsum(counts)
+    pos = np.asarray(quantiles, dtype=np.float64) / 100.0 * (ends[-1] - 1)
+    lo = values[np.searchsorted(ends, np.floor(pos), side="right")]
+    hi = values[np.searchsorted(ends, np.ceil(pos), side="right")]
+    return lo + (hi - lo) * (pos - np.floor(pos))
+
+
+def latency_report(from_time, to_time, endpoint: Optional[str] = None, limit: int = 20,
+                   quantiles=DEFAULT_LATENCY_PERCENTILES) -> Optional[dict]:
+    """{"endpoints": [...slowest p95 first], "slowest": [...]}; None on database errors."""
+    rows = get_access_latency_distribution(from_time, to_time, endpoint)
+    if rows is None:
+        return None
+    slowest = get_slowest_requests(from_time, to_time, endpoint, limit)
+    if slowest is None:
+        return None
+
+    endpoints = []
+    if rows:
+        names, values, counts = zip(*rows)
+        values = np.array(values, dtype=np.float64)
+        counts = np.array(counts, dtype=np.int64)
+        # Rows arrive grouped by endpoint: split at the boundaries
+        names = np.array(names, dtype=object)
+        bounds = np.flatnonzero(names[1:] != names[:-1]) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(names)]):
+            v, c = values[start:end], counts[start:end]
+            result = weighted_percentiles(v, c, quantiles)
+            endpoints.append({
+                "endpoint": names[start],
+                "requests": int(c.sum()),
+                "avg_ms": round(float(np.dot(v, c) / c.sum()), 1),
+                **{f"p{q:g}_ms": round(float(r), 1) for q, r in zip(quantiles, result)},
+                "max_ms": int(v[-1])
+            })
+
+    rank = f"p{95 if 95 in quantiles else quantiles[-1]:g}_ms"
+    endpoints.sort(key=lambda row: row[rank], reverse=True)
+    return {"endpoints": endpoints, "slowest": slowest}
@@ -0,0 +1,146 @@
+"""
+In-memory index of bmap_link_master.
+
+Link metadata (node, interface, description, bandwidth) changes rarely, so each
+worker keeps it as two dicts, location -> WAN IPs and (location, WAN IP) ->
+attributes, instead of joining bmap_link_master into every traffic query.
+Attributes are keyed by location as well because the table does not forbid a
+WAN IP under several nodes; each location then sees its own row, as the join
+did. A WAN IP listed twice under one node keeps its first row by interface.
+Both kinds of duplicate are printed on every reload that finds them. The index is
+loaded on first use, re-validated with CHECKSUM TABLE at most every
+LINK_INDEX_CHECK_SECONDS and reloaded when the table changed. If the database
+is unreachable the last loaded snapshot keeps being served.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from database import get_link_master, get_link_master_checksum
+from metrics import registry
+
+LINK_INDEX_CHECK_SECONDS = 30
+
+LINK_ATTRIBUTES = ("interface", "description", "bandwidth")
+
+link_index_reloads = registry.counter("link_index_reloads_total", "Link index reloads by outcome", ["outcome"])
+link_index_links = registry.gauge("link_index_links", "Links held in the link index")
+
+
+class _Snapshot:
+    def __init__(self, rows: List[dict], checksum):
+        self.checksum = checksum
+        self.by_link: Dict[Tuple[str, str], dict] = {}
+        self.by_location: Dict[str, List[str]] = {}
+        locations: Dict[str, List[str]] = {}
+        repeated = set()
+        for row in rows:
+            key = (row["location"], row["wan_ip"])
+            if key in self.by_link:
+                repeated.add(key)
+                continue
+            self.by_link[key] = row
+            self.by_location.setdefault(row["location"], []).append(row["wan_ip"])
+            locations.setdefault(row["wan_ip"], []).append(row["location"])
+
+        for location, wan_ip in sorted(repeated, key=str):
+            print(f"Link index: {wan_ip} is listed more than once under {location}, keeping the first row")
+        for wan_ip, at in sorted(locations.items()):
+            if len(at) > 1:
+                print(f"Link index: {wan_ip} is listed under {len(at)} locations ({', '.join(map(str, at))})")
+        self.wan_ip_count = len(locations)
+
+
+class LinkIndex:
+    def __init__(self, check_interval: float = LINK_INDEX_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self) -> Optional[_Snapshot]:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        # One thread re-validates; the others keep using the snapshot they have
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            if self._snapshot is None or time.monotonic() - self._checked_at >= self.check_interval:
+                self.refresh()
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload the index if bmap_link_master changed (or always with ``force``)."""
+        checksum = get_link_master_checksum()
+        self._checked_at = time.monotonic()
+        snapshot = self._snapshot
+        if not force and snapshot is not None and checksum is not None and checksum == snapshot.checksum:
+            link_index_reloads.inc(outcome="unchanged")
+            return True
+
+        rows = get_link_master()
+        if rows is None:
+            link_index_reloads.inc(outcome="error")
+            return False
+        self._snapshot = _Snapshot(rows, checksum)
+        link_index_links.set(self._snapshot.wan_ip_count)
+        link_index_reloads.inc(outcome="reloaded")
+        return True
+
+    def invalidate(self):
+        """Re-check bmap_link_master on the next lookup."""
+        self._checked_at = 0.0
+
+    def wan_ips(self, location: str) -> Optional[List[str]]:
+        """WAN IPs at ``location`` ([] for an unknown location), None if the index never loaded."""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return list(snapshot.by_location.get(location, []))
+
+    def links(self, location: str) -> Optional[List[dict]]:
+        """Link rows (location, wan_ip, interface, description, bandwidth) at ``location``."""
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return [dict(snapshot.by_link[(location, ip)]) for ip in snapshot.by_location.get(location, [])]
+
+    def locations(self) -> Optional[List[dict]]:
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        return [
+            {
+                "location": location,
+                "links": len(wan_ips),
+                "total_bandwidth": sum(float(snapshot.by_link[(location, ip)]["bandwidth"] or 0) for ip in wan_ips)
+            }
+            for location, wan_ips in sorted(snapshot.by_location.items(), key=lambda item: str(item[0]))
+        ]
+
+    def enrich(self, rows: List[dict], location: str) -> List[dict]:
+        """Prefix traffic rows keyed by wan_ip with their link attributes, in the
+        column order the joined queries used to return."""
+        snapshot = self._current()
+        by_link = snapshot.by_link if snapshot is not None else {}
+        enriched = []
+        for row in rows:
+            link = by_link.get((location, row["wan_ip"]), {})
+            enriched.append({
+                "location": location,
+                "wan_ip": row["wan_ip"],
+                **{name: link.get(name) for name in LINK_ATTRIBUTES},
+                **row
+            })
+        return enriched
+
+
+link_index = LinkIndex()
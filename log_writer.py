@@ -0,0 +1,86 @@
+import queue
+import threading
+from datetime import datetime
+from typing import Optional
+
+from database import create_access_log, create_access_logs_batch
+from metrics import registry
+
+FLUSH_INTERVAL_SECONDS = 0.5
+MAX_BATCH_SIZE = 500
+MAX_BUFFERED = 10000
+
+access_logs_written = registry.counter("access_log_rows_written_total", "Access log rows flushed to MySQL")
+access_logs_dropped = registry.counter("access_log_rows_dropped_total", "Access log rows dropped (buffer full or DB error)")
+access_log_buffer = registry.gauge("access_log_buffer_size", "Access log rows waiting to be flushed")
+
+
+class AccessLogWriter:
+    """Buffers access-log rows from the request path and writes them in batches
+    from a background thread. Until start() is called (or after stop()) rows are
+    written synchronously, so scripts keep working without a running app."""
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=MAX_BUFFERED)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, session_id, user_id, endpoint: str, method: str, status_code: int, wan_ip: str,
+               response_time_ms: Optional[int] = None, request_payload_size: Optional[int] = None,
+               response_payload_size: Optional[int] = None, target: Optional[str] = None):
+        if not self.running:
+            create_access_log(session_id, user_id, endpoint, method, status_code, wan_ip,
+                              response_time_ms, request_payload_size, response_payload_size, target)
+            return
+        try:
+            self._queue.put_nowait((session_id, user_id, endpoint, method, status_code, wan_ip,
+                                    response_time_ms, request_payload_size, response_payload_size,
+                                    target, datetime.now()))
+        except queue.Full:
+            access_logs_dropped.inc()
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop accepting rows and flush everything still buffered."""
+        if not self.running:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._flush(drain=True)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._stopping.wait(FLUSH_INTERVAL_SECONDS)
+            self._flush()
+
+    def _flush(self, drain: bool = False):
+        while True:
+            batch = []
+            try:
+                while len(batch) < MAX_BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            access_log_buffer.set(self._queue.qsize())
+            if not batch:
+                return
+            if create_access_logs_batch(batch):
+                access_logs_written.inc(len(batch))
+            else:
+                access_logs_dropped.inc(len(batch))
+            if len(batch) < MAX_BATCH_SIZE and not drain:
+                return
+
+
+access_log_writer = AccessLogWriter()
@@ -1,33 +1,163 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from anyio import to_thread
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from auth import create_access_token, get_current_user, verify_password
+from mysql.connector import Error
+from auth import create_access_token, get_current_user, verify_password, warm_up as warm_up_auth
 from database import (
     get_user_by_username,
     create_user,
     user_exists_in_db,
-    get_traffic_dashboard_by_location,
+    get_traffic_dashboard_by_wan_ips,
     get_traffic_by_time_range,
     create_session,
     close_session,
-    create_access_log
+    create_access_log,
+    init_pools,
+    close_pools,
+    pool_status,
+    set_hot_cache,
+    get_traffic_comparison_by_wan_ips,
+    get_top_link_utilisation,
+    get_access_request_rate,
+    get_access_error_breakdown,
+    get_access_top_clients,
+    get_traffic_rows_by_wan_ips,
+    UTILISATION_METRICS,
+    CONSISTENCY_BOUNDED,
+    QueryCancelled,
+    QueryTimeout
+)
+from models import (
+    UserRegister,
+    TrafficRequest,
+    TrafficBatchRequest,
+    TrafficDashboardFilter,
+    TrafficComparisonFilter,
+    TrafficRankingFilter,
+    TrafficAnomalyFilter,
+    CapacityForecastFilter,
+    AccessLogStatsFilter,
+    TrafficPercentileFilter,
+    TrafficHeatmapFilter,
+    TrafficGapFilter,
+    TrafficExportRequest,
+    SessionHistoryFilter,
+    UserActivityFilter
+)
+from rollups import comparison_window, day_window, parse_time, recent_hours_window, rollup_is_current
+from cache import TTLCache
+from ratelimit import RateLimiter, login_ip_limiter, login_user_limiter, register_ip_limiter
+from streaming import traffic_event_stream, poller as traffic_poller
+from log_writer import access_log_writer
+from analytics_pool import analytics_pool, AnalyticsBusy, AnalyticsTimeout
+from links import link_index
+from session_sweeper import session_sweeper
+from prewarm import prewarmer, LOCATION_SUMMARY, TRAFFIC_SUMMARY
+from traffic_decoder import MEDIA_TYPE as TRAFFIC_MEDIA_TYPE
+from heatmap import traffic_heatmap, HEATMAP_RESOLUTIONS
+from history import session_history, session_activity_report, wan_ip_activity_history, InvalidCursor
+from deadlines import query_deadline
+from admission import AdmissionGate, Overloaded, admission
+
+# NumPy/pyarrow-backed modules (anomaly, forecast, traffic_stats, export, gaps, latency,
+# traffic_binary, hotcache) are imported by the endpoints that use them and by warm_up(),
+# not here, so a new worker can start answering requests before they are loaded.
+from metrics import registry, http_requests, http_latency
+
+router = APIRouter()
+
+# Sync endpoints run in anyio's threadpool; keep it in step with DB_POOL_SIZE
+THREADPOOL_SIZE = int(os.getenv("APP_THREADPOOL_SIZE", "40"))
+
+worker_started = registry.gauge("worker_start_time_seconds", "Unix time the worker finished warm-up", ["pid"])
+worker_warmup = registry.gauge("worker_warmup_seconds", "Time the background warm-up took", ["pid"])
+
+# Read consistency hints: how many seconds of replica lag each endpoint tolerates.
+# Summary dashboards poll for the newest hour, location rollups span days.
+TRAFFIC_SUMMARY_MAX_LAG = 5
+LOCATION_SUMMARY_MAX_LAG = 60
+
+# Query deadlines in seconds (see deadlines.py): point lookups of one link, and
+# aggregates over a location, all links or the access-log counters
+POINT_QUERY_DEADLINE = float(os.getenv("POINT_QUERY_DEADLINE", "10"))
+AGGREGATE_QUERY_DEADLINE = float(os.getenv("AGGREGATE_QUERY_DEADLINE", "60"))
+
+# Admission control per endpoint class (see admission.py): concurrent requests,
+# queued requests and the longest a request may queue before it is shed. The
+# aggregate limit stays well below DB_POOL_SIZE so cheap requests always find a
+# free connection.
+auth_gate = AdmissionGate(
+    "auth",
+    concurrency=int(os.getenv("ADMISSION_AUTH_CONCURRENCY", "8")),
+    queue=int(os.getenv("ADMISSION_AUTH_QUEUE", "32")),
+    max_wait=2
+)
+point_gate = AdmissionGate(
+    "point",
+    concurrency=int(os.getenv("ADMISSION_POINT_CONCURRENCY", "16")),
+    queue=int(os.getenv("ADMISSION_POINT_QUEUE", "64")),
+    max_wait=2
+)
+aggregate_gate = AdmissionGate(
+    "aggregate",
+    concurrency=int(os.getenv("ADMISSION_AGGREGATE_CONCURRENCY", "4")),
+    queue=int(os.getenv("ADMISSION_AGGREGATE_QUEUE", "16")),
+    max_wait=10,
+    retry_after=5
 )
-from models import UserRegister, TrafficRequest, TrafficDashboardFilter
-
-app = FastAPI()
 
-@app.get("/")
+# Route dependencies per endpoint class: admission first, then the query deadline
+AUTH_ENDPOINT = [Depends(admission(auth_gate))]
+POINT_ENDPOINT = [Depends(admission(point_gate)), Depends(query_deadline(POINT_QUERY_DEADLINE))]
+AGGREGATE_ENDPOINT = [Depends(admission(aggregate_gate)), Depends(query_deadline(AGGREGATE_QUERY_DEADLINE))]
+# NumPy analytics, exports and index reports: their queries are not under a deadline
+ANALYTICS_ENDPOINT = [Depends(admission(aggregate_gate))]
+
+MAX_RANKING_LIMIT = 500
+MAX_BATCH_LINKS = 1000
+HEATMAP_DEFAULT_HOURS = 28 * 24
+GAP_REPORT_DEFAULT_HOURS = 30 * 24
+MAX_GAPS_LISTED = 1000
+ACCESS_LOG_BUCKETS = (1, 5, 15, 60, 1440)
+MAX_HISTORY_PAGE = 500
+MAX_REPORT_PAGE = 100
+MAX_ACTIVITIES_PER_SESSION = 200
+MAX_ACTIVITY_PAGE = 1000
+ranking_cache = TTLCache(maxsize=128, ttl=300)
+
+
+@router.get("/")
 def read_root():
     return {"message": "Data Traffic API", "version": "1.0"}
 
 
 # ------------------- MIDDLEWARE (ACCESS LOGGING) -------------------
 
-@app.middleware("http")
+def _content_length(headers) -> Optional[int]:
+    # Declared sizes only: bodies are never read or buffered to measure them
+    value = headers.get("content-length")
+    return int(value) if value and value.isdigit() else None
+
+
 async def log_requests(request: Request, call_next):
+    started = time.perf_counter()
     response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    endpoint = route.path if route else "unmatched"
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    http_latency.observe(elapsed, endpoint=endpoint)
 
     try:
-        if request.url.path in ["/login", "/register", "/logout", "/"]:
+        if request.url.path in ["/login", "/register", "/logout", "/", "/ready", "/metrics"]:
             return response
 
         auth_header = request.headers.get("Authorization")
@@ -41,13 +171,17 @@ async def log_requests(request: Request, call_next):
         user_id = payload.get("user_id")
 
         if session_id and user_id:
-            create_access_log(
+            access_log_writer.submit(
                 session_id=session_id,
                 user_id=user_id,
                 endpoint=request.url.path,
                 method=request.method,
                 status_code=response.status_code,
-                wan_ip=request.client.host
+                wan_ip=request.client.host,
+                response_time_ms=round(elapsed * 1000),
+                request_payload_size=_content_length(request.headers),
+                response_payload_size=_content_length(response.headers),
+                target=getattr(request.state, "access_target", None)
             )
     except Exception as e:
         print("Access log error:", e)
@@ -57,9 +191,22 @@ async def log_requests(request: Request, call_next):
 
 # ------------------- AUTH APIs -------------------
 
-@app.post("/register")
+def enforce_rate_limit(limiter: RateLimiter, key: str):
+    # Runs before any DB lookup, bcrypt check or access-log insert
+    allowed, retry_after = limiter.check(key)
+    if not allowed:
+        print(f"Rate limited ({limiter.name}):", key)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, please retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+@router.post("/register", dependencies=AUTH_ENDPOINT)
 def register(request: Request, user: UserRegister):
     wan_ip = request.client.host
+    enforce_rate_limit(register_ip_limiter, wan_ip)
 
     try:
         if len(user.username) < 3:
@@ -91,9 +238,12 @@ def register(request: Request, user: UserRegister):
         raise
 
 
-@app.post("/login")
+@router.post("/login", dependencies=AUTH_ENDPOINT)
 def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     wan_ip = request.client.host
+    enforce_rate_limit(login_ip_limiter, wan_ip)
+    enforce_rate_limit(login_user_limiter, form_data.username.lower())
+
     user = get_user_by_username(form_data.username)
 
     try:
@@ -124,7 +274,7 @@ def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
         raise
 
 
-@app.post("/logout")
+@router.post("/logout", dependencies=AUTH_ENDPOINT)
 def logout(current_user=Depends(get_current_user)):
     session_id = current_user.get("session_id")
     if session_id:
@@ -134,19 +284,36 @@ def logout(current_user=Depends(get_current_user)):
 
 # ------------------- BUSINESS APIs -------------------
 
-@app.post("/traffic/summary")
-def get_traffic_summary(data: TrafficRequest, user=Depends(get_current_user)):
+def wants_binary(request: Request) -> bool:
+    # Opt-in: JSON stays the default, also for */* and requests without Accept
+    return TRAFFIC_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+@router.post(TRAFFIC_SUMMARY, dependencies=POINT_ENDPOINT)
+def get_traffic_summary(request: Request, data: TrafficRequest, user=Depends(get_current_user)):
     if not data.wan_ip:
         raise HTTPException(status_code=400, detail="wan_ip is required")
 
     if not data.from_time or not data.to_time:
         raise HTTPException(status_code=400, detail="from_time and to_time are required")
 
-    rows, count = get_traffic_by_time_range(data.wan_ip, data.from_time, data.to_time)
+    request.state.access_target = data.wan_ip
+    warm = prewarmer.lookup(TRAFFIC_SUMMARY, data.wan_ip, data.from_time, data.to_time)
+    rows, count = warm or get_traffic_by_time_range(
+        data.wan_ip,
+        data.from_time,
+        data.to_time,
+        consistency=CONSISTENCY_BOUNDED,
+        max_lag=TRAFFIC_SUMMARY_MAX_LAG
+    )
 
     if rows is None:
         raise HTTPException(status_code=500, detail="Database error")
 
+    if wants_binary(request):
+        from traffic_binary import encode_rows, binary_response
+        return binary_response(*encode_rows(rows))
+
     return {
         "starting_time": data.from_time,
         "ending_time": data.to_time,
@@ -158,19 +325,59 @@ def get_traffic_summary(data: TrafficRequest, user=Depends(get_current_user)):
     }
 
 
-@app.post("/traffic/location-wanip-summary")
-def traffic_location_wanip_summary(filters: TrafficDashboardFilter, current_user=Depends(get_current_user)):
+@router.post("/traffic/summary/batch", dependencies=AGGREGATE_ENDPOINT)
+def get_traffic_summary_batch(request: Request, data: TrafficBatchRequest, user=Depends(get_current_user)):
+    wan_ips = resolve_wan_ips(data.location, data.wan_ips)
+    if len(wan_ips) > MAX_BATCH_LINKS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_BATCH_LINKS} WAN IPs per batch")
+
+    rows = get_traffic_rows_by_wan_ips(
+        wan_ips,
+        data.from_time,
+        data.to_time,
+        consistency=CONSISTENCY_BOUNDED,
+        max_lag=LOCATION_SUMMARY_MAX_LAG
+    )
+    if rows is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    if wants_binary(request):
+        from traffic_binary import encode_tuples, binary_response
+        return binary_response(*encode_tuples(rows))
+
+    columns = ("wan_ip", "time_hour", "in_avg", "out_avg", "in_max", "out_max")
+    return {
+        "from_time": data.from_time,
+        "to_time": data.to_time,
+        "links": len(wan_ips),
+        "total_records": len(rows),
+        "data": [dict(zip(columns, row)) for row in rows]
+    }
+
+
+@router.post(LOCATION_SUMMARY, dependencies=AGGREGATE_ENDPOINT)
+def traffic_location_wanip_summary(request: Request, filters: TrafficDashboardFilter,
+                                   current_user=Depends(get_current_user)):
     if not filters.location:
         raise HTTPException(status_code=400, detail="location is required")
 
     if not filters.from_time or not filters.to_time:
         raise HTTPException(status_code=400, detail="from_time and to_time are required")
 
-    data = get_traffic_dashboard_by_location(
-        filters.location,
-        filters.from_time,
-        filters.to_time
-    )
+    request.state.access_target = filters.location
+    data = prewarmer.lookup(LOCATION_SUMMARY, filters.location, filters.from_time, filters.to_time)
+    if data is None:
+        wan_ips = link_index.wan_ips(filters.location)
+        if wan_ips is None:
+            raise HTTPException(status_code=500, detail="Database error")
+
+        data = get_traffic_dashboard_by_wan_ips(
+            wan_ips,
+            filters.from_time,
+            filters.to_time,
+            consistency=CONSISTENCY_BOUNDED,
+            max_lag=LOCATION_SUMMARY_MAX_LAG
+        )
 
     if not data:
         return {
@@ -186,5 +393,620 @@ def traffic_location_wanip_summary(filters: TrafficDashboardFilter, current_user
         "from_time": filters.from_time,
         "to_time": filters.to_time,
         "total_records": len(data),
+        "summary": link_index.enrich(data, filters.location)
+    }
+
+
+@router.post("/traffic/location-wanip-comparison", dependencies=AGGREGATE_ENDPOINT)
+def traffic_location_wanip_comparison(filters: TrafficComparisonFilter, current_user=Depends(get_current_user)):
+    if not filters.location:
+        raise HTTPException(status_code=400, detail="location is required")
+
+    if not filters.from_time or not filters.to_time:
+        raise HTTPException(status_code=400, detail="from_time and to_time are required")
+
+    try:
+        if filters.compare_from_time and filters.compare_to_time:
+            previous = (filters.compare_from_time, filters.compare_to_time)
+        else:
+            previous = comparison_window(filters.from_time, filters.to_time, filters.period or "previous")
+        current = (filters.from_time, filters.to_time)
+        current_days = day_window(*current)
+        previous_days = day_window(*previous)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    baseline = previous
+
+    # Whole-day windows are answered from traffic_daily_rollup while it is up to date
+    source = "raw"
+    if current_days and previous_days and rollup_is_current():
+        source = "rollup"
+        current, previous = current_days, previous_days
+
+    wan_ips = link_index.wan_ips(filters.location)
+    if wan_ips is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    data = get_traffic_comparison_by_wan_ips(
+        wan_ips,
+        current,
+        previous,
+        source=source,
+        consistency=CONSISTENCY_BOUNDED,
+        max_lag=LOCATION_SUMMARY_MAX_LAG
+    )
+
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "location": filters.location,
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "compare_from_time": baseline[0],
+        "compare_to_time": baseline[1],
+        "source": source,
+        "total_records": len(data),
+        "summary": link_index.enrich(data, filters.location)
+    }
+
+
+@router.post("/traffic/top-links", dependencies=AGGREGATE_ENDPOINT)
+def traffic_top_links(filters: TrafficRankingFilter, current_user=Depends(get_current_user)):
+    if filters.metric not in UTILISATION_METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {sorted(UTILISATION_METRICS)}")
+
+    if not 1 <= filters.limit <= MAX_RANKING_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_RANKING_LIMIT}")
+
+    if filters.from_time and filters.to_time:
+        window = (filters.from_time, filters.to_time)
+    elif filters.from_time or filters.to_time:
+        raise HTTPException(status_code=400, detail="from_time and to_time must be given together")
+    else:
+        window = recent_hours_window(24)
+
+    try:
+        days = day_window(*window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    source = "rollup" if days and rollup_is_current() else "raw"
+    key = (str(window[0]), str(window[1]), filters.limit, filters.metric, source)
+
+    data = ranking_cache.get_or_compute(
+        key,
+        lambda: get_top_link_utilisation(
+            *(days if source == "rollup" else window),
+            limit=filters.limit,
+            metric=filters.metric,
+            source=source,
+            consistency=CONSISTENCY_BOUNDED,
+            max_lag=LOCATION_SUMMARY_MAX_LAG
+        )
+    )
+
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "from_time": window[0],
+        "to_time": window[1],
+        "metric": filters.metric,
+        "source": source,
+        "total_records": len(data),
+        "ranking": data
+    }
+
+
+def resolve_wan_ips(location: Optional[str], wan_ips: Optional[List[str]]) -> List[str]:
+    selected = list(wan_ips or [])
+    if location:
+        location_ips = link_index.wan_ips(location)
+        if location_ips is None:
+            raise HTTPException(status_code=500, detail="Database error")
+        selected.extend(location_ips)
+    if not selected:
+        raise HTTPException(status_code=400, detail="wan_ips or location is required")
+    return list(dict.fromkeys(selected))
+
+
+@router.post("/traffic/anomalies", dependencies=ANALYTICS_ENDPOINT)
+def traffic_anomalies(filters: TrafficAnomalyFilter, current_user=Depends(get_current_user)):
+    wan_ips = resolve_wan_ips(filters.location, filters.wan_ips)
+
+    try:
+        if filters.from_time and filters.to_time:
+            window = (parse_time(filters.from_time), parse_time(filters.to_time))
+        else:
+            window = recent_hours_window(24)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    from anomaly import detector as anomaly_detector, Z_THRESHOLD, MIN_Z_THRESHOLD
+
+    threshold = Z_THRESHOLD if filters.threshold is None else filters.threshold
+    if threshold < MIN_Z_THRESHOLD:
+        raise HTTPException(status_code=400, detail=f"threshold must be at least {MIN_Z_THRESHOLD}")
+
+    # Baselines are updated in the background; new links are picked up on its next pass
+    pending = anomaly_detector.track(wan_ips)
+
+    anomalies = anomaly_detector.anomalies(
+        wan_ips,
+        from_time=window[0],
+        to_time=window[1],
+        threshold=threshold
+    )
+
+    return {
+        "location": filters.location,
+        "from_time": window[0],
+        "to_time": window[1],
+        "links_checked": len(wan_ips),
+        "baselines_pending": pending,
+        "total_records": len(anomalies),
+        "anomalies": anomalies
+    }
+
+
+@router.post("/traffic/capacity-forecast", dependencies=ANALYTICS_ENDPOINT)
+def traffic_capacity_forecast(filters: CapacityForecastFilter, current_user=Depends(get_current_user)):
+    if not filters.location:
+        raise HTTPException(status_code=400, detail="location is required")
+
+    links = link_index.links(filters.location)
+    if links is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    if filters.wan_ips:
+        selected = set(filters.wan_ips)
+        links = [link for link in links if link["wan_ip"] in selected]
+
+    from forecast import forecaster, CAPACITY_THRESHOLD
+
+    data = forecaster.forecast(links)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "location": filters.location,
+        "threshold": CAPACITY_THRESHOLD,
+        "total_records": len(data),
+        "forecast": data
+    }
+
+
+@router.post("/traffic/percentiles", dependencies=ANALYTICS_ENDPOINT)
+def traffic_link_percentiles(filters: TrafficPercentileFilter, current_user=Depends(get_current_user)):
+    from traffic_stats import traffic_percentiles, DEFAULT_PERCENTILES
+
+    wan_ips = resolve_wan_ips(filters.location, filters.wan_ips)
+
+    quantiles = tuple(filters.percentiles or DEFAULT_PERCENTILES)
+    if not all(0 <= q <= 100 for q in quantiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    data = traffic_percentiles(wan_ips, filters.from_time, filters.to_time, quantiles)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "location": filters.location,
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "percentiles": quantiles,
+        "total_records": len(data),
         "summary": data
     }
+
+
+@router.post("/traffic/heatmap", dependencies=AGGREGATE_ENDPOINT)
+def traffic_heatmap_matrix(filters: TrafficHeatmapFilter, current_user=Depends(get_current_user)):
+    if filters.resolution not in HEATMAP_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(HEATMAP_RESOLUTIONS)}")
+
+    wan_ips = resolve_wan_ips(filters.location, filters.wan_ips)
+
+    if filters.from_time and filters.to_time:
+        window = (filters.from_time, filters.to_time)
+    elif filters.from_time or filters.to_time:
+        raise HTTPException(status_code=400, detail="from_time and to_time must be given together")
+    else:
+        window = recent_hours_window(HEATMAP_DEFAULT_HOURS)
+
+    try:
+        data = traffic_heatmap(wan_ips, *window, resolution=filters.resolution, max_lag=LOCATION_SUMMARY_MAX_LAG)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "location": filters.location,
+        "wan_ips": wan_ips,
+        "from_time": window[0],
+        "to_time": window[1],
+        "resolution": filters.resolution,
+        **data
+    }
+
+
+@router.post("/traffic/gaps", dependencies=ANALYTICS_ENDPOINT)
+def traffic_gaps(filters: TrafficGapFilter, current_user=Depends(get_current_user)):
+    from gaps import gap_report, gap_index_is_current
+
+    if not 0 <= filters.max_gaps <= MAX_GAPS_LISTED:
+        raise HTTPException(status_code=400, detail=f"max_gaps must be between 0 and {MAX_GAPS_LISTED}")
+
+    wan_ips = resolve_wan_ips(filters.location, filters.wan_ips)
+
+    try:
+        if filters.from_time and filters.to_time:
+            window = (parse_time(filters.from_time), parse_time(filters.to_time))
+        elif filters.from_time or filters.to_time:
+            raise HTTPException(status_code=400, detail="from_time and to_time must be given together")
+        else:
+            window = recent_hours_window(GAP_REPORT_DEFAULT_HOURS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    report = gap_report(wan_ips, *window, max_gaps=filters.max_gaps)
+    if report is None:
+        raise HTTPException(status_code=500, detail="Database error")
+    if report["indexed_through"] is None:
+        raise HTTPException(status_code=503, detail="Gap index not built yet, run python gaps.py")
+
+    return {
+        "location": filters.location,
+        "from_time": window[0],
+        "to_time": window[1],
+        "indexed_through": report["indexed_through"],
+        "index_current": gap_index_is_current(report["indexed_through"]),
+        "head_hour": report["head_hour"],
+        "coverage": report["total"],
+        "total_records": len(report["links"]),
+        "links": report["links"]
+    }
+
+
+@router.post("/traffic/export", dependencies=ANALYTICS_ENDPOINT)
+def traffic_export(request: TrafficExportRequest, current_user=Depends(get_current_user)):
+    from export import stream_export, EXPORT_FORMATS
+
+    if request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_FORMATS)}")
+
+    wan_ips = resolve_wan_ips(request.location, request.wan_ips)
+    extension = "arrows" if request.format == "arrow" else "parquet"
+
+    try:
+        chunks = stream_export(wan_ips, request.from_time, request.to_time, request.format)
+    except Error as e:
+        print("DB error in traffic_export:", e)
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[request.format],
+        headers={"Content-Disposition": f'attachment; filename="traffic.{extension}"'}
+    )
+
+
+@router.get("/locations")
+def list_locations(current_user=Depends(get_current_user)):
+    data = link_index.locations()
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "total_records": len(data),
+        "locations": data
+    }
+
+
+@router.get("/traffic/stream")
+def traffic_stream(
+    request: Request,
+    wan_ip: Optional[List[str]] = Query(None),
+    location: Optional[str] = None,
+    current_user=Depends(get_current_user)
+):
+    wan_ips = set(wan_ip or [])
+
+    if location:
+        location_ips = link_index.wan_ips(location)
+        if location_ips is None:
+            raise HTTPException(status_code=500, detail="Database error")
+        wan_ips.update(location_ips)
+
+    if not wan_ips:
+        raise HTTPException(status_code=400, detail="wan_ip or location is required")
+
+    return StreamingResponse(
+        traffic_event_stream(request, sorted(wan_ips)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# ------------------- SESSION HISTORY -------------------
+
+def _check_history_filter(filters: SessionHistoryFilter, max_limit: int):
+    if not 1 <= filters.limit <= max_limit:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {max_limit}")
+
+
+@router.post("/sessions/history", dependencies=POINT_ENDPOINT)
+def sessions_history(filters: SessionHistoryFilter, current_user=Depends(get_current_user)):
+    _check_history_filter(filters, MAX_HISTORY_PAGE)
+    try:
+        data = session_history(filters.username, filters.wan_ip, filters.from_time, filters.to_time,
+                               filters.cursor, filters.limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "username": filters.username,
+        "wan_ip": filters.wan_ip,
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "total_records": len(data["sessions"]),
+        **data
+    }
+
+
+@router.post("/sessions/activity-report", dependencies=AGGREGATE_ENDPOINT)
+def sessions_activity_report(filters: SessionHistoryFilter, current_user=Depends(get_current_user)):
+    _check_history_filter(filters, MAX_REPORT_PAGE)
+    try:
+        data = session_activity_report(filters.username, filters.wan_ip, filters.from_time, filters.to_time,
+                                       filters.cursor, filters.limit, MAX_ACTIVITIES_PER_SESSION)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "username": filters.username,
+        "wan_ip": filters.wan_ip,
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "total_records": len(data["sessions"]),
+        **data
+    }
+
+
+@router.post("/user/activity-history", dependencies=AGGREGATE_ENDPOINT)
+def user_activity_history(filters: UserActivityFilter, current_user=Depends(get_current_user)):
+    if not 1 <= filters.limit <= MAX_ACTIVITY_PAGE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_ACTIVITY_PAGE}")
+
+    try:
+        data = wan_ip_activity_history(filters.wan_ip, filters.from_time, filters.to_time,
+                                       filters.cursor, filters.limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    counts = data["endpoint_counts"]
+    return {
+        "wan_ip": filters.wan_ip,
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "total_requests": sum(row["requests"] for row in counts) if counts is not None else None,
+        "total_records": len(data["activities"]),
+        **data
+    }
+
+
+# ------------------- ACCESS LOG ANALYTICS -------------------
+
+@router.post("/access-logs/request-rate", dependencies=AGGREGATE_ENDPOINT)
+def access_log_request_rate(filters: AccessLogStatsFilter, current_user=Depends(get_current_user)):
+    if filters.bucket_minutes not in ACCESS_LOG_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket_minutes must be one of {list(ACCESS_LOG_BUCKETS)}")
+
+    data = get_access_request_rate(filters.from_time, filters.to_time, filters.bucket_minutes, filters.endpoint)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    total_requests = sum(int(row["requests"]) for row in data)
+    total_errors = sum(int(row["errors"]) for row in data)
+
+    return {
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "endpoint": filters.endpoint,
+        "bucket_minutes": filters.bucket_minutes,
+        "total_requests": total_requests,
+        "error_rate": round(total_errors / total_requests, 4) if total_requests else 0,
+        "series": data
+    }
+
+
+@router.post("/access-logs/errors", dependencies=AGGREGATE_ENDPOINT)
+def access_log_errors(filters: AccessLogStatsFilter, current_user=Depends(get_current_user)):
+    data = get_access_error_breakdown(filters.from_time, filters.to_time)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "total_records": len(data),
+        "breakdown": data
+    }
+
+
+@router.post("/access-logs/top-clients", dependencies=AGGREGATE_ENDPOINT)
+def access_log_top_clients(filters: AccessLogStatsFilter, current_user=Depends(get_current_user)):
+    if not 1 <= filters.limit <= MAX_RANKING_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_RANKING_LIMIT}")
+
+    data = get_access_top_clients(filters.from_time, filters.to_time, filters.limit)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "total_records": len(data),
+        "clients": data
+    }
+
+
+@router.post("/access-logs/latency", dependencies=AGGREGATE_ENDPOINT)
+def access_log_latency(filters: AccessLogStatsFilter, current_user=Depends(get_current_user)):
+    from latency import latency_report, DEFAULT_LATENCY_PERCENTILES
+
+    if not 1 <= filters.limit <= MAX_RANKING_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_RANKING_LIMIT}")
+
+    data = latency_report(filters.from_time, filters.to_time, filters.endpoint, filters.limit)
+    if data is None:
+        raise HTTPException(status_code=500, detail="Database error")
+
+    return {
+        "from_time": filters.from_time,
+        "to_time": filters.to_time,
+        "endpoint": filters.endpoint,
+        "percentiles": DEFAULT_LATENCY_PERCENTILES,
+        "total_requests": sum(row["requests"] for row in data["endpoints"]),
+        **data
+    }
+
+
+@router.get("/cache/prewarm")
+def cache_prewarm_status(current_user=Depends(get_current_user)):
+    return prewarmer.status()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return registry.render()
+
+
+# ------------------- APPLICATION -------------------
+
+# Set by warm_up(), which runs in the background after start-up
+warm_state = {"done": False, "hot_cache": None, "anomaly_detector": None}
+
+
+@router.get("/ready")
+def ready():
+    if warm_state["done"]:
+        # Retry what failed during warm-up, e.g. MySQL came up after the worker
+        if not pool_status():
+            init_pools()
+        if not link_index.loaded:
+            link_index.refresh()
+
+    hot_cache = warm_state["hot_cache"]
+    components = {
+        "warmed_up": warm_state["done"],
+        "pools": bool(pool_status()),
+        "link_index": link_index.loaded,
+        "hot_cache": hot_cache.status()["ready"] if hot_cache else warm_state["done"]
+    }
+    body = {"ready": all(components.values()), "components": components}
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "1"})
+    return body
+
+
+def warm_up():
+    """Build pools and caches and load heavy dependencies while the worker
+    already serves requests (which meanwhile use direct connections)."""
+    started = time.perf_counter()
+    init_pools()
+    link_index.refresh()
+    warm_up_auth()
+    session_sweeper.start()
+    prewarmer.start()
+
+    import anomaly, forecast, traffic_stats, export, gaps, latency, traffic_binary  # noqa: F401,E401
+    analytics_pool.start()
+    anomaly.detector.start()
+    warm_state["anomaly_detector"] = anomaly.detector
+
+    from hotcache import hot_cache, HOTCACHE_DIR
+    if HOTCACHE_DIR:
+        set_hot_cache(hot_cache)
+        hot_cache.start()
+        warm_state["hot_cache"] = hot_cache
+
+    warm_state["done"] = True
+    worker_warmup.set(time.perf_counter() - started, pid=os.getpid())
+    worker_started.set(time.time(), pid=os.getpid())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process, after any fork
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    ranking_cache.clear()
+    access_log_writer.start()
+    warming = asyncio.create_task(run_in_threadpool(warm_up))
+    try:
+        yield
+    finally:
+        traffic_poller.stop()
+        try:
+            await warming
+        except Exception as e:
+            print("Warm-up error:", e)
+        await run_in_threadpool(session_sweeper.stop)
+        await run_in_threadpool(prewarmer.stop)
+        if warm_state["hot_cache"]:
+            await run_in_threadpool(warm_state["hot_cache"].stop)
+            set_hot_cache(None)
+        if warm_state["anomaly_detector"]:
+            await run_in_threadpool(warm_state["anomaly_detector"].stop)
+        await run_in_threadpool(analytics_pool.shutdown)
+        await run_in_threadpool(access_log_writer.stop)
+        await run_in_threadpool(close_pools)
+        warm_state.update(done=False, hot_cache=None, anomaly_detector=None)
+
+
+async def analytics_busy_handler(request: Request, exc: AnalyticsBusy):
+    return JSONResponse(status_code=503, content={"detail": "Analytics service busy, please retry later"},
+                        headers={"Retry-After": "5"})
+
+
+async def analytics_timeout_handler(request: Request, exc: AnalyticsTimeout):
+    return JSONResponse(status_code=504, content={"detail": "Analytics computation timed out"})
+
+
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=503, content={"detail": f"Server busy ({exc.endpoint_class}), please retry later"},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+async def query_timeout_handler(request: Request, exc: QueryTimeout):
+    return JSONResponse(status_code=504, content={"detail": f"{exc}, narrow the time range or retry later"})
+
+
+async def query_cancelled_handler(request: Request, exc: QueryCancelled):
+    # The client is gone; 499 (client closed request) only shows up in logs and metrics
+    return JSONResponse(status_code=499, content={"detail": "Client disconnected, query cancelled"})
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="Data Traffic API", version="1.0", lifespan=lifespan)
+    app.include_router(router)
+    app.add_exception_handler(AnalyticsBusy, analytics_busy_handler)
+    app.add_exception_handler(AnalyticsTimeout, analytics_timeout_handler)
+    app.add_exception_handler(Overloaded, overloaded_handler)
+    app.add_exception_handler(QueryTimeout, query_timeout_handler)
+    app.add_exception_handler(QueryCancelled, query_cancelled_handler)
+    app.middleware("http")(log_requests)
+    return app
+
+
+app = create_app()
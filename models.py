@@ -31,6 +31,8 @@ class UserActivityFilter(BaseModel):
     wan_ip: str
     from_time: Optional[str] = None
     to_time: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: int = 100
 
 
 class TrafficSummaryRequest(BaseModel):
@@ -45,6 +47,13 @@ class TrafficRequest(BaseModel):
     to_time: str
 
 
+class TrafficBatchRequest(BaseModel):
+    location: Optional[str] = None
+    wan_ips: Optional[List[str]] = None
+    from_time: str
+    to_time: str
+
+
 class TrafficData(BaseModel):
     ky: Optional[str] = None
     loo_bck: Optional[str] = None
@@ -65,6 +74,64 @@ class TrafficDashboardFilter(BaseModel):
     to_time: str
 
 
+class TrafficComparisonFilter(TrafficDashboardFilter):
+    period: Optional[str] = "previous"  # "previous" or "previous_year"
+    compare_from_time: Optional[str] = None
+    compare_to_time: Optional[str] = None
+
+
+class TrafficRankingFilter(BaseModel):
+    from_time: Optional[str] = None  # defaults to the last 24 hours
+    to_time: Optional[str] = None
+    limit: int = 20
+    metric: str = "peak"  # "peak" or "avg"
+
+
+class TrafficAnomalyFilter(BaseModel):
+    location: Optional[str] = None
+    wan_ips: Optional[List[str]] = None
+    from_time: Optional[str] = None  # defaults to the last 24 hours
+    to_time: Optional[str] = None
+    threshold: Optional[float] = None  # minimum |z-score|, default 3.0, at least 2.0
+
+
+class CapacityForecastFilter(BaseModel):
+    location: str
+    wan_ips: Optional[List[str]] = None  # restrict to these links of the location
+
+
+class TrafficPercentileFilter(BaseModel):
+    location: Optional[str] = None
+    wan_ips: Optional[List[str]] = None
+    from_time: str
+    to_time: str
+    percentiles: Optional[List[float]] = None  # default 50, 95, 99
+
+
+class TrafficHeatmapFilter(BaseModel):
+    location: Optional[str] = None
+    wan_ips: Optional[List[str]] = None
+    from_time: Optional[str] = None  # defaults to the last 4 weeks
+    to_time: Optional[str] = None
+    resolution: str = "hour"  # "hour" (7 x 24) or "day" (7 weekdays)
+
+
+class TrafficGapFilter(BaseModel):
+    location: Optional[str] = None
+    wan_ips: Optional[List[str]] = None
+    from_time: Optional[str] = None  # defaults to the last 30 days
+    to_time: Optional[str] = None
+    max_gaps: int = 50  # most recent gaps listed per link
+
+
+class TrafficExportRequest(BaseModel):
+    location: Optional[str] = None
+    wan_ips: Optional[List[str]] = None
+    from_time: str
+    to_time: str
+    format: str = "arrow"  # "arrow" (IPC stream) or "parquet"
+
+
 class TrafficSummary(BaseModel):
     wan_ip: str
     in_avg: Optional[float] = None
@@ -73,6 +140,23 @@ class TrafficSummary(BaseModel):
     out_max: Optional[float] = None
 
 
+class AccessLogStatsFilter(BaseModel):
+    from_time: str
+    to_time: str
+    endpoint: Optional[str] = None
+    bucket_minutes: int = 1
+    limit: int = 20
+
+
+class SessionHistoryFilter(BaseModel):
+    username: Optional[str] = None
+    wan_ip: Optional[str] = None
+    from_time: Optional[str] = None
+    to_time: Optional[str] = None
+    cursor: Optional[str] = None
+    limit: int = 50
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -107,6 +191,7 @@ class ActivityLog(BaseModel):
     timestamp: datetime
     status_code: Optional[int] = None
     request_payload_size: Optional[int] = None
+    response_payload_size: Optional[int] = None
     response_time_ms: Optional[int] = None
     created_at: Optional[datetime] = None
 
@@ -0,0 +1,321 @@
+"""
+Popularity-driven pre-warming of the dashboard queries.
+
+The locations and WAN IPs most requested over the last PREWARM_LOOKBACK_HOURS
+are read from access_logs.target (see prewarm.sql). For each of them, the
+location summary and the traffic summary are computed for the standard
+windows: the last 24 hours, 7 days and 30 days, ending with the current hour.
+A pass runs whenever new traffic lands and whenever the hour rolls over (which
+moves the windows), so the morning's first dashboard load finds them ready.
+Database time is budgeted over a rolling window: once the pre-warmer has spent
+its share of PREWARM_DB_BUDGET_SECONDS in the last PREWARM_BUDGET_WINDOW_SECONDS,
+passes stop early until older work ages out, however often traffic lands.
+
+Every worker warms its own in-memory cache, so the budget is for the whole
+host and each of the APP_WORKERS workers (serve.py sets it) gets an equal
+share. The popular targets are re-read every PREWARM_TARGETS_SECONDS rather
+than on every pass, so their scan does not repeat per pass and worker.
+
+A request is answered from the cache when its window covers the same hourly
+slots as a standard window. Landing traffic drops the entries of the links it
+touched whose windows contain its hours, before the pass that replaces them,
+so answers are at most PREWARM_POLL_SECONDS behind the table. Only the
+pre-warmer fills the cache, and each worker warms its own.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from cache import TTLCache
+from database import (
+    get_latest_traffic_insert_time,
+    get_popular_access_targets,
+    get_traffic_hours_inserted_between,
+    get_traffic_by_time_range,
+    get_traffic_dashboard_by_wan_ips,
+    CONSISTENCY_BOUNDED
+)
+from links import link_index
+from metrics import registry
+from rollups import parse_time
+from timeutil import HOUR
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_POLL_SECONDS = float(os.getenv("PREWARM_POLL_SECONDS", "5"))
+PREWARM_LOOKBACK_HOURS = int(os.getenv("PREWARM_LOOKBACK_HOURS", str(7 * 24)))
+PREWARM_TOP_LOCATIONS = int(os.getenv("PREWARM_TOP_LOCATIONS", "10"))
+PREWARM_TOP_WAN_IPS = int(os.getenv("PREWARM_TOP_WAN_IPS", "50"))
+PREWARM_DB_BUDGET_SECONDS = float(os.getenv("PREWARM_DB_BUDGET_SECONDS", "20"))
+PREWARM_BUDGET_WINDOW_SECONDS = float(os.getenv("PREWARM_BUDGET_WINDOW_SECONDS", "60"))
+PREWARM_TARGETS_SECONDS = float(os.getenv("PREWARM_TARGETS_SECONDS", "300"))
+# Workers sharing the host budget; serve.py exports its --workers, set it for gunicorn
+APP_WORKERS = max(1, int(os.getenv("APP_WORKERS", "1")))
+# Local hours in which passes run, e.g. "6-20" or "22-6"; landing traffic still invalidates outside them
+PREWARM_HOURS = os.getenv("PREWARM_HOURS", "0-23")
+PREWARM_MAX_LAG = 0   # warm from the primary or an up-to-date replica only
+
+STANDARD_WINDOWS = {"24h": 24, "7d": 7 * 24, "30d": 30 * 24}
+LOCATION_SUMMARY = "/traffic/location-wanip-summary"
+TRAFFIC_SUMMARY = "/traffic/summary"
+
+prewarm_runs = registry.counter("prewarm_runs_total", "Pre-warm passes", ["trigger"])
+prewarm_entries = registry.counter("prewarm_entries_total", "Dashboard results computed by the pre-warmer", ["endpoint"])
+prewarm_db_seconds = registry.histogram("prewarm_db_seconds", "Database time spent per pre-warm pass")
+prewarm_invalidated = registry.counter("prewarm_invalidated_total",
+                                       "Pre-warmed results dropped because traffic landed in their window")
+prewarm_budget_exhausted = registry.counter("prewarm_budget_exhausted_total",
+                                            "Pre-warm passes stopped by PREWARM_DB_BUDGET_SECONDS "
+                                            "per PREWARM_BUDGET_WINDOW_SECONDS")
+warm_requests = registry.counter("prewarm_requests_total",
+                                 "Dashboard requests by outcome: warm (served from the pre-warmed cache), "
+                                 "cold (standard window, not warmed) or other (non-standard window)",
+                                 ["endpoint", "outcome"])
+
+
+def _parse_hours(spec: str) -> set:
+    """Hours of a "first-last" range, inclusive, or of a single "hour". A range
+    may wrap past midnight: "22-6" is 22:00 through 06:59."""
+    first, _, last = spec.partition("-")
+    try:
+        first, last = int(first), int(last or first)
+    except ValueError:
+        raise ValueError(f"invalid hour range {spec!r}, expected e.g. 6-20") from None
+    if not (0 <= first <= 23 and 0 <= last <= 23):
+        raise ValueError(f"invalid hour range {spec!r}, hours must be 0-23")
+    if first <= last:
+        return set(range(first, last + 1))
+    return set(range(first, 24)) | set(range(0, last + 1))
+
+
+def _floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil_hour(value: datetime) -> datetime:
+    floor = _floor_hour(value)
+    return floor if floor == value else floor + HOUR
+
+
+def standard_window(from_time, to_time, now: Optional[datetime] = None) -> Optional[Tuple[str, datetime]]:
+    """(label, current hour) when [from_time, to_time] covers exactly the hourly
+    slots of a standard window ending with the current hour, else None."""
+    try:
+        first, last = _ceil_hour(parse_time(from_time)), _floor_hour(parse_time(to_time))
+    except ValueError:
+        return None
+    hour = _floor_hour(now or datetime.now())
+    if last != hour:
+        return None
+    for label, hours in STANDARD_WINDOWS.items():
+        if first == hour - (hours - 1) * HOUR:
+            return label, hour
+    return None
+
+
+class Prewarmer:
+    def __init__(self, poll_interval: float = PREWARM_POLL_SECONDS):
+        self.poll_interval = poll_interval
+        self.cache = TTLCache(maxsize=2 * len(STANDARD_WINDOWS) * (PREWARM_TOP_LOCATIONS + PREWARM_TOP_WAN_IPS),
+                              ttl=2 * 3600)
+        self.active_hours = _parse_hours(PREWARM_HOURS)
+        self.last_run: Optional[dict] = None
+        self._watermark = None
+        self._warmed_hour: Optional[datetime] = None
+        self._db_work: deque = deque()   # (finished, seconds) of recent database calls
+        self._targets: List[Tuple[str, str]] = []
+        self._targets_read: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # ---- request path ----
+
+    def lookup(self, endpoint: str, target: str, from_time, to_time):
+        """The pre-warmed result for this request, or None."""
+        window = standard_window(from_time, to_time)
+        if window is None:
+            warm_requests.inc(endpoint=endpoint, outcome="other")
+            return None
+        value = self.cache.get((endpoint, target, *window))
+        warm_requests.inc(endpoint=endpoint, outcome="cold" if value is None else "warm")
+        return value
+
+    # ---- warming ----
+
+    def _timed(self, fn, *args):
+        started = time.monotonic()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.monotonic()
+            self._db_work.append((finished, finished - started))
+
+    def budget_used(self, now: Optional[float] = None) -> float:
+        """Database seconds spent in the last PREWARM_BUDGET_WINDOW_SECONDS."""
+        horizon = (time.monotonic() if now is None else now) - PREWARM_BUDGET_WINDOW_SECONDS
+        while self._db_work and self._db_work[0][0] <= horizon:
+            self._db_work.popleft()
+        return sum(seconds for _, seconds in self._db_work)
+
+    def _popular(self, endpoint: str, limit: int) -> List[str]:
+        if limit <= 0:
+            return []
+        since = datetime.now() - timedelta(hours=PREWARM_LOOKBACK_HOURS)
+        rows = get_popular_access_targets(endpoint, since, limit)
+        return [row[0] for row in rows or []]
+
+    def _compute(self, endpoint: str, target: str, first: datetime, last: datetime):
+        if endpoint == TRAFFIC_SUMMARY:
+            rows, count = get_traffic_by_time_range(target, first, last, consistency=CONSISTENCY_BOUNDED,
+                                                    max_lag=PREWARM_MAX_LAG)
+            return None if rows is None else (rows, count)
+        wan_ips = link_index.wan_ips(target)
+        if wan_ips is None:
+            return None
+        return get_traffic_dashboard_by_wan_ips(wan_ips, first, last, consistency=CONSISTENCY_BOUNDED,
+                                                max_lag=PREWARM_MAX_LAG)
+
+    def _popular_targets(self) -> List[Tuple[str, str]]:
+        now = time.monotonic()
+        if self._targets_read is None or now - self._targets_read >= PREWARM_TARGETS_SECONDS:
+            targets = [(LOCATION_SUMMARY, t)
+                       for t in self._timed(self._popular, LOCATION_SUMMARY, PREWARM_TOP_LOCATIONS)]
+            targets += [(TRAFFIC_SUMMARY, t)
+                        for t in self._timed(self._popular, TRAFFIC_SUMMARY, PREWARM_TOP_WAN_IPS)]
+            self._targets, self._targets_read = targets, now
+        return self._targets
+
+    def warm(self, trigger: str = "manual", budget: float = PREWARM_DB_BUDGET_SECONDS / APP_WORKERS) -> dict:
+        """One pass over the standard windows, shortest first, most requested
+        targets first within each; stops once ``budget`` seconds of database
+        time have been spent in the last PREWARM_BUDGET_WINDOW_SECONDS, by this
+        pass and the ones before it."""
+        started = time.monotonic()
+        hour = _floor_hour(datetime.now())
+        targets = []
+        exhausted = self.budget_used(started) >= budget
+        if not exhausted:
+            targets = self._popular_targets()
+
+        warmed, failed = 0, 0
+        for label, hours in STANDARD_WINDOWS.items():
+            first = hour - (hours - 1) * HOUR
+            for endpoint, target in targets:
+                if self._stop.is_set():
+                    break
+                key = (endpoint, target, label, hour)
+                if self.cache.get(key) is not None:
+                    continue
+                if self.budget_used() >= budget:
+                    exhausted = True
+                    break
+                value = self._timed(self._compute, endpoint, target, first, hour)
+                if value is None:
+                    failed += 1
+                    continue
+                self.cache.set(key, value)
+                prewarm_entries.inc(endpoint=endpoint)
+                warmed += 1
+            if exhausted:
+                break
+
+        spent = sum(seconds for finished, seconds in self._db_work if finished > started)
+        prewarm_runs.inc(trigger=trigger)
+        prewarm_db_seconds.observe(spent)
+        if exhausted:
+            prewarm_budget_exhausted.inc()
+        if not exhausted:
+            # An hour pass cut short is retried on the next poll
+            self._warmed_hour = hour
+        self.last_run = {
+            "trigger": trigger,
+            "finished_at": datetime.now(),
+            "hour": hour,
+            "targets": len(targets),
+            "warmed": warmed,
+            "failed": failed,
+            "db_seconds": round(spent, 3),
+            "budget_exhausted": exhausted
+        }
+        return self.last_run
+
+    def invalidate(self, after, until) -> int:
+        """Drop the entries whose window holds hours of links that received rows
+        with insert_time in (after, until]; everything when that can't be read."""
+        touched = get_traffic_hours_inserted_between(after, until)
+        if touched is None:
+            dropped = len(self.cache)
+            self.cache.clear()
+        else:
+            hours = {wan_ip: (first, last) for wan_ip, first, last in touched}
+
+            def stale(key) -> bool:
+                endpoint, target, label, hour = key
+                first = hour - (STANDARD_WINDOWS[label] - 1) * HOUR
+                wan_ips = [target] if endpoint == TRAFFIC_SUMMARY else link_index.wan_ips(target)
+                if wan_ips is None:
+                    return True
+                return any(wan_ip in hours and hours[wan_ip][0] <= hour and hours[wan_ip][1] >= first
+                           for wan_ip in wan_ips)
+
+            dropped = self.cache.discard_where(stale)
+        prewarm_invalidated.inc(dropped)
+        return dropped
+
+    def poll_once(self):
+        """Invalidate on landed traffic, then warm if the data or the hour changed."""
+        latest = get_latest_traffic_insert_time()
+        trigger = None
+        if latest is not None and latest != self._watermark:
+            if self._watermark is not None:
+                self.invalidate(self._watermark, latest)
+            self._watermark = latest
+            trigger = "data"
+        elif _floor_hour(datetime.now()) != self._warmed_hour:
+            trigger = "hour"
+        if trigger and datetime.now().hour in self.active_hours:
+            self.warm(trigger)
+
+    # ---- lifecycle ----
+
+    def start(self):
+        if self._thread is None and PREWARM_ENABLED:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cache-prewarmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print("Cache pre-warmer error:", e)
+            self._stop.wait(self.poll_interval)
+
+    def status(self) -> dict:
+        served = {
+            endpoint: {outcome: int(warm_requests.value(endpoint=endpoint, outcome=outcome))
+                       for outcome in ("warm", "cold", "other")}
+            for endpoint in (LOCATION_SUMMARY, TRAFFIC_SUMMARY)
+        }
+        return {
+            "enabled": PREWARM_ENABLED,
+            "running": self._thread is not None,
+            "entries": len(self.cache),
+            "db_budget_seconds": round(PREWARM_DB_BUDGET_SECONDS / APP_WORKERS, 3),
+            "data_watermark": self._watermark,
+            "last_run": self.last_run,
+            "served": served
+        }
+
+
+prewarmer = Prewarmer()
@@ -0,0 +1,17 @@
+-- ===================================================================
+-- Column: access_logs.target
+-- Purpose: The location or WAN IP a dashboard request asked for, recorded
+--          by the access-log middleware. The cache pre-warmer (prewarm.py)
+--          ranks targets by how often they were requested. Run once, after
+--          access_log_timing.sql.
+-- ===================================================================
+
+ALTER TABLE `access_logs`
+  ADD COLUMN `target` varchar(255) DEFAULT NULL COMMENT 'Requested location or WAN IP, for dashboard endpoints' AFTER `response_payload_size`,
+  ADD KEY `idx_endpoint_created_target` (`endpoint`, `created_at`, `target`);
+
+-- ===================================================================
+-- Index Strategy:
+-- - idx_endpoint_created_target: most requested targets of one endpoint
+--   since a given time, read from the index alone
+-- ===================================================================
@@ -0,0 +1,116 @@
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Tuple
+
+# Redis URL for a limiter shared by all workers, e.g. "redis://127.0.0.1:6379/0".
+# Without it every worker enforces its own limits in process memory.
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+RATE_LIMIT_TABLE_SIZE = 65536
+
+
+class TokenBucketTable:
+    """Fixed-size hashed table of token buckets with lazy refill.
+
+    Each slot is a (tokens, last refill) pair stored in flat arrays, so memory
+    stays constant no matter how many distinct keys an attacker sends. Keys
+    whose hashes share a slot share its bucket: a new key never starts from a
+    fresh full bucket, so cycling through colliding keys cannot reset a limit.
+    str hashes are salted per process, so collisions can't be aimed at a key.
+    """
+
+    def __init__(self, rate: float, burst: float, size: int = RATE_LIMIT_TABLE_SIZE):
+        self.rate = rate
+        self.burst = burst
+        self.size = size
+        self._tokens = array("d", [0.0]) * size
+        self._stamps = array("d", [-math.inf]) * size   # unused slots refill to a full bucket
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> Tuple[bool, float]:
+        """Take one token for ``key``. Returns (allowed, seconds until a token is available)."""
+        slot = hash(key) % self.size
+        now = time.monotonic()
+
+        with self._lock:
+            tokens = min(self.burst, self._tokens[slot] + (now - self._stamps[slot]) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._tokens[slot] = tokens
+            self._stamps[slot] = now
+
+        return allowed, 0.0 if allowed else (1 - tokens) / self.rate
+
+
+_REDIS_TOKEN_BUCKET = """
+local burst = tonumber(ARGV[2])
+local rate = tonumber(ARGV[1])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisTokenBuckets:
+    """Same token bucket semantics, stored in Redis so all workers share them."""
+
+    def __init__(self, client, name: str, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.prefix = f"ratelimit:{name}:"
+        self._script = client.register_script(_REDIS_TOKEN_BUCKET)
+
+    def acquire(self, key: str) -> Tuple[bool, float]:
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[self.rate, self.burst, time.time()])
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / self.rate
+
+
+def _redis_client():
+    if not RATE_LIMIT_REDIS_URL:
+        return None
+    try:
+        import redis
+    except ImportError:
+        print("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; using in-process limits")
+        return None
+    return redis.Redis.from_url(RATE_LIMIT_REDIS_URL)
+
+
+class RateLimiter:
+    def __init__(self, name: str, requests: int, per_seconds: float):
+        self.name = name
+        rate, burst = requests / per_seconds, float(requests)
+        client = _redis_client()
+        self._local = TokenBucketTable(rate, burst)
+        self._buckets = RedisTokenBuckets(client, name, rate, burst) if client else self._local
+
+    def check(self, key: str) -> Tuple[bool, int]:
+        """(allowed, Retry-After seconds). Falls back to local buckets if Redis is down."""
+        try:
+            allowed, wait = self._buckets.acquire(key)
+        except Exception as e:
+            print(f"Rate limiter {self.name} backend error:", e)
+            allowed, wait = self._local.acquire(key)
+        return allowed, max(1, math.ceil(wait))
+
+
+# Brute-force protection for the unauthenticated endpoints
+login_ip_limiter = RateLimiter("login-ip", requests=20, per_seconds=60)
+login_user_limiter = RateLimiter("login-user", requests=5, per_seconds=60)
+register_ip_limiter = RateLimiter("register-ip", requests=5, per_seconds=600)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Incremental maintenance of traffic_daily_rollup (see traffic_rollups.sql).
+
+Run periodically (cron / systemd timer) or after each ingestion batch:
+    python rollups.py
+"""
+
+from datetime import datetime, timedelta, time as dt_time
+from typing import Optional, Tuple
+
+from mysql.connector import Error
+
+from database import get_db_connection, get_latest_traffic_insert_time
+from timeutil import HOUR
+
+ROLLUP_COLUMNS_SELECT = """
+    t.wan_ip,
+    DATE(t.time_hour) AS day,
+    COUNT(*) AS data_points,
+    SUM(t.in_avg) AS in_avg_sum,
+    COUNT(t.in_avg) AS in_avg_count,
+    SUM(t.out_avg) AS out_avg_sum,
+    COUNT(t.out_avg) AS out_avg_count,
+    MAX(t.in_max) AS in_max,
+    MAX(t.out_max) AS out_max,
+    MIN(t.time_hour) AS first_reading,
+    MAX(t.time_hour) AS last_reading,
+    MAX(t.insert_time) AS last_insert_time
+"""
+
+UPSERT_SUFFIX = """
+ON DUPLICATE KEY UPDATE
+    data_points = VALUES(data_points),
+    in_avg_sum = VALUES(in_avg_sum),
+    in_avg_count = VALUES(in_avg_count),
+    out_avg_sum = VALUES(out_avg_sum),
+    out_avg_count = VALUES(out_avg_count),
+    in_max = VALUES(in_max),
+    out_max = VALUES(out_max),
+    first_reading = VALUES(first_reading),
+    last_reading = VALUES(last_reading),
+    last_insert_time = VALUES(last_insert_time)
+"""
+
+INSERT_PREFIX = """
+INSERT INTO traffic_daily_rollup
+(wan_ip, day, data_points, in_avg_sum, in_avg_count, out_avg_sum, out_avg_count,
+ in_max, out_max, first_reading, last_reading, last_insert_time)
+"""
+
+
+def parse_time(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).strip())
+
+
+def day_window(from_time, to_time) -> Optional[Tuple]:
+    """(first_day, last_day) when [from_time, to_time] covers whole days, else None."""
+    start, end = parse_time(from_time), parse_time(to_time)
+    if start.time() != dt_time(0, 0, 0) or end.time() < dt_time(23, 0, 0):
+        return None
+    if end.date() < start.date():
+        return None
+    return start.date(), end.date()
+
+
+def comparison_window(from_time, to_time, period: str = "previous") -> Tuple[datetime, datetime]:
+    """Baseline window for ``[from_time, to_time]``.
+
+    ``previous``: the window shifted back by the number of hourly slots it
+    covers, so it ends right before ``from_time``; whole days ending at 23:00
+    or 23:59:59 map to the preceding whole days.
+    ``previous_year``: the same calendar window one year earlier.
+    """
+    start, end = parse_time(from_time), parse_time(to_time)
+    if period == "previous_year":
+        return _minus_one_year(start), _minus_one_year(end)
+    if period != "previous":
+        raise ValueError(f"Unknown comparison period: {period}")
+    # Both ends are inclusive: round end - start + 1 second up to whole hours
+    span = -((start - end - timedelta(seconds=1)) // HOUR) * HOUR
+    return start - span, end - span
+
+
+def recent_hours_window(hours: int = 24, now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """The last ``hours`` hourly slots including the current one; stable within an hour."""
+    hour = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    return hour - timedelta(hours=hours - 1), hour + timedelta(minutes=59, seconds=59)
+
+
+def _minus_one_year(value: datetime) -> datetime:
+    try:
+        return value.replace(year=value.year - 1)
+    except ValueError:  # 29 February
+        return value.replace(year=value.year - 1, day=28)
+
+
+def get_rollup_watermark():
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(last_insert_time) FROM traffic_daily_rollup")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except Error as e:
+        print("DB error in get_rollup_watermark:", e)
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+def rollup_is_current() -> bool:
+    """True when every ingested traffic row has been folded into the rollup."""
+    watermark = get_rollup_watermark()
+    latest = get_latest_traffic_insert_time()
+    return watermark is not None and latest is not None and watermark >= latest
+
+
+def refresh_traffic_daily_rollup() -> int:
+    """Recompute the days touched since the last refresh. Returns affected rows."""
+    watermark = get_rollup_watermark()
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    try:
+        cursor = conn.cursor()
+        if watermark is None:
+            query = (INSERT_PREFIX + "SELECT" + ROLLUP_COLUMNS_SELECT +
+                     " FROM traffic_hourly_copy t GROUP BY t.wan_ip, DATE(t.time_hour)" + UPSERT_SUFFIX)
+            cursor.execute(query)
+        else:
+            # >= : rows sharing the watermark second may have landed after the last run
+            query = (INSERT_PREFIX + "SELECT" + ROLLUP_COLUMNS_SELECT + """
+            FROM traffic_hourly_copy t
+            JOIN (
+                SELECT DISTINCT wan_ip, DATE(time_hour) AS day
+                FROM traffic_hourly_copy
+                WHERE insert_time >= %s
+            ) touched ON touched.wan_ip = t.wan_ip
+                AND t.time_hour >= touched.day
+                AND t.time_hour < touched.day + INTERVAL 1 DAY
+            GROUP BY t.wan_ip, DATE(t.time_hour)
+            """ + UPSERT_SUFFIX)
+            cursor.execute(query, (watermark,))
+        conn.commit()
+        return cursor.rowcount
+    except Error as e:
+        print("DB error in refresh_traffic_daily_rollup:", e)
+        conn.rollback()
+        return 0
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+if __name__ == "__main__":
+    affected = refresh_traffic_daily_rollup()
+    print(f"traffic_daily_rollup refreshed, {affected} rows affected (watermark {get_rollup_watermark()})")
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Multi-process entry point.
+
+    python serve.py --workers 4 --port 8000
+
+Each worker is a separate process that runs main.lifespan on startup: it builds
+its own MySQL pools (DB_POOL_SIZE per host), caches, access-log writer and
+metrics registry, and drains/closes them on shutdown (SIGTERM / Ctrl+C).
+
+Sizing for this workload: traffic endpoints are DB-bound sync handlers, so each
+worker needs roughly as many DB connections as concurrently running handlers.
+Keep  workers * DB_POOL_SIZE * (1 + replicas)  below MySQL max_connections.
+/metrics is per worker.
+
+The same app also runs under gunicorn:
+    gunicorn "main:create_app()" -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8000
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+
+def default_workers() -> int:
+    # The CPU-heavy analytics are vectorized; the rest waits on MySQL,
+    # so one worker per core is a good starting point.
+    return max(1, os.cpu_count() or 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Data Traffic API with several worker processes")
+    parser.add_argument("--host", default=os.getenv("APP_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("APP_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("APP_WORKERS", default_workers())))
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=15, help="seconds to keep idle connections")
+    parser.add_argument("--limit-concurrency", type=int, default=None,
+                        help="per-worker connection cap; excess requests get 503")
+    args = parser.parse_args()
+    # Workers split host-wide budgets by this (see prewarm.py)
+    os.environ["APP_WORKERS"] = str(args.workers)
+
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=30,
+        limit_concurrency=args.limit_concurrency,
+        access_log=False
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+-- ===================================================================
+-- Indexes for the session history endpoints (/sessions/history and
+-- /sessions/activity-report). Skip a statement if the index exists.
+-- ===================================================================
+
+-- Keyset pages, newest login first, per user / per WAN IP / across all
+-- sessions. Each index also carries the columns the page selects, so a page
+-- is read from the index alone; only its rows are then joined by key.
+ALTER TABLE `sessions`
+  ADD KEY `idx_user_login_keyset` (`user_id`, `login_time`, `session_id`, `wan_ip`, `status`, `logout_time`),
+  ADD KEY `idx_wan_ip_login_keyset` (`wan_ip`, `login_time`, `session_id`, `user_id`, `status`, `logout_time`),
+  ADD KEY `idx_login_keyset` (`login_time`, `session_id`, `user_id`, `wan_ip`, `status`, `logout_time`);
+
+-- Activities of a page of sessions, in time order, without touching the rows
+ALTER TABLE `access_logs`
+  ADD KEY `idx_session_created` (`session_id`, `created_at`, `endpoint`, `method`, `status_code`);
+
+-- ===================================================================
+-- Index Strategy:
+-- - sessions idx_*_keyset: (filter, login_time, session_id) serves the
+--   WHERE, the keyset predicate and the ORDER BY ... LIMIT as one range read
+-- - access_logs idx_session_created: covers the batched activities query;
+--   it starts with session_id, so idx_session_id becomes redundant (the
+--   foreign key can use this one) and may be dropped
+-- ===================================================================
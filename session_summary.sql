@@ -0,0 +1,40 @@
+-- ===================================================================
+-- Table: session_activity_summary
+-- Purpose: One row per ended session (logged out or expired) with its
+--          duration and access_logs activity counts, written by the
+--          session sweeper (`python session_sweeper.py`, also run in the
+--          background by the API) so session reports never aggregate
+--          access_logs at request time.
+-- ===================================================================
+
+CREATE TABLE IF NOT EXISTS `session_activity_summary` (
+  `session_id` varchar(100) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `wan_ip` varchar(50) NOT NULL,
+  `login_time` datetime NOT NULL,
+  `logout_time` datetime NOT NULL COMMENT '/logout time, or token expiry for EXPIRED sessions',
+  `end_status` varchar(20) NOT NULL COMMENT 'LOGGED_OUT or EXPIRED',
+  `session_duration_minutes` int(11) NOT NULL,
+  `request_count` int(11) NOT NULL DEFAULT 0,
+  `error_count` int(11) NOT NULL DEFAULT 0 COMMENT 'Requests answered with status >= 400',
+  `distinct_endpoints` int(11) NOT NULL DEFAULT 0,
+  `first_activity` datetime DEFAULT NULL,
+  `last_activity` datetime DEFAULT NULL,
+  `summarized_at` timestamp DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`session_id`),
+  KEY `idx_user_login` (`user_id`, `login_time`),
+  KEY `idx_wan_ip_login` (`wan_ip`, `login_time`),
+  KEY `idx_end_status_logout` (`end_status`, `logout_time`, `session_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
+-- The sweeper finds stale ACTIVE sessions by login_time and unsummarised
+-- LOGGED_OUT sessions by logout_time. Skip a statement if the index exists.
+ALTER TABLE `sessions` ADD KEY `idx_status_login` (`status`, `login_time`);
+ALTER TABLE `sessions` ADD KEY `idx_status_logout` (`status`, `logout_time`, `session_id`);
+
+-- ===================================================================
+-- Index Strategy for session_activity_summary:
+-- - PRIMARY (session_id): upsert target, one row per session
+-- - idx_user_login / idx_wan_ip_login: per-user and per-IP session reports
+-- - idx_end_status_logout: keyset watermark for summarising logged-out sessions
+-- ===================================================================
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Session lifecycle sweeper.
+
+Sessions stay ACTIVE until the client calls /logout, although their token stops
+working ACCESS_TOKEN_EXPIRE_MINUTES after login. The sweeper
+
+  * marks ACTIVE sessions older than the token lifetime as EXPIRED, with
+    logout_time set to the moment the token expired, and
+  * writes one session_activity_summary row (see session_summary.sql) per
+    ended session: duration plus access_logs request/error/endpoint counts,
+
+in batches of SESSION_SWEEP_BATCH sessions, each its own short transaction.
+Every API worker runs it in the background; a MySQL named lock makes sure only
+one of them sweeps at a time. It can also run from cron:
+    python session_sweeper.py
+"""
+
+import os
+import threading
+from typing import List, Optional
+
+from mysql.connector import Error
+
+from auth import ACCESS_TOKEN_EXPIRE_MINUTES
+from database import get_db_connection
+from metrics import registry
+
+SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+SESSION_SWEEP_BATCH = int(os.getenv("SESSION_SWEEP_BATCH", "500"))
+SESSION_SWEEP_MAX_BATCHES = 20    # per run and kind, bounds the work of a single run
+LOGOUT_SETTLE_SECONDS = 60        # lets buffered access logs land before summarising
+SWEEPER_LOCK = "customer_portal.session_sweeper"
+
+sessions_expired = registry.counter("sessions_expired_total", "ACTIVE sessions marked EXPIRED by the sweeper")
+sessions_summarized = registry.counter("sessions_summarized_total", "Sessions written to session_activity_summary")
+
+SUMMARY_UPSERT = """
+INSERT INTO session_activity_summary
+(session_id, user_id, wan_ip, login_time, logout_time, end_status, session_duration_minutes,
+ request_count, error_count, distinct_endpoints, first_activity, last_activity)
+SELECT
+    s.session_id,
+    s.user_id,
+    s.wan_ip,
+    s.login_time,
+    s.logout_time,
+    s.status,
+    TIMESTAMPDIFF(MINUTE, s.login_time, s.logout_time),
+    COUNT(a.log_id),
+    COALESCE(SUM(a.status_code >= 400), 0),
+    COUNT(DISTINCT a.endpoint),
+    MIN(a.created_at),
+    MAX(a.created_at)
+FROM sessions s
+LEFT JOIN access_logs a ON a.session_id = s.session_id
+WHERE s.session_id IN ({placeholders})
+GROUP BY s.session_id, s.user_id, s.wan_ip, s.login_time, s.logout_time, s.status
+ON DUPLICATE KEY UPDATE
+    logout_time = VALUES(logout_time),
+    end_status = VALUES(end_status),
+    session_duration_minutes = VALUES(session_duration_minutes),
+    request_count = VALUES(request_count),
+    error_count = VALUES(error_count),
+    distinct_endpoints = VALUES(distinct_endpoints),
+    first_activity = VALUES(first_activity),
+    last_activity = VALUES(last_activity)
+"""
+
+
+def _placeholders(values: List) -> str:
+    return ", ".join(["%s"] * len(values))
+
+
+def _summarize(cursor, session_ids: List[str]) -> int:
+    cursor.execute(SUMMARY_UPSERT.format(placeholders=_placeholders(session_ids)), session_ids)
+    return len(session_ids)
+
+
+def _expire_batch(cursor, limit: int) -> int:
+    cursor.execute("""
+        SELECT session_id
+        FROM sessions
+        WHERE status = 'ACTIVE' AND login_time < NOW() - INTERVAL %s MINUTE
+        ORDER BY login_time
+        LIMIT %s
+    """, (ACCESS_TOKEN_EXPIRE_MINUTES, limit))
+    session_ids = [row[0] for row in cursor.fetchall()]
+    if not session_ids:
+        return 0
+
+    # status = 'ACTIVE' again: a /logout that raced us keeps its real logout_time
+    cursor.execute(f"""
+        UPDATE sessions
+        SET status = 'EXPIRED', logout_time = login_time + INTERVAL %s MINUTE
+        WHERE session_id IN ({_placeholders(session_ids)}) AND status = 'ACTIVE'
+    """, (ACCESS_TOKEN_EXPIRE_MINUTES, *session_ids))
+    sessions_expired.inc(cursor.rowcount)
+    _summarize(cursor, session_ids)
+    return len(session_ids)
+
+
+def _logged_out_batch(cursor, limit: int) -> int:
+    # Keyset on (logout_time, session_id), continuing after the newest summarised logout
+    cursor.execute("""
+        SELECT logout_time, session_id
+        FROM session_activity_summary
+        WHERE end_status = 'LOGGED_OUT'
+        ORDER BY logout_time DESC, session_id DESC
+        LIMIT 1
+    """)
+    last = cursor.fetchone()
+    if last:
+        cursor.execute("""
+            SELECT session_id
+            FROM sessions
+            WHERE status = 'LOGGED_OUT'
+              AND (logout_time > %s OR (logout_time = %s AND session_id > %s))
+              AND logout_time < NOW() - INTERVAL %s SECOND
+            ORDER BY logout_time, session_id
+            LIMIT %s
+        """, (last[0], last[0], last[1], LOGOUT_SETTLE_SECONDS, limit))
+    else:
+        cursor.execute("""
+            SELECT session_id
+            FROM sessions
+            WHERE status = 'LOGGED_OUT' AND logout_time < NOW() - INTERVAL %s SECOND
+            ORDER BY logout_time, session_id
+            LIMIT %s
+        """, (LOGOUT_SETTLE_SECONDS, limit))
+    session_ids = [row[0] for row in cursor.fetchall()]
+    if not session_ids:
+        return 0
+    return _summarize(cursor, session_ids)
+
+
+def sweep_sessions(batch_size: int = SESSION_SWEEP_BATCH,
+                   max_batches: int = SESSION_SWEEP_MAX_BATCHES) -> Optional[dict]:
+    """Expire and summarise ended sessions. Returns per-kind counts, or None when
+    another process holds the sweeper lock or the database is unavailable."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (SWEEPER_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            return None
+
+        counts = {"expired": 0, "logged_out": 0}
+        try:
+            for kind, step in (("expired", _expire_batch), ("logged_out", _logged_out_batch)):
+                for _ in range(max_batches):
+                    done = step(cursor, batch_size)
+                    conn.commit()
+                    counts[kind] += done
+                    sessions_summarized.inc(done)
+                    if done < batch_size:
+                        break
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SWEEPER_LOCK,))
+            cursor.fetchone()
+        return counts
+    except Error as e:
+        print("DB error in sweep_sessions:", e)
+        conn.rollback()
+        return None
+    finally:
+        try:
+            cursor.close()
+            conn.close()
+        except:
+            pass
+
+
+class SessionSweeper:
+    def __init__(self, interval: float = SESSION_SWEEP_INTERVAL):
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                sweep_sessions()
+            except Exception as e:
+                print("Session sweeper error:", e)
+
+
+session_sweeper = SessionSweeper()
+
+
+if __name__ == "__main__":
+    counts = sweep_sessions()
+    if counts is None:
+        print("Sweep skipped: database unavailable or another sweeper is running")
+    else:
+        print(f"Expired {counts['expired']} sessions, summarised {counts['logged_out']} logged-out sessions")
@@ -0,0 +1,134 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+from database import get_traffic_inserted_since, get_traffic_stream_position
+
+POLL_INTERVAL_SECONDS = 10
+HEARTBEAT_SECONDS = 15
+SUBSCRIBER_QUEUE_SIZE = 1000
+POLL_BATCH_SIZE = 5000
+
+
+class Subscription:
+    def __init__(self, wan_ips: Set[str]):
+        self.wan_ips = wan_ips
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def push(self, row: dict):
+        # A slow client loses its oldest rows instead of stalling the fan-out
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(row)
+
+
+class TrafficWatermarkPoller:
+    """Single shared poller that detects new traffic_hourly_copy rows by insert_time
+    and fans them out to every subscriber interested in their wan_ip."""
+
+    def __init__(self, interval: float = POLL_INTERVAL_SECONDS):
+        self.interval = interval
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._watermark = None
+        # (wan_ip, time_hour) of the last row delivered at the watermark (insert_time is not unique)
+        self._after: Optional[tuple] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    def subscribe(self, wan_ips: Set[str]) -> Subscription:
+        sub = Subscription(wan_ips)
+        for wan_ip in wan_ips:
+            self._subscribers.setdefault(wan_ip, set()).add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        for wan_ip in sub.wan_ips:
+            subs = self._subscribers.get(wan_ip)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[wan_ip]
+        if not self._subscribers:
+            self.stop()
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    async def _start_position(self):
+        # Start after the last row already in the table, not at its insert_time:
+        # rows sharing that insert_time were there before anyone subscribed
+        position = await run_in_threadpool(get_traffic_stream_position)
+        if position is not None:
+            self._watermark, *after = position
+            self._after = tuple(after)
+
+    async def _run(self):
+        if self._watermark is None:
+            await self._start_position()
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print("Traffic stream poll error:", e)
+
+    async def poll_once(self):
+        if self._watermark is None:
+            await self._start_position()
+            return
+
+        # Page until a short batch, so any number of rows sharing one insert_time get through
+        while True:
+            rows = await run_in_threadpool(get_traffic_inserted_since, self._watermark, POLL_BATCH_SIZE,
+                                           self._after)
+            if not rows:
+                return
+            for row in rows:
+                self.publish(row)
+            last = rows[-1]
+            self._watermark = last["insert_time"]
+            self._after = (last["wan_ip"], last["time_hour"])
+            if len(rows) < POLL_BATCH_SIZE:
+                return
+
+    def publish(self, row: dict):
+        for sub in self._subscribers.get(row["wan_ip"], ()):
+            sub.push(row)
+
+
+poller = TrafficWatermarkPoller()
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def traffic_event_stream(request, wan_ips: List[str]):
+    """Server-Sent Events generator for new traffic rows of ``wan_ips``."""
+    sub = poller.subscribe(set(wan_ips))
+    try:
+        yield format_event("subscribed", {"wan_ips": sorted(sub.wan_ips)})
+        while True:
+            if await request.is_disconnected():
+                break
+            try:
+                row = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event("traffic", row)
+    finally:
+        poller.unsubscribe(sub)
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionGate, Overloaded
+
+
+def test_gate_runs_up_to_its_concurrency_queues_fifo_and_sheds_the_rest():
+    async def scenario():
+        gate = AdmissionGate("aggregate", concurrency=2, queue=2, max_wait=5)
+        await gate.acquire()
+        await gate.acquire()
+
+        order = []
+
+        async def queued(name):
+            await gate.acquire()
+            order.append(name)
+
+        first = asyncio.create_task(queued("first"))
+        second = asyncio.create_task(queued("second"))
+        await asyncio.sleep(0)
+        assert gate.status() == {"concurrency": 2, "in_flight": 2, "queued": 2, "queue": 2}
+
+        with pytest.raises(Overloaded) as shed:
+            await gate.acquire()
+        assert shed.value.endpoint_class == "aggregate"
+
+        # Each release hands its slot to the oldest waiter
+        gate.release()
+        await first
+        assert order == ["first"] and gate.status()["in_flight"] == 2
+        gate.release()
+        await second
+        assert order == ["first", "second"]
+
+        for _ in range(2):
+            gate.release()
+        assert gate.status()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_waiter_gives_up_after_max_wait_and_cancelled_waiters_free_their_place():
+    async def scenario():
+        gate = AdmissionGate("point", concurrency=1, queue=2, max_wait=0.01, retry_after=3)
+        await gate.acquire()
+
+        with pytest.raises(Overloaded) as timed_out:
+            await gate.acquire()
+        assert timed_out.value.retry_after == 3
+        assert gate.status()["queued"] == 0
+
+        gate.max_wait = 5
+        cancelled = asyncio.create_task(gate.acquire())
+        waiting = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+
+        gate.release()
+        await waiting
+        assert gate.status() == {"concurrency": 1, "in_flight": 1, "queued": 0, "queue": 2}
+        gate.release()
+        assert gate.status()["in_flight"] == 0
+
+    asyncio.run(scenario())
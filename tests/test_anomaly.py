@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import anomaly
+from anomaly import AnomalyDetector, BASELINE_WEEKS, HOURS_PER_WEEK, METRICS, MIN_SAMPLES, process_chunks
+from timeutil import epoch_hour
+
+NOW = datetime(2024, 6, 3, 12)
+
+
+class _InlinePool:
+    def run(self, fn, columns, **kwargs):
+        return fn(columns)
+
+
+def _table(wan_ips, first, last, spike=None):
+    """Hourly rows with a daily pattern; ``spike`` = (wan_ip, hour) gets 10x traffic."""
+    rows = []
+    hour = first
+    while hour <= last:
+        for i, wan_ip in enumerate(wan_ips):
+            value = 100.0 + 10 * i + (hour.hour % 6) + (hour.day % 3) * 0.5
+            if spike == (wan_ip, hour):
+                value *= 10
+            rows.append((wan_ip, hour, value, value / 2))
+        hour += timedelta(hours=1)
+    return rows
+
+
+def _fake_series(monkeypatch, table):
+    calls = []
+
+    def get_traffic_series(wan_ips, after_time, columns):
+        calls.append((sorted(wan_ips), after_time))
+        return [row for row in table if row[0] in wan_ips and row[1] > after_time]
+
+    monkeypatch.setattr(anomaly, "get_traffic_series", get_traffic_series)
+    monkeypatch.setattr(anomaly, "analytics_pool", _InlinePool())
+    return calls
+
+
+def test_process_chunks_flags_a_spike_once_the_slot_has_history():
+    weeks = MIN_SAMPLES + 1
+    hours = np.arange(weeks * HOURS_PER_WEEK, dtype=np.int64)
+    values = np.column_stack([100.0 + (hours % 5), 50.0 + (hours % 3)])
+    values[-1, 0] = 1000.0
+    shape = (1, HOURS_PER_WEEK, len(METRICS))
+    columns = {"row": np.zeros(len(hours), dtype=np.int64), "hours": hours, "values": values,
+               "count": np.zeros(shape), "total": np.zeros(shape), "total_sq": np.zeros(shape)}
+
+    flags = process_chunks(columns)
+
+    assert len(flags) == 1
+    assert (flags[0]["hour"], flags[0]["metric"], flags[0]["value"]) == (hours[-1], 0, 1000.0)
+    assert flags[0]["score"] > 3
+    assert (columns["count"] == weeks).all()   # every hour was folded in
+    assert np.allclose(columns["total"].sum(axis=(0, 1)), values.sum(axis=0))
+
+
+def test_new_link_loads_its_history_without_reloading_the_others(monkeypatch, tmp_path):
+    history_start = NOW - timedelta(weeks=BASELINE_WEEKS)
+    earlier = NOW - timedelta(hours=2)
+    table = _table(["10.0.0.1", "10.0.0.2"], history_start + timedelta(hours=1), earlier)
+    calls = _fake_series(monkeypatch, table)
+
+    detector = AnomalyDetector(str(tmp_path / "baselines.npz"))
+    assert detector.update(["10.0.0.1"], now=earlier) >= 0
+    calls.clear()
+    table.extend(_table(["10.0.0.1", "10.0.0.2"], earlier + timedelta(hours=1), NOW))
+
+    detector.update(["10.0.0.1", "10.0.0.2"], now=NOW)
+
+    assert sorted(calls) == [(["10.0.0.1"], earlier), (["10.0.0.2"], history_start)]
+    store = detector.store
+    assert store.last_hour[store.index["10.0.0.1"]] == store.last_hour[store.index["10.0.0.2"]] == epoch_hour(NOW)
+    # The link folded in earlier saw each of its hours exactly once
+    assert store.count[store.index["10.0.0.1"]].sum() == store.count[store.index["10.0.0.2"]].sum()
+
+
+def test_requests_only_queue_links_for_the_background_refresh(monkeypatch):
+    first = NOW - timedelta(weeks=MIN_SAMPLES + 1)
+    spike = ("10.0.0.1", NOW - timedelta(hours=3))
+    table = _table(["10.0.0.1"], first, NOW, spike=spike)
+    calls = _fake_series(monkeypatch, table)
+    monkeypatch.setattr(anomaly, "datetime", type("_Clock", (datetime,), {"now": classmethod(lambda cls: NOW)}))
+
+    detector = AnomalyDetector(state_path=None)
+    assert detector.track(["10.0.0.1", "10.0.0.1"]) == 1
+    assert detector.anomalies(["10.0.0.1"]) == []
+    assert calls == []
+
+    detector.refresh()
+
+    assert detector.track(["10.0.0.1"]) == 0
+    found = detector.anomalies(["10.0.0.1"], from_time=NOW - timedelta(days=1))
+    assert [(a["time_hour"], a["metric"], a["direction"]) for a in found] == \
+        [(spike[1], "in_avg", "spike"), (spike[1], "out_avg", "spike")]
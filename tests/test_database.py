@@ -0,0 +1,225 @@
+from datetime import datetime
+
+import pytest
+from mysql.connector import Error
+
+import database
+from database import _StatementCache, _cached_cursors
+
+
+class _FakeCursor:
+    def __init__(self, fail):
+        self.fail = fail
+        self.closed = False
+        self.executed = []
+
+    def execute(self, sql, params):
+        if self.fail:
+            raise Error("Query execution was interrupted")
+        self.executed.append((sql, params))
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeConnection:
+    def __init__(self, fail_first):
+        self.cursors = []
+        self.fail_first = fail_first
+
+    def cursor(self, prepared=False, dictionary=False):
+        cursor = _FakeCursor(fail=self.fail_first and not self.cursors)
+        self.cursors.append(cursor)
+        return cursor
+
+
+def test_failed_prepared_execution_closes_the_statement():
+    raw = _FakeConnection(fail_first=True)
+    cache = _StatementCache(connection_id=1)
+
+    with pytest.raises(Error):
+        cache.execute(raw, "SELECT * FROM users WHERE id = %(id)s", {"id": 1}, False)
+    failed = raw.cursors[0]
+    assert failed.closed
+    assert failed not in _cached_cursors
+
+    cursor = cache.execute(raw, "SELECT * FROM users WHERE id = %(id)s", {"id": 1}, False)
+    assert cursor is raw.cursors[1] and not cursor.closed
+    assert cursor.executed == [("SELECT * FROM users WHERE id = %s", (1,))]
+    assert cursor in _cached_cursors
+
+
+def test_prepared_statements_are_reused_and_evicted(monkeypatch):
+    monkeypatch.setattr(database, "PREPARED_CACHE_SIZE", 2)
+    raw = _FakeConnection(fail_first=False)
+    cache = _StatementCache(connection_id=1)
+
+    first = cache.execute(raw, "SELECT 1", (), False)
+    assert cache.execute(raw, "SELECT 1", (), False) is first
+    cache.execute(raw, "SELECT 2", (), False)
+    cache.execute(raw, "SELECT 3", (), False)
+    assert first.closed and first not in _cached_cursors
+    assert len(raw.cursors) == 3
+
+
+class _FakePool:
+    reset_session = False
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get_connection(self):
+        return self.conn
+
+
+class _PooledConnection:
+    def __init__(self, in_transaction):
+        self.in_transaction = in_transaction
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+
+def test_checkout_rolls_back_only_an_open_transaction(monkeypatch):
+    config = {"host": "db", "port": 3306}
+    for open_transaction, rollbacks in ((True, 1), (False, 0)):
+        conn = _PooledConnection(open_transaction)
+        monkeypatch.setitem(database._pools, ("db", 3306), _FakePool(conn))
+        assert database._connect(config) is conn
+        assert conn.rollbacks == rollbacks
+
+
+class _RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        self.conn.statements.append((" ".join(sql.split()), params))
+        if "information_schema" in sql:
+            self.rows = [(name,) for name in self.conn.columns]
+
+    def executemany(self, sql, rows):
+        self.conn.statements.append((" ".join(sql.split()), rows))
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class _RecordingConnection:
+    def __init__(self, columns):
+        self.columns = columns
+        self.statements = []
+
+    def cursor(self, dictionary=False):
+        return _RecordingCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_access_logs_are_written_without_unmigrated_columns(monkeypatch):
+    # prewarm.sql applied, access_log_timing.sql not
+    conn = _RecordingConnection(list(database.ACCESS_LOG_COLUMNS) + ["log_id", "created_at", "target"])
+    monkeypatch.setattr(database, "_access_log_columns", None)
+    monkeypatch.setattr(database, "get_db_connection", lambda: conn)
+
+    assert database.create_access_log(None, None, "/login", "POST", 401, "10.0.0.1", response_time_ms=12)
+    inserts = [(sql, params) for sql, params in conn.statements if sql.startswith("INSERT INTO access_logs")]
+    assert inserts == [("INSERT INTO access_logs (session_id, user_id, endpoint, method, status_code, wan_ip, target) "
+                        "VALUES (%s, %s, %s, %s, %s, %s, %s)", (None, None, "/login", "POST", 401, "10.0.0.1", None))]
+
+    created_at = datetime(2024, 5, 1, 12, 0, 30)
+    entry = (None, 7, "/traffic/summary", "POST", 200, "10.0.0.1", 12, 80, 4096, "10.1.1.1", created_at)
+    assert database.create_access_logs_batch([entry])
+    sql, rows = conn.statements[-2]
+    assert "response_time_ms" not in sql and sql.endswith("target, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)")
+    assert rows == [entry[:6] + ("10.1.1.1", created_at)]
+    # Looked up once per process
+    assert sum("information_schema" in sql for sql, _ in conn.statements) == 1
+
+
+def test_access_logs_write_the_migrated_columns(monkeypatch):
+    conn = _RecordingConnection(list(database.ACCESS_LOG_COLUMNS) + list(database.ACCESS_LOG_OPTIONAL_COLUMNS))
+    monkeypatch.setattr(database, "_access_log_columns", None)
+    monkeypatch.setattr(database, "get_db_connection", lambda: conn)
+
+    created_at = datetime(2024, 5, 1, 12, 0, 30)
+    entry = (None, 7, "/traffic/summary", "POST", 200, "10.0.0.1", 12, 80, 4096, "10.1.1.1", created_at)
+    assert database.create_access_logs_batch([entry])
+    sql, rows = conn.statements[-2]
+    assert "response_time_ms, request_payload_size, response_payload_size, target, created_at" in sql
+    assert rows == [entry]
+
+
+class _ReplicaConnection:
+    def __init__(self, host):
+        self.host = host
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _fake_replicas(monkeypatch, lags, down=()):
+    """Replicas named by host with a fixed lag; hosts in ``down`` refuse connections."""
+    clock = [100.0]
+    connects = []
+    primary = _ReplicaConnection("primary")
+
+    def connect(config):
+        connects.append(config["host"])
+        if config["host"] in down:
+            raise Error("Can't connect to MySQL server")
+        return _ReplicaConnection(config["host"])
+
+    monkeypatch.setattr(database, "REPLICA_CONFIGS", [{"host": host, "port": 3306} for host in lags])
+    monkeypatch.setattr(database, "_replica_state", {})
+    monkeypatch.setattr(database, "_connect", connect)
+    monkeypatch.setattr(database, "get_db_connection", lambda: primary)
+    monkeypatch.setattr(database, "_measure_replica_lag", lambda conn: lags[conn.host])
+    monkeypatch.setattr(database.time, "monotonic", lambda: clock[0])
+    return clock, connects
+
+
+def test_reads_go_to_a_replica_within_the_lag_budget(monkeypatch):
+    _fake_replicas(monkeypatch, {"behind": 120.0, "current": 1.0, "broken": None})
+
+    for _ in range(10):
+        assert database.get_read_connection(max_lag=30).host == "current"
+    assert database.get_read_connection(max_lag=500).host in ("behind", "current")
+    assert database.get_read_connection(database.CONSISTENCY_STRONG).host == "primary"
+    assert database.get_read_connection(max_lag=0).host == "primary"
+
+
+def test_lagging_and_unreachable_replicas_are_skipped_until_rechecked(monkeypatch):
+    clock, connects = _fake_replicas(monkeypatch, {"behind": 120.0, "down": 0.0}, down={"down"})
+
+    assert database.get_read_connection(max_lag=30).host == "primary"
+    assert sorted(connects) == ["behind", "down"]
+
+    # Both verdicts are trusted for a while: no connection attempts at all
+    connects.clear()
+    assert database.get_read_connection(max_lag=30).host == "primary"
+    assert connects == []
+
+    clock[0] += database.REPLICA_LAG_CHECK_INTERVAL
+    database.get_read_connection(max_lag=30)
+    assert connects == ["behind"]
+
+    clock[0] += database.REPLICA_RETRY_AFTER
+    connects.clear()
+    database.get_read_connection(max_lag=30)
+    assert sorted(connects) == ["behind", "down"]
+    assert not database.replica_status()[1]["available"]
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from mysql.connector import Error
+
+import database
+import deadlines
+from database import QueryCancelled, QueryGuard, QueryTimeout, current_query_guard
+
+
+class _Connection:
+    server_host, server_port, connection_id = "db", 3306, 42
+
+
+@pytest.fixture
+def kills(monkeypatch):
+    killed = []
+    monkeypatch.setattr(database, "kill_query", lambda host, port, connection_id: killed.append((host, port, connection_id)))
+    return killed
+
+
+@pytest.fixture
+def guard():
+    guard = QueryGuard(2.5, endpoint="/traffic/summary")
+    token = current_query_guard.set(guard)
+    yield guard
+    current_query_guard.reset(token)
+
+
+def test_queries_under_a_deadline_carry_the_hint_on_their_outer_select(guard):
+    query = "\n  SELECT a FROM (SELECT b FROM t) s"
+    assert database._with_deadline(query) == "SELECT /*+ MAX_EXECUTION_TIME(2500) */ a FROM (SELECT b FROM t) s"
+
+    token = current_query_guard.set(None)
+    try:
+        assert database._with_deadline(query) == query
+    finally:
+        current_query_guard.reset(token)
+
+
+def test_cancel_kills_the_running_query_once_and_stops_later_ones(guard, kills):
+    with database._deadline(_Connection()):
+        assert guard.cancel("disconnect")
+        assert not guard.cancel("timeout")
+    assert kills == [("db", 3306, 42)]
+
+    # Nothing runs after a cancel, and nothing left to kill
+    with pytest.raises(QueryCancelled):
+        with database._deadline(_Connection()):
+            pass
+    assert kills == [("db", 3306, 42)]
+
+
+def test_server_side_timeout_becomes_query_timeout(guard, kills):
+    error = Error("Query execution was interrupted, maximum statement execution time exceeded",
+                  errno=database.ER_QUERY_TIMEOUT)
+    with pytest.raises(QueryTimeout):
+        database._raise_if_cancelled(error)
+    assert kills == [] and guard.cancelled == "timeout"
+
+
+def test_other_errors_pass_through_until_the_request_is_cancelled(guard):
+    database._raise_if_cancelled(Error("Duplicate entry", errno=1062))
+    guard.cancelled = "disconnect"
+    with pytest.raises(QueryCancelled):
+        database._raise_if_cancelled(Error("Query execution was interrupted", errno=1317))
+
+
+class _Request:
+    def __init__(self, messages):
+        self._messages = messages
+
+    async def receive(self):
+        if self._messages:
+            return self._messages.pop(0)
+        await asyncio.Event().wait()   # the client stays connected
+
+
+def test_watcher_kills_on_disconnect_and_after_the_deadline(monkeypatch, kills):
+    monkeypatch.setattr(deadlines, "DEADLINE_GRACE_SECONDS", 0)
+
+    async def watch(request, timeout):
+        guard = QueryGuard(timeout)
+        guard._running = ("db", 3306, 7)
+        await deadlines._watch(request, guard)
+        return guard.cancelled
+
+    assert asyncio.run(watch(_Request([{"type": "http.request"}, {"type": "http.disconnect"}]), 60)) == "disconnect"
+    assert asyncio.run(watch(_Request([]), 0.01)) == "timeout"
+    assert kills == [("db", 3306, 7), ("db", 3306, 7)]
@@ -0,0 +1,78 @@
+import io
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from mysql.connector import Error
+
+import export
+from export import stream_export, traffic_schema
+
+WAN_IPS = ["10.0.0.1", "10.0.0.2"]
+
+
+def _rows(count):
+    start = datetime(2024, 5, 1)
+    return [
+        ("ky", None, start + timedelta(hours=i), Decimal("1.25") * i, 2.0, None, 4.5, "ge-0/0/1",
+         WAN_IPS[i % 2], "uplink", start + timedelta(hours=i, minutes=5))
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def table(monkeypatch):
+    rows = _rows(7)
+    closed = []
+
+    def iter_traffic_rows(wan_ips, from_time, to_time, columns, batch_size):
+        assert list(columns) == traffic_schema().names
+        try:
+            for i in range(0, len(rows), batch_size):
+                yield rows[i:i + batch_size]
+        finally:
+            closed.append(True)
+
+    monkeypatch.setattr(export, "iter_traffic_rows", iter_traffic_rows)
+    return rows, closed
+
+
+def _expected(rows):
+    names = traffic_schema().names
+    return [{name: (float(v) if isinstance(v, Decimal) else v) for name, v in zip(names, row)} for row in rows]
+
+
+def test_arrow_stream_round_trips_in_batches(table):
+    rows, closed = table
+    chunks = list(stream_export(WAN_IPS, "2024-05-01", "2024-05-02", "arrow", batch_rows=3))
+
+    reader = pa.ipc.open_stream(io.BytesIO(b"".join(chunks)))
+    batches = list(reader)
+    assert [b.num_rows for b in batches] == [3, 3, 1]
+    result = pa.Table.from_batches(batches)
+    assert result.schema.field("wan_ip").type == pa.dictionary(pa.int32(), pa.string())
+    assert result.to_pylist() == _expected(rows)
+    assert closed == [True]
+
+
+def test_parquet_export_round_trips(table):
+    rows, _ = table
+    data = b"".join(stream_export(WAN_IPS, "2024-05-01", "2024-05-02", "parquet", batch_rows=4))
+
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 2
+    result = parquet.read()
+    assert result.column("in_avg").type == pa.float64()
+    assert result.to_pylist() == _expected(rows)
+
+
+def test_database_errors_raise_before_the_response_starts(monkeypatch):
+    def iter_traffic_rows(wan_ips, from_time, to_time, columns, batch_size):
+        raise Error("Database connection failed")
+        yield
+
+    monkeypatch.setattr(export, "iter_traffic_rows", iter_traffic_rows)
+    with pytest.raises(Error):
+        stream_export(WAN_IPS, "2024-05-01", "2024-05-02")
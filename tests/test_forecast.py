@@ -0,0 +1,63 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+import forecast
+from forecast import CapacityForecaster, design_matrix, fit_links
+
+
+class _InlinePool:
+    def run(self, fn, columns, **kwargs):
+        return fn(columns, **kwargs)
+
+
+def test_fit_links_recovers_trend_and_weekday_effects_with_missing_days():
+    t = np.arange(70)
+    weekday = t % 7
+    X = design_matrix(t, weekday)
+    truth = np.array([[100.0, 0.5, 1, 2, 3, 4, 5, -10], [20.0, -0.1, 0, 0, 0, 0, 0, 0]])
+    Y = X @ truth.T
+    Y[::5, 0] = np.nan
+    np.testing.assert_allclose(fit_links(X, Y), truth, atol=1e-4)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    state = {"latest": datetime(2024, 5, 10, 9, 5), "touched": [], "peak_calls": []}
+
+    def peaks(wan_ips, origin, last_day, source):
+        state["peak_calls"].append(sorted(wan_ips))
+        return [(ip, origin + timedelta(days=d), 100.0 + d) for ip in wan_ips for d in range(30)]
+
+    monkeypatch.setattr(forecast, "get_latest_traffic_insert_time", lambda: state["latest"])
+    monkeypatch.setattr(forecast, "get_traffic_hours_inserted_between", lambda after, until: state["touched"])
+    monkeypatch.setattr(forecast, "get_daily_traffic_peaks", peaks)
+    monkeypatch.setattr(forecast, "rollup_is_current", lambda: True)
+    monkeypatch.setattr(forecast, "analytics_pool", _InlinePool())
+    return state
+
+
+def test_only_rows_for_fitted_days_trigger_a_refit(database):
+    today = date(2024, 5, 10)
+    links = [{"wan_ip": ip, "bandwidth": 1000} for ip in ("10.0.0.1", "10.0.0.2")]
+    forecaster = CapacityForecaster()
+    assert len(forecaster.forecast(links, today)) == 2
+    assert database["peak_calls"] == [["10.0.0.1", "10.0.0.2"]]
+
+    # Hourly ingest of today's hours: no refit
+    database["latest"] = datetime(2024, 5, 10, 10, 5)
+    database["touched"] = [("10.0.0.1", datetime(2024, 5, 10, 9), datetime(2024, 5, 10, 9)),
+                           ("10.0.0.2", datetime(2024, 5, 10, 9), datetime(2024, 5, 10, 9))]
+    forecaster.forecast(links, today)
+    assert len(database["peak_calls"]) == 1
+
+    # A late row for yesterday on one link refits that link only
+    database["latest"] = datetime(2024, 5, 10, 11, 5)
+    database["touched"] = [("10.0.0.2", datetime(2024, 5, 9, 23), datetime(2024, 5, 10, 10))]
+    forecaster.forecast(links, today)
+    assert database["peak_calls"][1:] == [["10.0.0.2"]]
+
+    # A new day refits everything
+    forecaster.forecast(links, today + timedelta(days=1))
+    assert database["peak_calls"][2:] == [["10.0.0.1", "10.0.0.2"]]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from gaps import detect_gaps
+
+
+def _brute_force(pairs):
+    spans, missing, duplicates = {}, [], []
+    for link in sorted({l for l, _ in pairs}):
+        hours = sorted(h for l, h in pairs if l == link)
+        spans[link] = (hours[0], hours[-1])
+        for previous, hour in zip(hours, hours[1:]):
+            if hour - previous > 1:
+                missing.append((link, previous + 1, hour - 1, hour - previous - 1))
+        for hour in sorted(set(hours)):
+            if hours.count(hour) > 1:
+                duplicates.append((link, hour, hours.count(hour) - 1))
+    return spans, missing, duplicates
+
+
+def test_missing_ranges_and_duplicate_hours_per_link():
+    link = np.array([0, 0, 0, 0, 0, 0, 1, 1, 1])
+    hour = np.array([10, 11, 11, 11, 14, 15, 3, 4, 9])
+
+    found = detect_gaps(link, hour)
+
+    assert dict(zip(found["span_link"], zip(found["first"], found["last"]))) == {0: (10, 15), 1: (3, 9)}
+    assert list(zip(found["missing_link"], found["missing_start"], found["missing_end"], found["missing_hours"])) == \
+        [(0, 12, 13, 2), (1, 5, 8, 4)]
+    assert list(zip(found["duplicate_link"], found["duplicate_hour"], found["duplicate_extra"])) == [(0, 11, 2)]
+
+
+def test_unsorted_input_matches_a_brute_force_scan():
+    rng = np.random.default_rng(7)
+    link = rng.integers(0, 5, 400)
+    hour = rng.integers(1000, 1120, 400)
+
+    found = detect_gaps(link, hour)
+    spans, missing, duplicates = _brute_force(list(zip(link.tolist(), hour.tolist())))
+
+    assert dict(zip(found["span_link"].tolist(), zip(found["first"].tolist(), found["last"].tolist()))) == spans
+    assert list(zip(*(found[k].tolist() for k in ("missing_link", "missing_start", "missing_end",
+                                                  "missing_hours")))) == missing
+    assert list(zip(*(found[k].tolist() for k in ("duplicate_link", "duplicate_hour",
+                                                  "duplicate_extra")))) == duplicates
+
+
+def test_no_rows_no_gaps():
+    found = detect_gaps(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    assert all(len(values) == 0 for values in found.values())
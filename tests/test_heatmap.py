@@ -0,0 +1,119 @@
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database
+import heatmap
+from rollups import INSERT_PREFIX, ROLLUP_COLUMNS_SELECT
+from heatmap import traffic_heatmap, HEATMAP_METRICS
+
+LINKS = ("10.0.0.1", "10.0.0.2")
+FIRST_DAY = datetime(2024, 5, 6)   # a Monday
+DAYS = 14
+
+
+class _SqliteCursor:
+    """Runs the MySQL text of a query against sqlite: named %(x)s parameters
+    become :x, and WEEKDAY / HOUR are registered on the connection."""
+
+    def __init__(self, db, dictionary):
+        self._cursor = db.cursor()
+        self._dictionary = dictionary
+
+    def execute(self, query, params=()):
+        params = {k: str(v) if isinstance(v, (date, datetime)) else v for k, v in params.items()}
+        self._cursor.execute(re.sub(r"%\((\w+)\)s", r":\1", query), params)
+
+    def fetchall(self):
+        names = [d[0] for d in self._cursor.description]
+        rows = self._cursor.fetchall()
+        return [dict(zip(names, row)) for row in rows] if self._dictionary else rows
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SqliteConnection:
+    def __init__(self, db):
+        self._db = db
+
+    def cursor(self, dictionary=False):
+        return _SqliteCursor(self._db, dictionary)
+
+    def close(self):
+        pass
+
+
+def _weekday(value):
+    return datetime.fromisoformat(str(value)).weekday()
+
+
+def _hour(value):
+    return datetime.fromisoformat(str(value)).hour
+
+
+@pytest.fixture
+def traffic(monkeypatch):
+    """Two links peaking at different hours, and the daily rollup built from them."""
+    db = sqlite3.connect(":memory:")
+    db.create_function("WEEKDAY", 1, _weekday)
+    db.create_function("HOUR", 1, _hour)
+    db.execute("CREATE TABLE traffic_hourly_copy (wan_ip TEXT, time_hour TEXT, in_avg REAL, in_max REAL,"
+               " out_avg REAL, out_max REAL, insert_time TEXT)")
+    db.execute("CREATE TABLE traffic_daily_rollup (wan_ip TEXT, day TEXT, data_points INT, in_avg_sum REAL,"
+               " in_avg_count INT, out_avg_sum REAL, out_avg_count INT, in_max REAL, out_max REAL,"
+               " first_reading TEXT, last_reading TEXT, last_insert_time TEXT)")
+    rows = []
+    for hour in range(DAYS * 24):
+        slot = FIRST_DAY + timedelta(hours=hour)
+        if hour % 24 == 5 and slot.weekday() == 2:
+            continue   # a missing hour, so days do not all weigh the same
+        for i, wan_ip in enumerate(LINKS):
+            peak_hour = 9 if i == 0 else 20
+            load = 10.0 * (i + 1) + (50.0 if slot.hour == peak_hour else slot.hour % 7)
+            rows.append((wan_ip, str(slot), load, load * 1.5, load / 2, load * 0.75, str(slot)))
+    db.executemany("INSERT INTO traffic_hourly_copy VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    db.execute(INSERT_PREFIX + "SELECT" + ROLLUP_COLUMNS_SELECT +
+               " FROM traffic_hourly_copy t GROUP BY t.wan_ip, DATE(t.time_hour)")
+
+    monkeypatch.setattr(database, "get_read_connection", lambda consistency, max_lag: _SqliteConnection(db))
+    return rows
+
+
+def _day_heatmap(monkeypatch, wan_ips, rollup_current):
+    monkeypatch.setattr(heatmap, "rollup_is_current", lambda: rollup_current)
+    last = FIRST_DAY + timedelta(days=DAYS) - timedelta(seconds=1)
+    return traffic_heatmap(list(wan_ips), str(FIRST_DAY), str(last), resolution="day")
+
+
+def test_rollup_and_raw_day_heatmaps_of_a_link_agree(traffic, monkeypatch):
+    raw = _day_heatmap(monkeypatch, LINKS[:1], rollup_current=False)
+    rollup = _day_heatmap(monkeypatch, LINKS[:1], rollup_current=True)
+
+    assert (raw["source"], rollup["source"]) == ("raw", "rollup")
+    for metric in HEATMAP_METRICS:
+        assert rollup[metric] == raw[metric], metric
+    assert raw["samples"][2] == [46]   # two Wednesdays, one hour missing from each
+
+
+def test_day_peak_of_several_links_is_the_peak_of_their_hourly_sum(traffic, monkeypatch):
+    data = _day_heatmap(monkeypatch, LINKS, rollup_current=True)
+    assert data["source"] == "raw"
+
+    summed = {}
+    for wan_ip, slot, in_avg, in_max, *_ in traffic:
+        summed[slot] = summed.get(slot, 0.0) + in_max
+    monday = max(v for slot, v in summed.items() if datetime.fromisoformat(slot).weekday() == 0)
+    assert data["peak_in"][0] == [pytest.approx(monday)]
+
+    # Each link's own Monday peak, added up, would overstate it
+    daily_peaks = sum(max(row[3] for row in traffic if row[0] == wan_ip) for wan_ip in LINKS)
+    assert monday < daily_peaks
+
+
+def test_rollup_rejects_several_links():
+    with pytest.raises(ValueError):
+        database.get_traffic_heatmap(list(LINKS), date(2024, 5, 6), date(2024, 5, 19), resolution="day",
+                                     source="rollup")
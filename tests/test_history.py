@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import history
+from history import InvalidCursor, decode_cursor, encode_cursor, session_history
+
+START = datetime(2024, 5, 1, 8)
+
+
+def _sessions(count):
+    # Pairs share a login_time, so pages have to break ties on session_id
+    return [{"session_id": f"s{i:03d}", "user_id": 1, "username": "alice", "login_time": START + timedelta(minutes=i // 2),
+             "logout_time": None, "wan_ip": "10.0.0.1", "status": "ACTIVE"} for i in range(count)]
+
+
+@pytest.fixture
+def table(monkeypatch):
+    rows = _sessions(11)
+
+    def get_session_history_page(user_id, wan_ip, from_time, to_time, after, limit):
+        page = sorted(rows, key=lambda r: (r["login_time"], r["session_id"]), reverse=True)
+        if after is not None:
+            page = [r for r in page if (r["login_time"], r["session_id"]) < after]
+        return page[:limit]
+
+    monkeypatch.setattr(history, "get_session_history_page", get_session_history_page)
+    monkeypatch.setattr(history, "get_user_by_username", lambda username: {"id": 1})
+    return rows
+
+
+def test_pages_cover_every_session_once_newest_first(table):
+    seen, cursor = [], None
+    while True:
+        page = session_history("alice", None, None, None, cursor=cursor, limit=4)
+        seen += [row["session_id"] for row in page["sessions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    expected = sorted(table, key=lambda r: (r["login_time"], r["session_id"]), reverse=True)
+    assert seen == [row["session_id"] for row in expected]
+
+
+def test_new_logins_do_not_shift_the_remaining_pages(table):
+    first = session_history("alice", None, None, None, limit=5)
+    table.extend(_sessions(20)[11:])
+    second = session_history("alice", None, None, None, cursor=first["next_cursor"], limit=5)
+
+    assert [row["session_id"] for row in second["sessions"]] == ["s005", "s004", "s003", "s002", "s001"]
+
+
+def test_cursors_round_trip_and_reject_garbage():
+    cursor = encode_cursor(datetime(2024, 5, 1, 8, 30, 15), "a|b")
+    assert decode_cursor(cursor) == (datetime(2024, 5, 1, 8, 30, 15), "a|b")
+    assert decode_cursor(encode_cursor(START, 42), int) == (START, 42)
+
+    for bad in ("not base64!", encode_cursor(START, "x")[:-3], "bm8tc2VwYXJhdG9y"):
+        with pytest.raises(InvalidCursor):
+            decode_cursor(bad, int)
+
+
+def test_wan_ip_history_pages_by_log_id_and_counts_endpoints_on_the_first_page(monkeypatch):
+    created = START + timedelta(seconds=30)
+    logs = [{"log_id": i, "created_at": created, "endpoint": "/traffic/summary", "status_code": 200} for i in range(1, 6)]
+    count_calls = []
+
+    def get_access_logs_by_wan_ip_page(wan_ip, from_time, to_time, after, limit):
+        page = sorted(logs, key=lambda r: (r["created_at"], r["log_id"]), reverse=True)
+        if after is not None:
+            page = [r for r in page if (r["created_at"], r["log_id"]) < after]
+        return page[:limit]
+
+    def get_access_endpoint_counts_by_wan_ip(wan_ip, from_time, to_time):
+        count_calls.append(wan_ip)
+        return [{"endpoint": "/traffic/summary", "requests": 5, "errors": 0}]
+
+    monkeypatch.setattr(history, "get_access_logs_by_wan_ip_page", get_access_logs_by_wan_ip_page)
+    monkeypatch.setattr(history, "get_access_endpoint_counts_by_wan_ip", get_access_endpoint_counts_by_wan_ip)
+
+    first = history.wan_ip_activity_history("10.0.0.1", None, None, limit=3)
+    assert [row["log_id"] for row in first["activities"]] == [5, 4, 3]
+    assert first["endpoint_counts"] == [{"endpoint": "/traffic/summary", "requests": 5, "errors": 0}]
+
+    second = history.wan_ip_activity_history("10.0.0.1", None, None, cursor=first["next_cursor"], limit=3)
+    assert [row["log_id"] for row in second["activities"]] == [2, 1]
+    assert second["endpoint_counts"] is None and second["next_cursor"] is None
+    assert count_calls == ["10.0.0.1"]
@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from mysql.connector import Error
+
+import hotcache
+from hotcache import HotTrafficCache, WATERMARK
+from timeutil import EPOCH
+
+
+def _row(wan_ip, time_hour, value, insert_time):
+    return (wan_ip, time_hour, value, value, value, value, insert_time)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HotTrafficCache(directory=str(tmp_path), hours=48)
+
+
+def _seconds(value: datetime) -> float:
+    return (value - EPOCH).total_seconds()
+
+
+def test_failed_incremental_load_keeps_the_watermark(cache, monkeypatch):
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    since = now - timedelta(minutes=30)
+    meta = cache._get_meta(create=True)
+    meta[WATERMARK] = _seconds(since)
+
+    def failing_stream(column, start):
+        # Unordered: the first batch holds the newest insert_time, the failure
+        # hits before an older row has been applied
+        yield [_row("10.0.0.1", now, 1.0, since + timedelta(minutes=20))]
+        raise Error("Lost connection to MySQL server during query")
+
+    monkeypatch.setattr(hotcache, "iter_recent_traffic", failing_stream)
+    with pytest.raises(Error):
+        cache.refresh()
+    assert meta[WATERMARK] == _seconds(since)
+
+    rows = [_row("10.0.0.1", now, 1.0, since + timedelta(minutes=20)),
+            _row("10.0.0.2", now, 2.0, since + timedelta(minutes=5))]
+    monkeypatch.setattr(hotcache, "iter_recent_traffic", lambda column, start: (b for b in [rows[:1], rows[1:]]))
+    assert cache.refresh() == 2
+    assert meta[WATERMARK] == _seconds(since + timedelta(minutes=20))
+
+
+def _stream(rows):
+    return lambda column, start: (batch for batch in [rows])
+
+
+def test_links_share_shard_files_and_workers_see_each_others_rings(tmp_path, monkeypatch):
+    monkeypatch.setattr(hotcache, "SHARD_LINKS", 2)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    rows = [_row(f"10.0.0.{i}", now - timedelta(hours=h), float(i), now) for i in range(5) for h in range(3)]
+    monkeypatch.setattr(hotcache, "iter_recent_traffic", _stream(rows))
+    monkeypatch.setattr(hotcache, "get_latest_traffic_insert_time", lambda: now)
+
+    writer = HotTrafficCache(directory=str(tmp_path), hours=48)
+    assert writer.refresh() == len(rows)
+    assert sorted(name for name in tmp_path.iterdir() if name.name.startswith("shard_")) == \
+        [tmp_path / f"shard_{n:05d}.bin" for n in range(3)]
+
+    reader = HotTrafficCache(directory=str(tmp_path), hours=48)
+    found = reader.lookup("10.0.0.3", now - timedelta(hours=2), now, max_lag=60)
+    assert [row["in_avg"] for row in found] == [3.0, 3.0, 3.0]
+    assert [row["time_hour"] for row in found] == [now - timedelta(hours=h) for h in (2, 1, 0)]
+    assert reader.lookup("10.0.0.9", now - timedelta(hours=2), now, max_lag=60) == []
+    assert reader.status()["links"] == 5
+
+
+def test_reset_by_another_process_invalidates_cached_mappings(tmp_path, monkeypatch):
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    monkeypatch.setattr(hotcache, "get_latest_traffic_insert_time", lambda: now)
+    window = (now - timedelta(hours=1), now)
+
+    monkeypatch.setattr(hotcache, "iter_recent_traffic", _stream([_row("10.0.0.1", now, 1.0, now)]))
+    HotTrafficCache(directory=str(tmp_path), hours=48).refresh()
+    reader = HotTrafficCache(directory=str(tmp_path), hours=48)
+    assert [row["in_avg"] for row in reader.lookup("10.0.0.1", *window, max_lag=60)] == [1.0]
+
+    # A run with another HOTCACHE_HOURS resets the files, then the usual size comes back
+    HotTrafficCache(directory=str(tmp_path), hours=72).refresh()
+    monkeypatch.setattr(hotcache, "iter_recent_traffic", _stream([_row("10.0.0.2", now, 2.0, now),
+                                                                  _row("10.0.0.1", now, 5.0, now)]))
+    HotTrafficCache(directory=str(tmp_path), hours=48).refresh()
+
+    assert [row["in_avg"] for row in reader.lookup("10.0.0.1", *window, max_lag=60)] == [5.0]
+    assert [row["in_avg"] for row in reader.lookup("10.0.0.2", *window, max_lag=60)] == [2.0]
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+import latency
+from latency import weighted_percentiles
+
+
+def test_weighted_percentiles_match_numpy_over_every_request():
+    rng = np.random.default_rng(3)
+    for size in (1, 2, 7, 200):
+        values = np.unique(rng.integers(1, 5000, size)).astype(np.float64)
+        counts = rng.integers(1, 40, len(values))
+        quantiles = [0, 1, 25, 50, 90, 95, 99, 99.9, 100]
+
+        expected = np.percentile(np.repeat(values, counts), quantiles)
+        assert weighted_percentiles(values, counts, quantiles) == pytest.approx(expected)
+
+
+def test_latency_report_splits_endpoints_and_ranks_by_p95(monkeypatch):
+    rows = [("/login", 5, 90), ("/login", 40, 10),
+            ("/traffic/summary", 100, 50), ("/traffic/summary", 900, 50)]
+    monkeypatch.setattr(latency, "get_access_latency_distribution", lambda from_time, to_time, endpoint: rows)
+    monkeypatch.setattr(latency, "get_slowest_requests", lambda from_time, to_time, endpoint, limit: [])
+
+    report = latency.latency_report("2024-05-01 00:00:00", "2024-05-01 23:59:59")
+
+    assert [e["endpoint"] for e in report["endpoints"]] == ["/traffic/summary", "/login"]
+    summary, login = report["endpoints"]
+    assert (summary["requests"], summary["avg_ms"], summary["max_ms"]) == (100, 500.0, 900)
+    assert summary["p50_ms"] == pytest.approx(np.percentile([100] * 50 + [900] * 50, 50), abs=0.05)
+    assert (login["p50_ms"], login["p95_ms"]) == (5.0, 40.0)
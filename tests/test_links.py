@@ -0,0 +1,58 @@
+import links
+from links import LinkIndex
+
+
+def _row(location, wan_ip, interface, bandwidth):
+    return {"location": location, "wan_ip": wan_ip, "interface": interface,
+            "description": f"{location} {interface}", "bandwidth": bandwidth}
+
+
+def _fake_master(monkeypatch, rows, checksum):
+    state = {"rows": rows, "checksum": checksum, "loads": 0}
+
+    def get_link_master():
+        state["loads"] += 1
+        return state["rows"]
+
+    monkeypatch.setattr(links, "get_link_master", get_link_master)
+    monkeypatch.setattr(links, "get_link_master_checksum", lambda: state["checksum"])
+    return state
+
+
+def test_a_wan_ip_under_two_locations_keeps_each_locations_attributes(monkeypatch, capsys):
+    _fake_master(monkeypatch, [
+        _row("BANGALORE", "10.0.0.1", "ge-0/0/1", 100),
+        _row("BANGALORE", "10.0.0.1", "ge-0/0/9", 999),
+        _row("BANGALORE", "10.0.0.2", "ge-0/0/2", 50),
+        _row("CHENNAI", "10.0.0.1", "xe-1/0/0", 1000),
+    ], checksum=1)
+    index = LinkIndex()
+
+    assert index.wan_ips("BANGALORE") == ["10.0.0.1", "10.0.0.2"]
+    assert [link["interface"] for link in index.links("BANGALORE")] == ["ge-0/0/1", "ge-0/0/2"]
+    assert index.links("CHENNAI") == [_row("CHENNAI", "10.0.0.1", "xe-1/0/0", 1000)]
+    assert {l["location"]: l["total_bandwidth"] for l in index.locations()} == {"BANGALORE": 150, "CHENNAI": 1000}
+
+    traffic = [{"wan_ip": "10.0.0.1", "in_avg": 1.0}]
+    assert index.enrich(traffic, "CHENNAI")[0]["interface"] == "xe-1/0/0"
+    assert index.enrich(traffic, "BANGALORE")[0]["interface"] == "ge-0/0/1"
+
+    logged = capsys.readouterr().out
+    assert "10.0.0.1 is listed more than once under BANGALORE" in logged
+    assert "10.0.0.1 is listed under 2 locations (BANGALORE, CHENNAI)" in logged
+
+
+def test_reloads_only_when_the_checksum_changes_and_keeps_serving_on_errors(monkeypatch):
+    state = _fake_master(monkeypatch, [_row("BANGALORE", "10.0.0.1", "ge-0/0/1", 100)], checksum=1)
+    index = LinkIndex(check_interval=0)
+
+    assert index.wan_ips("BANGALORE") == ["10.0.0.1"]
+    assert index.wan_ips("BANGALORE") == ["10.0.0.1"]
+    assert state["loads"] == 1
+
+    state.update(rows=state["rows"] + [_row("BANGALORE", "10.0.0.2", "ge-0/0/2", 50)], checksum=2)
+    assert index.wan_ips("BANGALORE") == ["10.0.0.1", "10.0.0.2"]
+
+    state.update(rows=None, checksum=None)
+    assert index.wan_ips("BANGALORE") == ["10.0.0.1", "10.0.0.2"]
+    assert index.wan_ips("UNKNOWN") == []
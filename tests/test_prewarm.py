@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import prewarm
+from prewarm import Prewarmer, LOCATION_SUMMARY, TRAFFIC_SUMMARY, HOUR
+
+
+def test_landed_traffic_drops_only_the_windows_it_touches(monkeypatch):
+    hour = datetime(2024, 5, 1, 12)
+    warmer = Prewarmer()
+    for label in ("24h", "7d", "30d"):
+        warmer.cache.set((TRAFFIC_SUMMARY, "10.0.0.1", label, hour), "a")
+        warmer.cache.set((TRAFFIC_SUMMARY, "10.0.0.2", label, hour), "b")
+        warmer.cache.set((LOCATION_SUMMARY, "BANGALORE", label, hour), "c")
+
+    # 10.0.0.1 (in BANGALORE) gained an hour from three days ago
+    landed = [("10.0.0.1", hour - 72 * HOUR, hour - 72 * HOUR)]
+    monkeypatch.setattr(prewarm, "get_traffic_hours_inserted_between", lambda after, until: landed)
+    monkeypatch.setattr(prewarm.link_index, "wan_ips", lambda location: ["10.0.0.1", "10.0.0.3"])
+
+    assert warmer.invalidate(hour, hour + timedelta(seconds=5)) == 4
+    assert warmer.cache.get((TRAFFIC_SUMMARY, "10.0.0.1", "24h", hour)) == "a"
+    assert warmer.cache.get((LOCATION_SUMMARY, "BANGALORE", "24h", hour)) == "c"
+    assert warmer.cache.get((TRAFFIC_SUMMARY, "10.0.0.1", "7d", hour)) is None
+    assert warmer.cache.get((LOCATION_SUMMARY, "BANGALORE", "30d", hour)) is None
+    assert all(warmer.cache.get((TRAFFIC_SUMMARY, "10.0.0.2", label, hour)) == "b"
+               for label in ("24h", "7d", "30d"))
+
+
+def test_budget_spans_passes(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(prewarm.time, "monotonic", lambda: clock[0])
+
+    def compute(endpoint, target, first, last):
+        clock[0] += 4.0     # every query takes four seconds of database time
+        return ["rows"]
+
+    warmer = Prewarmer()
+    monkeypatch.setattr(warmer, "_popular", lambda endpoint, limit: [f"{endpoint}-{i}" for i in range(3)])
+    monkeypatch.setattr(warmer, "_compute", compute)
+
+    first = warmer.warm("data", budget=10.0)
+    assert first["warmed"] == 3 and first["budget_exhausted"]
+
+    # Straight after, the same window's budget is gone: nothing runs
+    warmer.cache.clear()
+    second = warmer.warm("data", budget=10.0)
+    assert second["warmed"] == 0 and second["budget_exhausted"]
+
+    clock[0] += prewarm.PREWARM_BUDGET_WINDOW_SECONDS
+    assert warmer.warm("data", budget=10.0)["warmed"] == 3
+
+
+def test_popular_targets_are_reread_only_after_their_interval(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(prewarm.time, "monotonic", lambda: clock[0])
+    reads = []
+
+    def popular(endpoint, limit):
+        reads.append(endpoint)
+        return [f"{endpoint}-{len(reads)}"]
+
+    warmer = Prewarmer()
+    monkeypatch.setattr(warmer, "_popular", popular)
+    monkeypatch.setattr(warmer, "_compute", lambda endpoint, target, first, last: ["rows"])
+
+    warmer.warm("data")
+    warmer.warm("data")
+    assert reads == [LOCATION_SUMMARY, TRAFFIC_SUMMARY]
+
+    clock[0] += prewarm.PREWARM_TARGETS_SECONDS
+    warmer.warm("data")
+    assert len(reads) == 4
+
+
+def test_parse_hours():
+    assert prewarm._parse_hours("6-20") == set(range(6, 21))
+    assert prewarm._parse_hours("7") == {7}
+    assert prewarm._parse_hours("22-6") == {22, 23, 0, 1, 2, 3, 4, 5, 6}
+    for spec in ("6-24", "-1", "a-b", ""):
+        with pytest.raises(ValueError):
+            prewarm._parse_hours(spec)
@@ -0,0 +1,14 @@
+from ratelimit import TokenBucketTable
+
+
+def test_new_key_on_a_taken_slot_keeps_its_tokens():
+    table = TokenBucketTable(rate=0.01, burst=3, size=1)   # every key shares the one slot
+    assert [table.acquire("10.0.0.1")[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = table.acquire("10.0.0.2")
+    assert not allowed and retry_after > 0
+    assert not table.acquire("10.0.0.1")[0]
+
+
+def test_unused_slot_starts_full():
+    table = TokenBucketTable(rate=0.01, burst=2)
+    assert [table.acquire("user")[0] for _ in range(3)] == [True, True, False]
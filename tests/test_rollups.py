@@ -0,0 +1,21 @@
+from datetime import date, datetime
+
+from rollups import comparison_window, day_window
+
+
+def test_previous_window_of_a_full_day_is_the_day_before():
+    for to_time in ("2024-05-02 23:00:00", "2024-05-02 23:59:59"):
+        previous = comparison_window("2024-05-02 00:00:00", to_time)
+        assert previous[0] == datetime(2024, 5, 1)
+        assert previous[1] == datetime(2024, 5, 1, *datetime.fromisoformat(to_time).timetuple()[3:6])
+        assert day_window(*previous) == (date(2024, 5, 1), date(2024, 5, 1))
+
+
+def test_previous_window_of_a_week_covers_the_same_hourly_slots():
+    previous = comparison_window("2024-05-08 00:00:00", "2024-05-14 23:00:00")
+    assert previous == (datetime(2024, 5, 1), datetime(2024, 5, 7, 23))
+
+
+def test_previous_window_of_a_single_hour():
+    assert comparison_window("2024-05-02 10:00:00", "2024-05-02 10:00:00") == \
+        (datetime(2024, 5, 2, 9), datetime(2024, 5, 2, 9))
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+import session_sweeper
+from session_sweeper import ACCESS_TOKEN_EXPIRE_MINUTES, sweep_sessions
+
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+
+class _SessionsCursor:
+    """Just enough of the sweeper's statements over in-memory sessions and summaries."""
+
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        sessions, summaries = self.db["sessions"], self.db["summaries"]
+        if "GET_LOCK" in sql or "RELEASE_LOCK" in sql:
+            self.rows = [(1,)]
+        elif sql.startswith("SELECT session_id FROM sessions WHERE status = 'ACTIVE'"):
+            minutes, limit = params
+            due = sorted((s for s in sessions.values() if s["status"] == "ACTIVE"
+                          and s["login_time"] < NOW - timedelta(minutes=minutes)), key=lambda s: s["login_time"])
+            self.rows = [(s["session_id"],) for s in due[:limit]]
+        elif sql.startswith("UPDATE sessions"):
+            minutes, *ids = params
+            self.rowcount = 0
+            for session_id in ids:
+                s = sessions[session_id]
+                if s["status"] == "ACTIVE":
+                    s.update(status="EXPIRED", logout_time=s["login_time"] + timedelta(minutes=minutes))
+                    self.rowcount += 1
+        elif sql.startswith("INSERT INTO session_activity_summary"):
+            for session_id in params:
+                s = sessions[session_id]
+                summaries[session_id] = {"end_status": s["status"], "logout_time": s["logout_time"]}
+                self.db["summarised"].append(session_id)
+        elif "FROM session_activity_summary" in sql:
+            done = sorted(((v["logout_time"], k) for k, v in summaries.items() if v["end_status"] == "LOGGED_OUT"),
+                          reverse=True)
+            self.rows = done[:1]
+        elif "status = 'LOGGED_OUT'" in sql:
+            if len(params) == 5:
+                logout, _, session_id, settle, limit = params
+                after = lambda s: (s["logout_time"], s["session_id"]) > (logout, session_id)
+            else:
+                settle, limit = params
+                after = lambda s: True
+            due = sorted((s for s in sessions.values() if s["status"] == "LOGGED_OUT" and after(s)
+                          and s["logout_time"] < NOW - timedelta(seconds=settle)),
+                         key=lambda s: (s["logout_time"], s["session_id"]))
+            self.rows = [(s["session_id"],) for s in due[:limit]]
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class _SessionsConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return _SessionsCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _session(session_id, status, login_time, logout_time=None):
+    return {"session_id": session_id, "status": status, "login_time": login_time, "logout_time": logout_time}
+
+
+def test_logged_out_sessions_sharing_a_logout_time_are_each_summarised_once(monkeypatch):
+    logout = NOW - timedelta(minutes=5)
+    sessions = [_session(f"s{i:02d}", "LOGGED_OUT", logout - timedelta(hours=1), logout) for i in range(7)]
+    sessions.append(_session("recent", "LOGGED_OUT", NOW - timedelta(hours=1), NOW - timedelta(seconds=10)))
+    db = {"sessions": {s["session_id"]: s for s in sessions}, "summaries": {}, "summarised": []}
+    monkeypatch.setattr(session_sweeper, "get_db_connection", lambda: _SessionsConnection(db))
+
+    # Two batches of three per run: the first run stops partway through the tie
+    assert sweep_sessions(batch_size=3, max_batches=2) == {"expired": 0, "logged_out": 6}
+    assert sweep_sessions(batch_size=3, max_batches=2) == {"expired": 0, "logged_out": 1}
+    assert sweep_sessions(batch_size=3, max_batches=2) == {"expired": 0, "logged_out": 0}
+    assert db["summarised"] == [f"s{i:02d}" for i in range(7)]
+
+    # Past the settle time, the recent logout is picked up after the others
+    monkeypatch.setattr(session_sweeper, "LOGOUT_SETTLE_SECONDS", 0)
+    assert sweep_sessions(batch_size=3)["logged_out"] == 1
+    assert db["summarised"][-1] == "recent"
+
+
+def test_stale_active_sessions_expire_when_their_token_did(monkeypatch):
+    stale = NOW - timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES + 1)
+    sessions = [_session("stale", "ACTIVE", stale), _session("live", "ACTIVE", NOW - timedelta(minutes=1))]
+    db = {"sessions": {s["session_id"]: s for s in sessions}, "summaries": {}, "summarised": []}
+    monkeypatch.setattr(session_sweeper, "get_db_connection", lambda: _SessionsConnection(db))
+
+    assert sweep_sessions()["expired"] == 1
+    assert db["sessions"]["stale"]["status"] == "EXPIRED"
+    assert db["sessions"]["stale"]["logout_time"] == stale + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    assert db["sessions"]["live"]["status"] == "ACTIVE"
+    assert db["summaries"]["stale"]["end_status"] == "EXPIRED"
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import streaming
+from streaming import TrafficWatermarkPoller, POLL_BATCH_SIZE
+
+
+def _fake_inserted_since(table):
+    """get_traffic_inserted_since over an in-memory table, with the SQL's ordering and keyset."""
+    def inserted_since(since, limit=5000, after=None):
+        rows = sorted(table, key=lambda r: (r["insert_time"], r["wan_ip"], r["time_hour"]))
+        rows = [r for r in rows if r["insert_time"] >= since]
+        if after is not None:
+            rows = [r for r in rows if r["insert_time"] > since or (r["wan_ip"], r["time_hour"]) > after]
+        return rows[:limit]
+    return inserted_since
+
+
+def test_poll_delivers_more_than_a_batch_sharing_one_insert_time(monkeypatch):
+    landed = datetime(2024, 5, 1, 12, 0, 0)
+    start = datetime(2024, 4, 1)
+    rows = [{"wan_ip": f"10.0.{i % 7}.1", "time_hour": start + timedelta(hours=i), "in_avg": 1.0,
+             "out_avg": 1.0, "in_max": 1.0, "out_max": 1.0, "insert_time": landed}
+            for i in range(2 * POLL_BATCH_SIZE + 123)]
+    monkeypatch.setattr(streaming, "get_traffic_inserted_since", _fake_inserted_since(rows))
+
+    poller = TrafficWatermarkPoller()
+    poller._watermark = landed
+    delivered = []
+    monkeypatch.setattr(poller, "publish", delivered.append)
+
+    asyncio.run(poller.poll_once())
+    assert len(delivered) == len(rows)
+    assert len({(r["wan_ip"], r["time_hour"]) for r in delivered}) == len(rows)
+
+    # Nothing new: the next poll delivers nothing again
+    asyncio.run(poller.poll_once())
+    assert len(delivered) == len(rows)
+
+    later = dict(rows[0], insert_time=landed + timedelta(seconds=5), time_hour=start - timedelta(hours=1))
+    rows.append(later)
+    asyncio.run(poller.poll_once())
+    assert delivered[-1] is later and len(delivered) == len(rows)
+
+
+def test_first_poll_skips_rows_already_in_the_table(monkeypatch):
+    landed = datetime(2024, 5, 1, 12, 0, 0)
+    rows = [{"wan_ip": f"10.0.{i}.1", "time_hour": datetime(2024, 5, 1, 11), "in_avg": 1.0,
+             "out_avg": 1.0, "in_max": 1.0, "out_max": 1.0, "insert_time": landed}
+            for i in range(3)]
+
+    def stream_position():
+        last = max(rows, key=lambda r: (r["insert_time"], r["wan_ip"], r["time_hour"]))
+        return last["insert_time"], last["wan_ip"], last["time_hour"]
+
+    monkeypatch.setattr(streaming, "get_traffic_inserted_since", _fake_inserted_since(rows))
+    monkeypatch.setattr(streaming, "get_traffic_stream_position", stream_position)
+
+    poller = TrafficWatermarkPoller()
+    delivered = []
+    monkeypatch.setattr(poller, "publish", delivered.append)
+
+    asyncio.run(poller.poll_once())
+    asyncio.run(poller.poll_once())
+    assert delivered == []
+
+    # Same second as the existing rows, but landed after the stream started
+    late = dict(rows[0], wan_ip="10.0.9.1")
+    rows.append(late)
+    asyncio.run(poller.poll_once())
+    assert delivered == [late]
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+from traffic_binary import encode_rows, encode_tuples
+from traffic_decoder import decode, decode_rows
+
+
+def _payload(buffers, length):
+    data = b"".join(bytes(buffer) for buffer in buffers)
+    assert len(data) == length
+    return data
+
+
+def test_rows_round_trip_with_nulls_and_unordered_ips():
+    start = datetime(2024, 5, 1, 23)
+    rows = [
+        {"wan_ip": ip, "time_hour": start + timedelta(hours=h), "in_avg": 1.5 * h, "out_avg": None,
+         "in_max": float(h), "out_max": 1e9 + h}
+        for h, ip in enumerate(["10.0.0.9", "10.0.0.1", "10.0.0.9", "fe80::1"])
+    ]
+
+    decoded = decode_rows(_payload(*encode_rows(rows)))
+
+    assert decoded == rows
+
+
+def test_tuples_round_trip_including_times_before_the_first_row():
+    start = datetime(2024, 5, 1)
+    rows = [("10.0.0.1", start, Decimal("2.5"), 1.0, 3.0, 4.0),
+            ("10.0.0.2", start - timedelta(days=3), 5.0, None, 6.0, 7.0)]
+
+    columns = decode(_payload(*encode_tuples(rows)))
+
+    assert columns["wan_ip"] == ["10.0.0.1", "10.0.0.2"]
+    assert columns["time_hour"] == [start, start - timedelta(days=3)]
+    assert columns["in_avg"] == [2.5, 5.0]
+    assert columns["out_avg"] == [1.0, None]
+
+
+def test_empty_payload_and_out_of_range_times():
+    assert decode_rows(_payload(*encode_tuples([]))) == []
+
+    start = datetime(2000, 1, 1)
+    with pytest.raises(ValueError):
+        encode_tuples([("10.0.0.1", start, 1.0, 1.0, 1.0, 1.0),
+                       ("10.0.0.1", start + timedelta(days=365 * 70), 1.0, 1.0, 1.0, 1.0)])
+
+
+def test_corrupt_payload_is_rejected():
+    data = bytearray(_payload(*encode_tuples([("10.0.0.1", datetime(2024, 5, 1), 1.0, 1.0, 1.0, 1.0)])))
+    data[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        decode(bytes(data))
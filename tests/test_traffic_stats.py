@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import traffic_stats
+from traffic_stats import traffic_percentiles
+
+
+class _InlinePool:
+    def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+def test_percentiles_count_the_first_hour_of_the_range(monkeypatch):
+    first = datetime(2024, 5, 1)
+    last = first + timedelta(hours=3)
+    table = [("10.0.0.1", first + timedelta(hours=h), 10.0 * (h + 1), 1.0, 1.0, 1.0) for h in range(4)]
+
+    def get_traffic_series(wan_ips, after_time, columns, until_time=None, inclusive=False):
+        starts = (lambda t: t >= after_time) if inclusive else (lambda t: t > after_time)
+        return [row for row in table if row[0] in wan_ips and starts(row[1]) and row[1] <= until_time]
+
+    monkeypatch.setattr(traffic_stats, "get_traffic_series", get_traffic_series)
+    monkeypatch.setattr(traffic_stats, "analytics_pool", _InlinePool())
+
+    (result,) = traffic_percentiles(["10.0.0.1"], first, last, quantiles=(0, 50))
+    assert result["data_points"] == 4
+    assert result["in_avg_p0"] == 10.0
+    assert result["in_avg_p50"] == np.percentile([10, 20, 30, 40], 50)
+
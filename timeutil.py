@@ -0,0 +1,23 @@
+"""
+Whole hours since 1970-01-01 00:00:00 (naive local time, like time_hour), the
+integer form of an hourly slot used by the hot cache and the gap index.
+"""
+
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+HOUR = timedelta(hours=1)
+
+
+def epoch_hour(value: datetime) -> int:
+    """The hour ``value`` falls in."""
+    return (value - EPOCH) // HOUR
+
+
+def first_hour_from(value: datetime) -> int:
+    """First whole hour at or after ``value``."""
+    return -((EPOCH - value) // HOUR)
+
+
+def from_epoch_hour(hour) -> datetime:
+    return EPOCH + int(hour) * HOUR
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Reference decoder for the binary traffic series format, which /traffic/summary
+and /traffic/summary/batch return for ``Accept: application/vnd.traffic-series.v1``.
+It needs only the standard library, so it can be copied into clients as is.
+
+Layout, all little-endian, columns packed back to back:
+
+    header   4s magic b"TRFS", u16 version, u16 ip count, u32 row count,
+             i64 base time: seconds since 1970-01-01 00:00:00 of the first row's time_hour
+    ips      per distinct WAN IP: u16 byte length, then its UTF-8 text
+    columns  u16[rows]  index into the ips above
+             i32[rows]  seconds after the base time
+             f64[rows]  in_avg, then out_avg, in_max and out_max; NaN stands for null
+
+    python traffic_decoder.py response.bin
+"""
+
+import math
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+MEDIA_TYPE = "application/vnd.traffic-series.v1"
+MAGIC = b"TRFS"
+VERSION = 1
+METRICS = ("in_avg", "out_avg", "in_max", "out_max")
+HEADER = struct.Struct("<4sHHIq")
+IP_LENGTH = struct.Struct("<H")
+EPOCH = datetime(1970, 1, 1)
+
+
+def _column(data: bytes, offset: int, typecode: str, count: int):
+    values = array(typecode)
+    end = offset + values.itemsize * count
+    values.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
+
+
+def decode(data: bytes) -> Dict[str, list]:
+    """Columns of a response: "wan_ip", "time_hour" and one list per metric."""
+    magic, version, n_ips, n_rows, base = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} traffic series payload")
+
+    offset = HEADER.size
+    ips = []
+    for _ in range(n_ips):
+        (length,) = IP_LENGTH.unpack_from(data, offset)
+        offset += IP_LENGTH.size
+        ips.append(data[offset:offset + length].decode())
+        offset += length
+
+    codes, offset = _column(data, offset, "H", n_rows)
+    seconds, offset = _column(data, offset, "i", n_rows)
+    start = EPOCH + timedelta(seconds=base)
+    columns = {
+        "wan_ip": [ips[code] for code in codes],
+        "time_hour": [start + timedelta(seconds=s) for s in seconds]
+    }
+    for metric in METRICS:
+        values, offset = _column(data, offset, "d", n_rows)
+        columns[metric] = [None if math.isnan(v) else v for v in values]
+    return columns
+
+
+def decode_rows(data: bytes) -> List[dict]:
+    """The payload as the row dicts the JSON response carries."""
+    columns = decode(data)
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "rb") as f:
+        for row in decode_rows(f.read()):
+            print(row)
@@ -0,0 +1,37 @@
+-- ===================================================================
+-- Tables: traffic_gap_links, traffic_gaps
+-- Purpose: Incremental index of missing and duplicate hours in
+--          traffic_hourly_copy, maintained by `python gaps.py` (cron or
+--          after each ingestion batch) and read by /traffic/gaps.
+-- ===================================================================
+
+-- One row per WAN IP: the indexed span and the newest insert_time scanned
+CREATE TABLE IF NOT EXISTS `traffic_gap_links` (
+  `wan_ip` varchar(50) NOT NULL,
+  `first_hour` datetime NOT NULL COMMENT 'Oldest time_hour of the link',
+  `last_hour` datetime NOT NULL COMMENT 'Newest time_hour of the link',
+  `last_insert_time` datetime DEFAULT NULL COMMENT 'Newest source insert_time folded into the index',
+  `updated_at` timestamp DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`wan_ip`),
+  KEY `idx_last_insert_time` (`last_insert_time`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
+-- Missing ranges between first_hour and last_hour, and hours holding more than one row
+CREATE TABLE IF NOT EXISTS `traffic_gaps` (
+  `wan_ip` varchar(50) NOT NULL,
+  `kind` varchar(10) NOT NULL COMMENT 'missing or duplicate',
+  `gap_start` datetime NOT NULL COMMENT 'First missing hour, or the duplicated hour',
+  `gap_end` datetime NOT NULL COMMENT 'Last missing hour, or the duplicated hour',
+  `hours` int(11) NOT NULL COMMENT 'Missing hours, or extra rows of a duplicated hour',
+  PRIMARY KEY (`wan_ip`, `gap_start`, `kind`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
+-- ===================================================================
+-- Index Strategy:
+-- - traffic_gap_links PRIMARY (wan_ip): per-link span lookups and upserts
+-- - traffic_gap_links idx_last_insert_time: MAX(last_insert_time) is the refresh watermark
+-- - traffic_gaps PRIMARY (wan_ip, gap_start, kind): a link's gaps in a window, and
+--   the range delete that precedes rescanning a link from a given hour
+-- The refresh finds touched links with traffic_hourly_copy.idx_insert_time
+-- (see traffic_rollups.sql).
+-- ===================================================================
@@ -0,0 +1,36 @@
+-- ===================================================================
+-- Table: traffic_daily_rollup
+-- Purpose: Per WAN IP, per day aggregates of traffic_hourly_copy so that
+--          multi-day analytics (comparisons, rankings, forecasts) do not
+--          re-scan every hourly row. Maintained incrementally by
+--          `python rollups.py` using traffic_hourly_copy.insert_time.
+-- ===================================================================
+
+CREATE TABLE IF NOT EXISTS `traffic_daily_rollup` (
+  `wan_ip` varchar(50) NOT NULL,
+  `day` date NOT NULL,
+  `data_points` int(11) NOT NULL COMMENT 'Hourly rows in the day',
+  `in_avg_sum` double DEFAULT NULL COMMENT 'SUM(in_avg), AVG = in_avg_sum / in_avg_count',
+  `in_avg_count` int(11) NOT NULL DEFAULT 0,
+  `out_avg_sum` double DEFAULT NULL,
+  `out_avg_count` int(11) NOT NULL DEFAULT 0,
+  `in_max` double DEFAULT NULL,
+  `out_max` double DEFAULT NULL,
+  `first_reading` datetime DEFAULT NULL,
+  `last_reading` datetime DEFAULT NULL,
+  `last_insert_time` datetime DEFAULT NULL COMMENT 'Newest source insert_time folded into this row',
+  PRIMARY KEY (`wan_ip`, `day`),
+  KEY `idx_day` (`day`),
+  KEY `idx_last_insert_time` (`last_insert_time`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+
+-- The incremental refresh and the live traffic stream both filter on insert_time.
+-- Skip this statement if the index already exists.
+ALTER TABLE `traffic_hourly_copy` ADD KEY `idx_insert_time` (`insert_time`);
+
+-- ===================================================================
+-- Index Strategy for traffic_daily_rollup:
+-- - PRIMARY (wan_ip, day): range scan of one link's days, upsert target
+-- - idx_day: all links for a day window (network-wide rankings)
+-- - idx_last_insert_time: MAX(last_insert_time) is the refresh watermark
+-- ===================================================================
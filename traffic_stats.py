@@ -0,0 +1,77 @@
+"""
+Per-link traffic percentiles (e.g. the 95th percentile used for burstable
+billing), computed for all links of a request in one vectorized pass in the
+analytics process pool.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+from analytics_pool import analytics_pool
+from database import get_traffic_series
+
+PERCENTILE_METRICS = ("in_avg", "out_avg", "in_max", "out_max")
+DEFAULT_PERCENTILES = (50, 95, 99)
+
+
+def grouped_percentiles(group: np.ndarray, values: np.ndarray, n_groups: int, quantiles) -> np.ndarray:
+    """Linear-interpolated percentiles of ``values`` per ``group`` (n_groups x len(quantiles)).
+
+    Matches np.percentile's default method; groups without values give NaN.
+    """
+    valid = ~np.isnan(values)
+    group, values = group[valid], values[valid]
+    order = np.lexsort((values, group))
+    ordered = values[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+
+    out = np.full((n_groups, len(quantiles)), np.nan)
+    has = counts > 0
+    for j, q in enumerate(quantiles):
+        pos = starts[has] + (q / 100.0) * (counts[has] - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        out[has, j] = ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+    return out
+
+
+def link_percentiles(columns, n_links: int, quantiles) -> np.ndarray:
+    """Analytics pool job: (links x metrics x quantiles) percentiles."""
+    link, values = columns["link"], columns["values"]
+    return np.stack([
+        grouped_percentiles(link, values[:, m], n_links, quantiles)
+        for m in range(values.shape[1])
+    ], axis=1)
+
+
+def traffic_percentiles(wan_ips: List[str], from_time, to_time, quantiles=DEFAULT_PERCENTILES) -> Optional[List[dict]]:
+    rows = get_traffic_series(wan_ips, from_time, PERCENTILE_METRICS, until_time=to_time, inclusive=True)
+    if rows is None:
+        return None
+
+    index = {ip: i for i, ip in enumerate(wan_ips)}
+    if rows:
+        ips, _, *metric_columns = zip(*rows)
+        link = np.array([index[ip] for ip in ips], dtype=np.int64)
+        values = np.array(metric_columns, dtype=np.float64).T
+        result = analytics_pool.run(link_percentiles, {"link": link, "values": values},
+                                    n_links=len(wan_ips), quantiles=tuple(quantiles))
+        samples = np.bincount(link, minlength=len(wan_ips))
+    else:
+        result = np.full((len(wan_ips), len(PERCENTILE_METRICS), len(quantiles)), np.nan)
+        samples = np.zeros(len(wan_ips), dtype=np.int64)
+
+    return [
+        {
+            "wan_ip": ip,
+            "data_points": int(samples[i]),
+            **{
+                f"{metric}_p{q:g}": (None if np.isnan(result[i, m, j]) else round(float(result[i, m, j]), 2))
+                for m, metric in enumerate(PERCENTILE_METRICS)
+                for j, q in enumerate(quantiles)
+            }
+        }
+        for ip, i in index.items()
+    ]